@@ -1,8 +1,21 @@
 ### File for Gradio App ###
-from core.pipeline import NeuraLumaWhisperPipeline
+from core.devices import configure_devices
+import os
+# JAX reads the device configuration on import, so the number of devices is taken from the environment before anything imports jax
+configure_devices(int(os.environ["NEURALUMA_DEVICES"]) if os.environ.get("NEURALUMA_DEVICES") else None)
+from core.pipeline import NeuraLumaWhisperPipeline, TRANSLATE_BOTH
+from core.registry import model_registry
+from core.model import WhisperModel, DEFAULT_COMPILATION_CACHE_DIR
+from core.converter import AUDIO_FILE_EXTENSIONS, VIDEO_FILE_EXTENSIONS
+from core.cache import TranscriptionCache
+from core.vad import VoiceActivityDetector
+from core.workspace import JobWorkspace
+from core.jobs import JobScheduler, InferenceWorker
 import gradio as gr
 import jax.numpy as jnp
 import functools
+import threading
+import time
 
 ## Functions ##
 def sanitize_args_decorator(function_to_decorate):
@@ -29,6 +42,7 @@ def handle_submit(
         load_dataset_split,
         load_dataset_revision,
         load_dataset_column,
+        load_dataset_streaming,
         output_directory,
         save_dataset,
         save_dataset_revision,
@@ -37,14 +51,31 @@ def handle_submit(
         save_dataset_column_audio,
         save_dataset_column_text,
         save_dataset_column_text_sbv,
+        save_dataset_local,
         dtype_options, 
         checkpoint,
+        draft_checkpoint,
+        num_draft_tokens,
         batch_size,
+        model_cache_memory,
+        decode_in_memory,
+        max_workers,
+        download_workers,
+        queue_size,
+        length_bucketing,
+        vad,
+        cache_dir,
+        scratch_dir,
+        use_tmpfs,
         translate,
+        transcribe_and_translate,
         add_timestamps,
-        hf_token,
-        progress = gr.Progress()
+        resume,
+        hf_token
 ):          
+    if transcribe_and_translate:
+        translate = TRANSLATE_BOTH
+
     source_path = None
     if input_file:
         source_path = input_file.name
@@ -64,11 +95,12 @@ def handle_submit(
             "audio_column": load_dataset_column, 
             "revision": load_dataset_revision,
             "subset": load_dataset_subset,
-            "split": load_dataset_split
+            "split": load_dataset_split,
+            "streaming": load_dataset_streaming
             }
     
     hf_save_dataset_options = None
-    if save_dataset:
+    if save_dataset or save_dataset_local:
         hf_save_dataset_options = {
             "target": save_dataset, 
             "private": save_dataset_private,
@@ -77,7 +109,8 @@ def handle_submit(
             "text_sbv_column": save_dataset_column_text_sbv,
             "revision": save_dataset_revision,
             #"subset": hf_save_dataset_subset,
-            "split": save_dataset_split
+            "split": save_dataset_split,
+            "local_path": save_dataset_local
             }
     
     youtube = input_youtube
@@ -85,42 +118,122 @@ def handle_submit(
     if not youtube and not source_path and not load_dataset:
         raise gr.Error("Please specify either YouTube Urls and/or a Dataset and/or a File or a directory")
     
-    if not output_path and not save_dataset:
+    if not output_path and not save_dataset and not save_dataset_local:
         raise gr.Error("Please specify either an Output Directory or a Dataset")
     
     if youtube is None:
         youtube = ""
-    
-    def progress_cb(msg, progress_amount=0):
-        progress(progress_amount, desc=f"{msg}")
-
-    whisper_pipeline = NeuraLumaWhisperPipeline(
-        dtype=getattr(jnp, dtype), 
-        batch_size=batch_size, 
-        hf_checkpoint=hf_checkpoint, 
-        hf_load_dataset_options=hf_load_dataset_options,
-        hf_token=hf_token,
-        progress_cb=progress_cb
-        )
 
     youtube_urls = youtube.split("\n")
+    
+    # The job runs in the background, the submit returns right away with the job id
+    def run_job(job):
+        # Models stay loaded between submits, only the memory budget is updated here
+        model_registry.set_max_memory_bytes(int(model_cache_memory * 1024**3) if model_cache_memory else None)
 
-    progress(0, desc="Starting...")
+        transcription_cache = get_transcription_cache(cache_dir) if cache_dir else None
+        # The cache is shared with other jobs, so its statistics are reported relative to the start of this job
+        cache_stats_before = dict(transcription_cache.stats) if transcription_cache is not None else None
 
-    whisper_pipeline.transcribe(source_path=source_path, 
-                                output_path=output_path, 
-                                hf_save_dataset_options=hf_save_dataset_options, 
-                                youtube_urls=youtube_urls, 
-                                add_timestamps=add_timestamps, 
-                                translate=translate)
-    
-    return "Complete!"
+        job.update("Loading model", 0.0)
+        start_time = time.perf_counter()
+        whisper_model = model_registry.get(checkpoint=hf_checkpoint, dtype=getattr(jnp, dtype), batch_size=int(batch_size), draft_checkpoint=draft_checkpoint or None, num_draft_tokens=int(num_draft_tokens))
+        model_load_s = time.perf_counter() - start_time
+
+        # Models from the registry are already compiled for the variants of earlier submits, only new variants are compiled
+        job.update("Compiling model", 0.0)
+        warmup_stats = inference_worker.run(
+            lambda: whisper_model.warmup(tasks=(NeuraLumaWhisperPipeline.get_task(translate),), add_timestamps_variants=(add_timestamps,)),
+            cancel_event=job.cancel_event
+            )
+        startup_status = f"{warmup_stats['start'].capitalize()} start: model loaded in {model_load_s:.1f} s, compiled in {warmup_stats['compile_s']:.1f} s"
+
+        # Every job gets its own workspace, so concurrent jobs don't touch each other's files
+        workspace = JobWorkspace(base_dir=scratch_dir or None, use_tmpfs=use_tmpfs, job_id=job.job_id)
+
+        whisper_pipeline = NeuraLumaWhisperPipeline(
+            dtype=getattr(jnp, dtype), 
+            batch_size=int(batch_size), 
+            hf_checkpoint=hf_checkpoint, 
+            whisper_model=whisper_model,
+            hf_load_dataset_options=hf_load_dataset_options,
+            hf_token=hf_token,
+            progress_cb=job.update,
+            decode_in_memory=decode_in_memory,
+            max_workers=int(max_workers) if max_workers else None,
+            download_workers=int(download_workers),
+            queue_size=int(queue_size),
+            length_bucketing=length_bucketing,
+            transcription_cache=transcription_cache,
+            vad=VoiceActivityDetector() if vad else None,
+            workspace=workspace,
+            inference_worker=inference_worker,
+            cancel_event=job.cancel_event
+            )
+
+        job.update("Starting...", 0.0)
+
+        # transcribe removes the workspace of the job also if the job fails or is cancelled
+        whisper_pipeline.transcribe(source_path=source_path, 
+                                    output_path=output_path, 
+                                    hf_save_dataset_options=hf_save_dataset_options, 
+                                    youtube_urls=youtube_urls, 
+                                    add_timestamps=add_timestamps, 
+                                    translate=translate,
+                                    resume=resume)
+        
+        run_summary = whisper_pipeline.progress_tracker.get_summary()
+        run_status = f"transcribed {run_summary['audio_s']:.0f} s of audio in {run_summary['wall_s']:.0f} s"
+        if run_summary["real_time_factor"] is not None:
+            run_status += f", real-time factor {run_summary['real_time_factor']:.3f}"
+        # The draft model is shared by all jobs of the loaded model, so the rate covers all of them
+        acceptance_rate = whisper_model.get_acceptance_rate()
+        if acceptance_rate is not None:
+            run_status += f", {acceptance_rate:.1%} of the draft tokens accepted"
+
+        if transcription_cache is not None:
+            return f"Complete! {startup_status}, {run_status}. {transcription_cache.format_stats(since=cache_stats_before)}"
+        
+        return f"Complete! {startup_status}, {run_status}"
+
+    description = ", ".join(str(source) for source in (source_path, load_dataset, *[url for url in youtube_urls if url.strip()]) if source)
+    job_id = job_scheduler.submit(run_job, description=description)
+
+    return f"Submitted job {job_id}, follow its progress in the Jobs tab"
+
+def get_transcription_cache(cache_dir):
+    """
+    Returns the transcription cache of a directory, shared by all jobs so its size and eviction stay consistent.
+    """
+    with transcription_caches_lock:
+        cache_dir = os.path.abspath(cache_dir)
+        if cache_dir not in transcription_caches:
+            transcription_caches[cache_dir] = TranscriptionCache(cache_dir=cache_dir)
+        return transcription_caches[cache_dir]
+
+def list_jobs():
+    return [job.to_row() for job in job_scheduler.list_jobs()] or [["", "", "", "", "", ""]]
+
+def cancel_job(job_id):
+    if not job_id or not job_scheduler.cancel(job_id.strip()):
+        raise gr.Error(f"No queued or running job with id {job_id}")
+    return list_jobs()
+
+# Compiled models are stored on disk, so restarts of the WebUI don't compile the model again
+WhisperModel.enable_compilation_cache(os.environ.get("NEURALUMA_COMPILATION_CACHE_DIR") or DEFAULT_COMPILATION_CACHE_DIR)
+
+# Jobs run in the background, all of them share one inference worker that batches their model calls
+job_scheduler = JobScheduler(max_concurrent_jobs=int(os.environ.get("NEURALUMA_MAX_CONCURRENT_JOBS", 2)))
+inference_worker = InferenceWorker()
+# One transcription cache per directory for all jobs, each cache serializes its own reads and writes
+transcription_caches = {}
+transcription_caches_lock = threading.Lock()
 
 ## UI ##
 with gr.Blocks() as iface:
     # Options for the checkboxes
     supported_dtypes =['float16', 'bfloat16', 'float32', 'float64']
-    supported_input_filetypes = ['.mp3', '.mp4']
+    supported_input_filetypes = ['.' + extension for extension in (*AUDIO_FILE_EXTENSIONS, *VIDEO_FILE_EXTENSIONS)]
 
     gr.Markdown("# NeuraLumaWhisper")
 
@@ -154,6 +267,9 @@ with gr.Blocks() as iface:
                         load_dataset_split = gr.Textbox(label="Dataset split", placeholder="train", interactive=True)
                         load_dataset_revision = gr.Textbox(label="Dataset revision / branch", interactive=True, value="main", placeholder="main")
                         load_dataset_column = gr.Textbox(label="Dataset column name for audio", interactive=True, value="audio", placeholder="audio")
+                        load_dataset_streaming = gr.Checkbox(label="Stream dataset", 
+                                                             info="Rows are loaded lazily while transcribing instead of loading the whole dataset first", 
+                                                             interactive=True, value=False)
                 
                 with gr.Column():
                     gr.Markdown("""## Output Options
@@ -177,6 +293,7 @@ with gr.Blocks() as iface:
                         save_dataset_column_text_sbv = gr.Textbox(label="Dataset column name for timestamped transcription",
                                                                   info="Add Additional Timestamps must be active", 
                                                                   interactive=True, value="sbv", placeholder="sbv")
+                        save_dataset_local = gr.Textbox(label="Local dataset directory", info="Shards are written here while transcribing and pushed afterwards, the Dataset path is optional", interactive=True, placeholder="/path/to/dataset")
                 
             with gr.Row():
                 submit_button = gr.Button("Transcribe", variant="primary")
@@ -191,10 +308,17 @@ with gr.Blocks() as iface:
                     label="Translate", 
                     info="Translates the audio to english regardless of source language", 
                     value=False)
+                transcribe_and_translate = gr.Checkbox(
+                    label="Transcribe and Translate", 
+                    info="Writes the transcription and the english translation in one pass, the audio is encoded only once", 
+                    value=False)
                 add_timestamps = gr.Checkbox(label="Add Additional Timestamps", 
                                              info="""Uses sbv formatting for additional timestamps. 
                                              A seperate file / column for Huggingface Datasets will be created""", 
                                              value=False)
+                resume = gr.Checkbox(label="Resume", 
+                                     info="Resumes an interrupted job, items already recorded in the manifest of the output directory are skipped", 
+                                     value=False)
 
 
     with gr.Tab(label="Advanced Model Options"):
@@ -209,9 +333,66 @@ with gr.Blocks() as iface:
                                     info="Path to the model checkpoint, must be compatible with the JAX implementation",
                                     interactive=True)
         
+        with gr.Row():
+            draft_checkpoint = gr.Textbox(label="Draft Model Checkpoint", 
+                                          info="Enables speculative decoding with this small checkpoint as draft model, e.g. openai/whisper-tiny. The output is identical to plain greedy decoding. Only available on a single device. Leave blank to disable", 
+                                          placeholder="openai/whisper-tiny", 
+                                          interactive=True)
+            num_draft_tokens = gr.Number(label="Draft tokens", 
+                                         info="Number of tokens the draft model proposes per step", 
+                                         value=4, minimum=1, interactive=True)
+        
         with gr.Row():
             batch_size = gr.Number(label="Batch size", value=1, minimum=1, interactive=True)
+            model_cache_memory = gr.Number(label="Model cache memory budget (GB)", 
+                                           info="Loaded models are kept warm between submits, least recently used models are evicted above this budget. Leave at 0 for no limit", 
+                                           value=0, minimum=0, interactive=True)
+        
+        with gr.Row():
+            decode_in_memory = gr.Checkbox(label="Decode in memory", 
+                                           info="Decodes audio and video directly to 16 kHz audio in memory instead of converting videos to mp3 files first", 
+                                           value=False)
+            length_bucketing = gr.Checkbox(label="Length bucketing", 
+                                           info="Probes the duration of all inputs first and batches inputs of similar length together, longest first", 
+                                           value=False)
+            vad = gr.Checkbox(label="Voice activity detection", 
+                              info="Detects speech regions before inference, so only speech is transcribed and silence is skipped", 
+                              value=False)
+            max_workers = gr.Number(label="Conversion workers", 
+                                    info="Number of worker threads decoding media files in parallel, each runs its own ffmpeg process. Set to 0 to use all CPUs", 
+                                    value=1, minimum=0, interactive=True)
+            download_workers = gr.Number(label="Download workers", 
+                                         info="Maximum number of concurrent YouTube downloads", 
+                                         value=4, minimum=1, interactive=True)
         
+        with gr.Row():
+            cache_dir = gr.Textbox(label="Transcription cache directory", 
+                                   info="Previously transcribed audio with the same settings is not transcribed again. Leave blank to disable the cache", 
+                                   placeholder="/path/to/cache", 
+                                   interactive=True)
+            queue_size = gr.Number(label="Stage queue size", 
+                                   info="Maximum number of prepared files waiting between the download, decode and inference stages, caps memory usage", 
+                                   value=4, minimum=1, interactive=True)
+        
+        with gr.Row():
+            scratch_dir = gr.Textbox(label="Scratch directory", 
+                                     info="Every job gets a private workspace here for downloads and converted audio. Leave blank to use the system temp directory", 
+                                     placeholder="/path/to/scratch", 
+                                     interactive=True)
+            use_tmpfs = gr.Checkbox(label="Use tmpfs", 
+                                    info="Creates the job workspace in memory (/dev/shm) if no scratch directory is given", 
+                                    value=False)
+        
+    with gr.Tab(label="Jobs"):
+        jobs_table = gr.Dataframe(headers=["Job id", "Status", "Progress", "Message", "Result", "Inputs"], 
+                                  value=list_jobs, 
+                                  interactive=False, 
+                                  wrap=True)
+        with gr.Row():
+            cancel_job_id = gr.Textbox(label="Job id", placeholder="Job id to cancel", interactive=True)
+            cancel_button = gr.Button("Cancel job", variant="stop")
+            refresh_button = gr.Button("Refresh", variant="secondary")
+
     with gr.Tab(label="Huggingface Authentication"):
         hf_token = gr.Textbox(label="Huggingface Token", value="", 
                             info="""Token for fetching private models and datasets and pushing to hub.
@@ -228,6 +409,7 @@ with gr.Blocks() as iface:
         load_dataset_split,
         load_dataset_revision,
         load_dataset_column,
+        load_dataset_streaming,
         output_directory,
         save_dataset,
         save_dataset_revision,
@@ -235,7 +417,8 @@ with gr.Blocks() as iface:
         save_dataset_private,
         save_dataset_column_audio,
         save_dataset_column_text,
-        save_dataset_column_text_sbv
+        save_dataset_column_text_sbv,
+        save_dataset_local
     ]
     
     submit_button.click(fn=handle_submit, 
@@ -243,14 +426,33 @@ with gr.Blocks() as iface:
             *input_options,
             dtype_options, 
             checkpoint,
+            draft_checkpoint,
+            num_draft_tokens,
             batch_size,
+            model_cache_memory,
+            decode_in_memory,
+            max_workers,
+            download_workers,
+            queue_size,
+            length_bucketing,
+            vad,
+            cache_dir,
+            scratch_dir,
+            use_tmpfs,
             translate,
+            transcribe_and_translate,
             add_timestamps,
+            resume,
             hf_token
             ], 
         outputs=[status])
     
     clear_button.add(input_options)
 
+    cancel_button.click(fn=cancel_job, inputs=[cancel_job_id], outputs=[jobs_table])
+    refresh_button.click(fn=list_jobs, outputs=[jobs_table])
+    # Polls the progress of all jobs
+    iface.load(fn=list_jobs, outputs=[jobs_table], every=2)
+
 # Launch the interface
 iface.queue().launch()
@@ -0,0 +1,93 @@
+### Benchmark of the data parallel throughput per device count ###
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Allows running the benchmark from the repository root as `python benchmarks/device_scaling.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.devices import configure_devices
+
+def run_worker(args):
+    """
+    Measures the throughput of one device count, runs in its own process because JAX can't change its devices once imported.
+    """
+    configure_devices(args.worker_devices)
+    import numpy as np
+    import jax
+    import jax.numpy as jnp
+    from core.model import WhisperModel
+    from core.converter import AudioConverter, WHISPER_SAMPLING_RATE
+
+    if args.audio:
+        audio_input = AudioConverter().decode_to_array(args.audio)
+    else:
+        # Low level noise as a reproducible workload without any input files
+        audio_input = {"array": np.random.default_rng(0).normal(0.0, 0.01, int(args.audio_seconds * WHISPER_SAMPLING_RATE)).astype(np.float32), "sampling_rate": WHISPER_SAMPLING_RATE}
+
+    whisper_model = WhisperModel(dtype=getattr(jnp, args.dtype), batch_size=args.per_device_batch_size * args.worker_devices, checkpoint=args.checkpoint)
+
+    # Every input is a copy, transcribe_batch consumes the dicts
+    def make_inputs():
+        return [dict(audio_input) for _ in range(args.inputs)]
+
+    # The first call compiles the model and is not part of the measurement
+    start_time = time.perf_counter()
+    whisper_model.transcribe_batch(make_inputs()[:1], add_timestamps=False)
+    compile_s = time.perf_counter() - start_time
+
+    chunks_before = whisper_model.padding_stats["chunks"]
+    audio_samples_before = whisper_model.padding_stats["audio_samples"]
+    start_time = time.perf_counter()
+    for _ in range(args.repeats):
+        whisper_model.transcribe_batch(make_inputs(), add_timestamps=False)
+    elapsed_s = time.perf_counter() - start_time
+
+    chunks = whisper_model.padding_stats["chunks"] - chunks_before
+    audio_s = (whisper_model.padding_stats["audio_samples"] - audio_samples_before) / WHISPER_SAMPLING_RATE
+
+    print(json.dumps({
+        "devices": jax.local_device_count(),
+        "platform": jax.devices()[0].platform,
+        "batch_size": whisper_model.batch_size,
+        "compile_s": compile_s,
+        "elapsed_s": elapsed_s,
+        "chunks_per_s": chunks / elapsed_s,
+        "audio_s_per_s": audio_s / elapsed_s,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the transcription throughput of WhisperModel per number of devices")
+    parser.add_argument('-dc', '--device_counts', help='Device counts to measure', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('-hfc', '--hf_checkpoint', dest='checkpoint', help='Sets the hf checkpoint to use', default='openai/whisper-tiny')
+    parser.add_argument('-d', '--dtype', help='Sets the dtype to use', default='float32', choices=['float16', 'bfloat16', 'float32', 'float64'])
+    parser.add_argument('-pdb', '--per_device_batch_size', help='Batch size per device, the total batch size grows with the device count', default=1, type=int)
+    parser.add_argument('-a', '--audio', help='Audio file to transcribe, synthetic noise is used if not set', required=False)
+    parser.add_argument('-as', '--audio_seconds', help='Length of the synthetic audio in seconds', default=120.0, type=float)
+    parser.add_argument('-i', '--inputs', help='Number of inputs transcribed per repeat', default=4, type=int)
+    parser.add_argument('-r', '--repeats', help='Number of measured repeats', default=2, type=int)
+    parser.add_argument('--worker_devices', help=argparse.SUPPRESS, type=int, required=False)
+    args = parser.parse_args()
+
+    if args.worker_devices is not None:
+        run_worker(args)
+        return
+
+    results = []
+    for device_count in args.device_counts:
+        worker_command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--worker_devices", str(device_count)]
+        completed_process = subprocess.run(worker_command, stdout=subprocess.PIPE, check=True)
+        results.append(json.loads(completed_process.stdout.decode().strip().splitlines()[-1]))
+
+    baseline = results[0]["audio_s_per_s"] / results[0]["devices"]
+    print(f"{'devices':>8} {'platform':>9} {'batch':>6} {'compile s':>10} {'chunks/s':>9} {'audio s/s':>10} {'efficiency':>11}")
+    for result in results:
+        efficiency = result["audio_s_per_s"] / (baseline * result["devices"]) if baseline > 0 else 0.0
+        print(f"{result['devices']:>8} {result['platform']:>9} {result['batch_size']:>6} {result['compile_s']:>10.1f} "
+              f"{result['chunks_per_s']:>9.2f} {result['audio_s_per_s']:>10.1f} {efficiency:>11.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+### Synthetic fixtures and a stub model shared by the benchmarks and the tests ###
+import math
+import os
+import subprocess
+import time
+import wave
+
+FIXTURE_SAMPLING_RATE = 16000
+
+class StubWhisperModel:
+    """
+    A deterministic stand-in for WhisperModel, so the pipeline around the model can be tested and measured without JAX compiling anything.
+
+    Every input is transcribed as the name of its file (or "audio" for waveforms without a path) prefixed with the task.
+    Waveforms get one chunk per `chunk_s` seconds of audio, optionally after sleeping `latency_s` per chunk, other inputs a single chunk.
+    Inputs whose name is in `failing_names` raise, the model calls are recorded in `calls`.
+    """
+    def __init__(self, batch_size: int = 1, failing_names: tuple = (), chunk_s: float = 30.0, latency_s: float = 0.0):
+        self.batch_size = batch_size
+        self.checkpoint = "stub"
+        self.dtype = "float32"
+        self.failing_names = failing_names
+        self.chunk_s = chunk_s
+        self.latency_s = latency_s
+        self.calls = []
+        self.padding_stats = {"batches": 0, "chunks": 0, "audio_samples": 0, "padded_samples": 0}
+        self.speculative_decoder = None
+
+    def warmup(self, tasks=("transcribe",), add_timestamps_variants=(False,)) -> dict:
+        return {"variants": 0, "compile_s": 0.0, "start": "warm"}
+
+    def get_acceptance_rate(self):
+        return None
+
+    def transcribe_batch(self, inputs: list, add_timestamps=True, task="transcribe") -> list[dict]:
+        self.calls.append(list(inputs))
+        transcriptions = []
+
+        for single_input in inputs:
+            path = single_input if isinstance(single_input, str) else single_input.get("path") if isinstance(single_input, dict) else None
+            name = os.path.basename(path) if isinstance(path, str) else "audio"
+            if name in self.failing_names:
+                raise Exception(f"Stub model failed on {name}")
+
+            duration_s = 1.0
+            if isinstance(single_input, dict) and single_input.get("array") is not None:
+                duration_s = len(single_input["array"]) / single_input["sampling_rate"]
+                self.padding_stats["audio_samples"] += len(single_input["array"])
+            chunk_count = max(1, math.ceil(duration_s / self.chunk_s))
+            time.sleep(self.latency_s * chunk_count)
+            self.padding_stats["chunks"] += chunk_count
+
+            text = f"{task}: {name}"
+            chunks = [
+                {"timestamp": (idx * self.chunk_s, min((idx + 1) * self.chunk_s, duration_s)), "text": text if chunk_count == 1 else f"{text} ({idx + 1}/{chunk_count})"}
+                for idx in range(chunk_count)
+                ]
+            transcription = {"text": " ".join(chunk["text"] for chunk in chunks)}
+            if add_timestamps:
+                transcription["chunks"] = chunks
+            transcriptions.append(transcription)
+
+        return transcriptions
+
+def write_wav(path: str, duration_s: float = 1.0, frequency: float = 440.0, sampling_rate: int = FIXTURE_SAMPLING_RATE, amplitude: float = 0.2, quiet_amplitude: float|None = None):
+    """
+    Writes a mono 16 bit wav file with a sine tone, every other second is played at `quiet_amplitude` if it is set.
+    """
+    frames = bytearray()
+    for sample_idx in range(int(duration_s * sampling_rate)):
+        sample_amplitude = quiet_amplitude if quiet_amplitude is not None and int(sample_idx / sampling_rate) % 2 == 1 else amplitude
+        value = int(32767 * sample_amplitude * math.sin(2 * math.pi * frequency * sample_idx / sampling_rate))
+        frames += value.to_bytes(2, "little", signed=True)
+
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sampling_rate)
+        wav_file.writeframes(bytes(frames))
+
+def write_video(path: str, duration_s: float = 1.0, frequency: float = 440.0) -> bool:
+    """
+    Writes a small test video with a tone as audio track, returns False if ffmpeg is not available.
+    """
+    ffmpeg_command = [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc=size=160x120:rate=10:duration={duration_s}",
+        "-f", "lavfi", "-i", f"sine=frequency={frequency}:duration={duration_s}",
+        "-shortest", "-c:v", "libx264", "-c:a", "aac",
+        path,
+    ]
+    try:
+        subprocess.run(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return True
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return False
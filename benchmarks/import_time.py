@@ -0,0 +1,103 @@
+### Regression check that the CLI and the decode workers don't import heavy dependencies up front ###
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Top level packages that take seconds to import and are only needed by the subsystem using them
+HEAVY_MODULES = ("jax", "jaxlib", "whisper_jax", "transformers", "datasets", "moviepy", "pytube", "gradio")
+
+# (name, code, required modules) of every measured entry point, the code runs in a fresh interpreter.
+# The required modules are light dependencies the entry point can't be imported without
+ENTRY_POINTS = [
+    ("main.py --help", "import runpy, sys\nsys.argv = ['main.py', '--help']\ntry:\n    runpy.run_path('main.py', run_name='__main__')\nexcept SystemExit:\n    pass", ()),
+    ("server.py --help", "import runpy, sys\nsys.argv = ['server.py', '--help']\ntry:\n    runpy.run_path('server.py', run_name='__main__')\nexcept SystemExit:\n    pass", ()),
+    ("main.py invalid arguments", "import runpy, sys\nsys.argv = ['main.py', '-s', 'missing_output']\ntry:\n    runpy.run_path('main.py', run_name='__main__')\nexcept Exception:\n    pass", ()),
+    # The decode workers of the pipeline use this module
+    ("core.converter", "import core.converter", ("numpy",)),
+    ("core.dataset_writer", "import core.dataset_writer", ()),
+]
+
+MEASURE_CODE = """
+import json, sys, time
+start_time = time.perf_counter()
+{code}
+elapsed_s = time.perf_counter() - start_time
+loaded_modules = sorted({{module_name.split('.')[0] for module_name in sys.modules}} & set({heavy_modules!r}))
+print(json.dumps({{"elapsed_s": elapsed_s, "heavy_modules": loaded_modules}}))
+"""
+
+def measure(code: str) -> dict:
+    """
+    Runs `code` in a fresh interpreter and returns its import time and the heavy modules it loaded.
+    """
+    completed_process = subprocess.run(
+        [sys.executable, "-c", MEASURE_CODE.format(code=code, heavy_modules=HEAVY_MODULES)],
+        cwd=REPOSITORY_PATH,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env={**os.environ, "PYTHONPATH": REPOSITORY_PATH}
+        )
+    if completed_process.returncode != 0:
+        return {"elapsed_s": None, "heavy_modules": [], "error": completed_process.stderr.decode(errors="replace").strip().splitlines()[-1]}
+    return json.loads(completed_process.stdout.decode().strip().splitlines()[-1])
+
+def get_missing_modules(required_modules: tuple) -> list[str]:
+    """
+    Returns the required modules that are not installed.
+    """
+    return [module_name for module_name in required_modules if importlib.util.find_spec(module_name) is None]
+
+def find_regressions(result: dict, max_time: float|None = None) -> list[str]:
+    """
+    Returns the problems of a measured entry point, an entry point that fails to import is a regression as well.
+
+    Parameters:
+        result (dict): The result of `measure`.
+        max_time (float|None, optional): The maximum import time in seconds. Defaults to None (not checked).
+
+    Returns:
+        list[str]: A description per problem, empty if the entry point is fine.
+    """
+    if result.get("error"):
+        return [f"failed: {result['error']}"]
+
+    regressions = []
+    if len(result["heavy_modules"]) > 0:
+        regressions.append(f"imports heavy modules: {', '.join(result['heavy_modules'])}")
+    if max_time is not None and result["elapsed_s"] > max_time:
+        regressions.append(f"took {result['elapsed_s']:.2f} s")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks that entry points don't import heavy dependencies and reports their import time")
+    parser.add_argument('-mt', '--max_time', help='Maximum import time per entry point in seconds', default=1.0, type=float)
+    args = parser.parse_args()
+
+    failed = False
+    for name, code, required_modules in ENTRY_POINTS:
+        missing_modules = get_missing_modules(required_modules)
+        if len(missing_modules) > 0:
+            # A light dependency that isn't installed is a gap of the environment and not a regression
+            print(f"{name:<28} skipped: {', '.join(missing_modules)} not installed")
+            continue
+
+        result = measure(code)
+        regressions = find_regressions(result, max_time=args.max_time)
+        failed = failed or len(regressions) > 0
+
+        if result.get("error"):
+            print(f"{name:<28} REGRESSION {regressions[0]}")
+            continue
+
+        heavy_modules = ", ".join(result["heavy_modules"]) or "none"
+        print(f"{name:<28} {result['elapsed_s']:>6.2f} s  heavy modules: {heavy_modules}{'  REGRESSION' if regressions else ''}")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
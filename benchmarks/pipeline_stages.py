@@ -0,0 +1,280 @@
+### Offline benchmark of every pipeline stage on synthetic fixtures ###
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Allows running the benchmark from the repository root as `python benchmarks/pipeline_stages.py`
+sys.path.insert(0, REPOSITORY_PATH)
+
+from benchmarks.fixtures import StubWhisperModel, write_wav, write_video
+
+STAGES = ("discovery", "decode", "convert_video", "model_stub", "model", "sbv", "dataset_write")
+
+def create_fixtures(fixtures_dir: str, args) -> dict:
+    """
+    Creates the synthetic audio / video files and a nested tree of unrelated files for the discovery stage.
+
+    Returns:
+        dict: The paths of the "audio" and "video" fixtures and the "tree" directory.
+    """
+    fixtures = {"audio": [], "video": [], "tree": os.path.join(fixtures_dir, "tree")}
+    media_dir = os.path.join(fixtures_dir, "media")
+    os.makedirs(media_dir, exist_ok=True)
+
+    for idx in range(args.audio_files):
+        path = os.path.join(media_dir, f"audio_{idx}.wav")
+        # The loudness changes every second, so the fixtures are not pure silence for the voice activity detection
+        write_wav(path, args.audio_seconds, frequency=220.0 + 20.0 * idx, quiet_amplitude=0.05)
+        fixtures["audio"].append(path)
+
+    for idx in range(args.video_files):
+        path = os.path.join(media_dir, f"video_{idx}.mp4")
+        if not write_video(path, args.audio_seconds, frequency=330.0 + 20.0 * idx):
+            break
+        fixtures["video"].append(path)
+
+    # Directories with text files and a few media files in between, like a recording archive
+    for file_idx in range(args.tree_files):
+        directory = os.path.join(fixtures["tree"], f"dir_{file_idx % args.tree_dirs}", f"sub_{file_idx % 7}")
+        os.makedirs(directory, exist_ok=True)
+        file_name = f"file_{file_idx}.wav" if file_idx % 10 == 0 else f"file_{file_idx}.txt"
+        with open(os.path.join(directory, file_name), "wb") as f:
+            f.write(b"\0" * 64)
+
+    return fixtures
+
+def get_peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(who).ru_maxrss
+    return peak_rss / 1024**2 if sys.platform == "darwin" else peak_rss / 1024
+
+def run_worker(args):
+    """
+    Measures one stage, runs in its own process so the peak RSS belongs to that stage only.
+    """
+    with open(os.path.join(args.fixtures_dir, "fixtures.json"), "r", encoding="utf-8") as f:
+        fixtures = json.load(f)
+    stage = args.worker_stage
+    media_files = fixtures["audio"] + fixtures["video"]
+
+    if stage == "convert_video" and len(fixtures["video"]) == 0:
+        print(json.dumps({"stage": stage, "skipped": "ffmpeg could not create video fixtures"}))
+        return
+    if stage == "model" and not args.hf_checkpoint:
+        print(json.dumps({"stage": stage, "skipped": "pass -hfc --hf_checkpoint to measure a real checkpoint"}))
+        return
+
+    from core.converter import AudioConverter
+    audio_converter = AudioConverter()
+
+    def create_pipeline(whisper_model):
+        from core.pipeline import NeuraLumaWhisperPipeline
+        from core.workspace import JobWorkspace
+        return NeuraLumaWhisperPipeline(whisper_model=whisper_model, progress_cb=lambda *args: None, workspace=JobWorkspace(base_dir=args.fixtures_dir))
+
+    def decode_inputs():
+        return [audio_converter.decode_to_array(path) for path in media_files]
+
+    audio_s = 0.0
+    items = 0
+    extra = {}
+
+    if stage == "discovery":
+        pipeline = create_pipeline(StubWhisperModel())
+        start_time = time.perf_counter()
+        for _ in range(args.repeats):
+            items += len(pipeline.collect_files_recursively(fixtures["tree"]))
+        elapsed_s = time.perf_counter() - start_time
+
+    elif stage == "decode":
+        start_time = time.perf_counter()
+        for _ in range(args.repeats):
+            for model_inputs in decode_inputs():
+                items += 1
+                audio_s += audio_converter.probe_duration(model_inputs)
+        elapsed_s = time.perf_counter() - start_time
+
+    elif stage == "convert_video":
+        output_dir = os.path.join(args.fixtures_dir, "converted")
+        start_time = time.perf_counter()
+        for _ in range(args.repeats):
+            for path in fixtures["video"]:
+                audio_converter.convert_from_video(
+                    input_path=os.path.dirname(path),
+                    input_file_name=os.path.basename(path),
+                    output_path=output_dir,
+                    output_file_name=os.path.basename(path).split(".")[0] + ".mp3"
+                    )
+                items += 1
+                audio_s += args.audio_seconds
+        elapsed_s = time.perf_counter() - start_time
+
+    elif stage in ("model_stub", "model"):
+        if stage == "model_stub":
+            whisper_model = StubWhisperModel(batch_size=args.batch_size, chunk_s=5.0, latency_s=args.stub_latency_ms / 1000)
+        else:
+            import jax.numpy as jnp
+            from core.model import WhisperModel
+            whisper_model = WhisperModel(dtype=getattr(jnp, args.dtype), batch_size=args.batch_size, checkpoint=args.hf_checkpoint)
+            warmup_stats = whisper_model.warmup(tasks=("transcribe",), add_timestamps_variants=(True,))
+            extra["compile_s"] = warmup_stats["compile_s"]
+
+        pipeline = create_pipeline(whisper_model)
+        decoded_inputs = decode_inputs()
+        start_time = time.perf_counter()
+        for _ in range(args.repeats):
+            # transcribe_batch consumes the dicts, so every repeat gets copies
+            model_inputs_list = [dict(model_inputs) for model_inputs in decoded_inputs]
+            pipeline.run_model_batch(model_inputs_list, add_timestamps=True)
+            items += len(model_inputs_list)
+            audio_s += sum(audio_converter.probe_duration(model_inputs) for model_inputs in decoded_inputs)
+        elapsed_s = time.perf_counter() - start_time
+
+    elif stage == "sbv":
+        whisper_model = StubWhisperModel(chunk_s=2.0)
+        pipeline = create_pipeline(whisper_model)
+        transcriptions = [{"transcription": transcription} for transcription in whisper_model.transcribe_batch(decode_inputs(), add_timestamps=True)]
+        start_time = time.perf_counter()
+        for _ in range(args.repeats * 100):
+            for transcription in transcriptions:
+                pipeline.get_timestamped_sbv_text(transcription)
+                items += 1
+        elapsed_s = time.perf_counter() - start_time
+        audio_s = args.repeats * 100 * sum(args.audio_seconds for _ in transcriptions)
+
+    elif stage == "dataset_write":
+        if importlib.util.find_spec("datasets") is None:
+            print(json.dumps({"stage": stage, "skipped": "datasets is not installed"}))
+            return
+        from core.dataset_writer import ShardedDatasetWriter
+        whisper_model = StubWhisperModel(chunk_s=5.0)
+        pipeline = create_pipeline(whisper_model)
+        decoded_inputs = decode_inputs()
+        transcriptions = whisper_model.transcribe_batch([dict(model_inputs) for model_inputs in decoded_inputs], add_timestamps=True)
+
+        start_time = time.perf_counter()
+        for repeat in range(args.repeats):
+            writer = ShardedDatasetWriter(
+                local_path=os.path.join(args.fixtures_dir, f"dataset_{repeat}"),
+                sbv_column="sbv",
+                sbv_formatter=pipeline.get_timestamped_sbv_text,
+                max_shard_bytes=int(args.max_shard_size * 1024**2)
+                )
+            for idx, (model_inputs, transcription) in enumerate(zip(decoded_inputs, transcriptions)):
+                writer.add({"idx": idx, "audio_entry": model_inputs, "transcription": transcription})
+                items += 1
+                audio_s += audio_converter.probe_duration(model_inputs)
+            writer.close()
+        elapsed_s = time.perf_counter() - start_time
+
+    print(json.dumps({
+        "stage": stage,
+        "items": items,
+        "audio_s": audio_s,
+        "elapsed_s": elapsed_s,
+        "items_per_s": items / elapsed_s if elapsed_s > 0 else 0.0,
+        "audio_s_per_s": audio_s / elapsed_s if elapsed_s > 0 else 0.0,
+        "peak_rss_mb": get_peak_rss_mb(),
+        "peak_child_rss_mb": get_peak_rss_mb(resource.RUSAGE_CHILDREN),
+        **extra,
+    }))
+
+def get_commit() -> str|None:
+    try:
+        completed_process = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPOSITORY_PATH, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return completed_process.stdout.decode().strip()
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results: list[dict], baseline: dict|None = None):
+    baseline_results = {result["stage"]: result for result in (baseline or {}).get("results", [])}
+    print(f"{'stage':<14} {'items':>7} {'items/s':>10} {'audio s/s':>10} {'peak RSS MB':>12} {'vs baseline':>12}")
+
+    for result in results:
+        if result.get("skipped"):
+            print(f"{result['stage']:<14} skipped: {result['skipped']}")
+            continue
+
+        comparison = ""
+        baseline_result = baseline_results.get(result["stage"])
+        if baseline_result and baseline_result.get("items_per_s"):
+            comparison = f"{result['items_per_s'] / baseline_result['items_per_s'] - 1.0:+.1%}"
+
+        print(f"{result['stage']:<14} {result['items']:>7} {result['items_per_s']:>10.2f} {result['audio_s_per_s']:>10.1f} {result['peak_rss_mb']:>12.1f} {comparison:>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the throughput and peak memory of every pipeline stage on synthetic fixtures")
+    parser.add_argument('-st', '--stages', help='Stages to measure', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('-af', '--audio_files', help='Number of synthetic audio files', default=8, type=int)
+    parser.add_argument('-vf', '--video_files', help='Number of synthetic video files, requires ffmpeg', default=2, type=int)
+    parser.add_argument('-as', '--audio_seconds', help='Length of every synthetic file in seconds', default=30.0, type=float)
+    parser.add_argument('-tf', '--tree_files', help='Number of files in the directory tree of the discovery stage', default=5000, type=int)
+    parser.add_argument('-td', '--tree_dirs', help='Number of top level directories of the directory tree', default=50, type=int)
+    parser.add_argument('-r', '--repeats', help='Number of measured repeats per stage', default=3, type=int)
+    parser.add_argument('-b', '--batch_size', help='Sets the batch size for inference', default=4, type=int)
+    parser.add_argument('-hfc', '--hf_checkpoint', help='Real checkpoint measured by the model stage, e.g. openai/whisper-tiny. The model stage is skipped if not set, so the suite runs offline', required=False)
+    parser.add_argument('-d', '--dtype', help='Sets the dtype of the real checkpoint', default='float32', choices=['float16', 'bfloat16', 'float32', 'float64'])
+    parser.add_argument('-sl', '--stub_latency_ms', help='Simulated inference time of the stub model per 5 s chunk in ms', default=0.0, type=float)
+    parser.add_argument('-sms', '--max_shard_size', help='Maximum size of a dataset shard in MB', default=50, type=float)
+    parser.add_argument('-o', '--output', help='Writes the results to this JSON file, e.g. to compare commits', required=False)
+    parser.add_argument('-c', '--compare', help='JSON file of an earlier run, the change of items/s is printed per stage', required=False)
+    parser.add_argument('--worker_stage', help=argparse.SUPPRESS, required=False)
+    parser.add_argument('--fixtures_dir', help=argparse.SUPPRESS, required=False)
+    args = parser.parse_args()
+
+    if args.worker_stage is not None:
+        run_worker(args)
+        return
+
+    fixtures_dir = tempfile.mkdtemp(prefix="neuraluma_benchmark_")
+    try:
+        fixtures = create_fixtures(fixtures_dir, args)
+        with open(os.path.join(fixtures_dir, "fixtures.json"), "w", encoding="utf-8") as f:
+            json.dump(fixtures, f)
+
+        results = []
+        for stage in args.stages:
+            worker_command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--worker_stage", stage, "--fixtures_dir", fixtures_dir]
+            completed_process = subprocess.run(worker_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=REPOSITORY_PATH)
+            if completed_process.returncode != 0:
+                # e.g. a missing dependency of this stage, the other stages are still measured
+                error = completed_process.stderr.decode(errors="replace").strip().splitlines()
+                results.append({"stage": stage, "skipped": error[-1] if error else f"exit code {completed_process.returncode}"})
+                continue
+            results.append(json.loads(completed_process.stdout.decode().strip().splitlines()[-1]))
+    finally:
+        shutil.rmtree(fixtures_dir, ignore_errors=True)
+
+    report = {
+        "commit": get_commit(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "worker_stage", "fixtures_dir")},
+        "results": results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
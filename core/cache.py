@@ -0,0 +1,177 @@
+import numpy as np
+import hashlib
+import json
+import os
+import threading
+
+class TranscriptionCache:
+    """
+    On-disk cache of transcriptions, keyed by a hash of the audio content and the model settings.
+
+    Every entry is stored as a JSON file. The modification time of a file is refreshed on every hit,
+    so the least recently used entries are evicted first once the cache exceeds `max_size_bytes`.
+    """
+    def __init__(self, cache_dir: str, max_size_bytes: int|None = 1024**3):
+        """
+        Parameters:
+            cache_dir (str): The directory the cache entries are stored in.
+            max_size_bytes (int|None, optional): The maximum size of all cache entries in bytes. None disables eviction. Defaults to 1 GB.
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self._size_bytes = sum(os.path.getsize(entry_path) for entry_path in self._list_entry_paths())
+
+    def hash_audio(self, audio_input) -> str:
+        """
+        Hashes the content of an audio input.
+
+        Parameters:
+            audio_input (np.ndarray or str or bytes or dict): Any input accepted by WhisperModel.transcribe. Files are hashed by their bytes.
+
+        Returns:
+            str: The hex digest of the audio content.
+        """
+        audio_hash = hashlib.sha256()
+
+        if isinstance(audio_input, str):
+            with open(audio_input, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    audio_hash.update(block)
+        elif isinstance(audio_input, bytes):
+            audio_hash.update(audio_input)
+        elif isinstance(audio_input, dict):
+            audio_hash.update(np.ascontiguousarray(audio_input["array"]).tobytes())
+            audio_hash.update(str(audio_input["sampling_rate"]).encode())
+        elif isinstance(audio_input, np.ndarray):
+            audio_hash.update(np.ascontiguousarray(audio_input).tobytes())
+        else:
+            raise Exception(f"Can't hash audio input of type {type(audio_input)}")
+
+        return audio_hash.hexdigest()
+
+    def make_key(self, audio_input, checkpoint: str, dtype: str, task: str, add_timestamps: bool, vad_settings: dict|None = None) -> str:
+        """
+        Builds the cache key of an audio input transcribed with the given settings.
+
+        Parameters:
+            audio_input: Any input accepted by WhisperModel.transcribe.
+            checkpoint (str): The HF checkpoint of the model.
+            dtype (str): The name of the dtype of the model.
+            task (str): Either "transcribe" or "translate".
+            add_timestamps (bool): Whether timestamps are added.
+            vad_settings (dict|None, optional): The settings of the voice activity detection, None if it is disabled. Defaults to None.
+
+        Returns:
+            str: The cache key.
+        """
+        settings = {
+            "audio": self.hash_audio(audio_input),
+            "checkpoint": checkpoint,
+            "dtype": dtype,
+            "task": task,
+            "timestamps": bool(add_timestamps),
+        }
+        # Only added if enabled, so existing entries stay valid
+        if vad_settings is not None:
+            settings["vad"] = vad_settings
+        settings = json.dumps(settings, sort_keys=True)
+
+        return hashlib.sha256(settings.encode()).hexdigest()
+
+    def get(self, key: str) -> dict|None:
+        """
+        Returns the cached transcription for a key or None if it is not cached.
+        """
+        entry_path = self._get_entry_path(key)
+
+        with self._lock:
+            try:
+                with open(entry_path, 'r', encoding='utf-8') as f:
+                    transcription = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self.stats["misses"] += 1
+                return None
+
+            # Refresh the modification time which is used for LRU eviction
+            os.utime(entry_path)
+            self.stats["hits"] += 1
+
+        return transcription
+
+    def put(self, key: str, transcription: dict):
+        """
+        Stores a transcription and evicts the least recently used entries if the cache is too large.
+        """
+        entry_path = self._get_entry_path(key)
+        # Timestamps may be numpy scalars
+        serialized_transcription = json.dumps(transcription, ensure_ascii=False, default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+
+        with self._lock:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            previous_size = os.path.getsize(entry_path) if os.path.exists(entry_path) else 0
+
+            # Write to a temporary file first so a crash never leaves a truncated entry behind
+            temp_entry_path = entry_path + ".tmp"
+            with open(temp_entry_path, 'w', encoding='utf-8') as f:
+                f.write(serialized_transcription)
+            os.replace(temp_entry_path, entry_path)
+
+            self._size_bytes += os.path.getsize(entry_path) - previous_size
+            self.stats["stores"] += 1
+            self._evict()
+
+    def get_size_bytes(self) -> int:
+        """
+        Returns the size of all cache entries in bytes.
+        """
+        with self._lock:
+            return self._size_bytes
+
+    def format_stats(self, since: dict|None = None) -> str:
+        """
+        Returns a human readable summary of the cache statistics.
+
+        Parameters:
+            since (dict|None, optional): A copy of `stats` taken earlier, only the lookups after it are counted. Defaults to None (all lookups).
+        """
+        with self._lock:
+            stats = {key: value - (since or {}).get(key, 0) for key, value in self.stats.items()}
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups if lookups > 0 else 0.0
+
+        return (f"Transcription cache: {stats['hits']} hits, {stats['misses']} misses ({hit_rate:.1%} hit rate), "
+                f"{stats['stores']} stored, {stats['evictions']} evicted, {self.get_size_bytes() / 1024**2:.1f} MB used")
+
+    def _get_entry_path(self, key: str) -> str:
+        # Entries are spread over sub directories to keep directory listings small
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _list_entry_paths(self) -> list[str]:
+        entry_paths = []
+
+        for sub_dir in os.scandir(self.cache_dir):
+            if not sub_dir.is_dir():
+                continue
+            for entry in os.scandir(sub_dir.path):
+                if entry.is_file() and entry.name.endswith(".json"):
+                    entry_paths.append(entry.path)
+
+        return entry_paths
+
+    def _evict(self):
+        if self.max_size_bytes is None or self._size_bytes <= self.max_size_bytes:
+            return
+
+        for entry_path in sorted(self._list_entry_paths(), key=os.path.getmtime):
+            if self._size_bytes <= self.max_size_bytes:
+                break
+            entry_size = os.path.getsize(entry_path)
+            os.remove(entry_path)
+            self._size_bytes -= entry_size
+            self.stats["evictions"] += 1
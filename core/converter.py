@@ -1,7 +1,15 @@
 from core.downloader import YouTubeDownloader
-from moviepy.editor import AudioFileClip
+import numpy as np
+import subprocess
 import os
 
+# File extensions (without dot) that can be decoded by ffmpeg
+AUDIO_FILE_EXTENSIONS = ('mp3', 'wav', 'flac', 'ogg', 'm4a', 'aac', 'opus', 'wma')
+VIDEO_FILE_EXTENSIONS = ('mp4', 'mkv', 'webm', 'mov', 'avi', 'flv', 'wmv', 'm4v')
+
+# Whisper operates on mono 16 kHz audio
+WHISPER_SAMPLING_RATE = 16000
+
 class AudioConverter:
     def convert_from_youtube(self, url: str, output_path: str = 'temp/audio', output_file_name: str|None = None) -> str:
         """
@@ -87,6 +95,8 @@ class AudioConverter:
         if not os.path.exists(output_path):
             os.makedirs(output_path)
 
+        from moviepy.editor import AudioFileClip
+
         with AudioFileClip(input_source_path) as clip:
             clip.write_audiofile(output_destination_path, codec='mp3')
         
@@ -121,8 +131,88 @@ class AudioConverter:
             if not os.path.exists(input_source_path):
                 raise Exception(f"Could not locate file at: {input_source_path}")
         
+        from moviepy.editor import AudioFileClip
+
         for input_source_path, output_destination_path in zip(input_source_paths, output_destination_paths):
             with AudioFileClip(input_source_path) as clip:
                 clip.write_audiofile(output_destination_path, codec='mp3')
         
-        return output_destination_paths
\ No newline at end of file
+        return output_destination_paths
+    
+    def decode_to_array(self, input_source_path: str, sampling_rate: int = WHISPER_SAMPLING_RATE) -> dict:
+        """
+        Decodes an audio or video file directly into memory without writing an intermediate audio file.
+
+        Parameters:
+            input_source_path (str): The path of the audio or video file. Any container supported by ffmpeg can be used.
+            sampling_rate (int, optional): The sampling rate to resample to. Defaults to 16000.
+
+        Returns:
+            dict: A dictionary containing the following keys:
+                - "array" (np.ndarray): The mono float32 waveform.
+                - "sampling_rate" (int): The sampling rate of the waveform.
+        """
+        if not os.path.exists(input_source_path):
+            raise Exception(f"Could not locate file at: {input_source_path}")
+
+        ffmpeg_command = [
+            "ffmpeg",
+            "-nostdin",
+            "-i", input_source_path,
+            "-vn",
+            "-ac", "1",
+            "-ar", str(sampling_rate),
+            "-f", "f32le",
+            "-hide_banner",
+            "-loglevel", "error",
+            "pipe:1",
+        ]
+
+        try:
+            completed_process = subprocess.run(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        except FileNotFoundError as e:
+            raise Exception("ffmpeg was not found but is required to decode audio in memory.") from e
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"Could not decode file at: {input_source_path}\n{e.stderr.decode(errors='replace')}") from e
+
+        audio_array = np.frombuffer(completed_process.stdout, dtype=np.float32)
+
+        if audio_array.shape[0] == 0:
+            raise Exception(f"File contains no audio: {input_source_path}")
+
+        return {
+            "array": audio_array,
+            "sampling_rate": sampling_rate
+        }
+    
+    def probe_duration(self, audio_input) -> float|None:
+        """
+        Determines the duration of an audio input without decoding files.
+
+        Parameters:
+            audio_input (str or dict or np.ndarray): A file path (duration is read from the container metadata via ffprobe), 
+                a dict with "array" and "sampling_rate" or a 16 kHz waveform.
+
+        Returns:
+            float|None: The duration in seconds, None if it could not be determined.
+        """
+        if isinstance(audio_input, dict) and audio_input.get("array") is not None:
+            return len(audio_input["array"]) / audio_input["sampling_rate"]
+        elif isinstance(audio_input, np.ndarray):
+            return len(audio_input) / WHISPER_SAMPLING_RATE
+        elif not isinstance(audio_input, str) or not os.path.exists(audio_input):
+            return None
+
+        ffprobe_command = [
+            "ffprobe",
+            "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            audio_input,
+        ]
+
+        try:
+            completed_process = subprocess.run(ffprobe_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+            return float(completed_process.stdout.decode().strip())
+        except (FileNotFoundError, subprocess.CalledProcessError, ValueError):
+            return None
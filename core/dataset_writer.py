@@ -0,0 +1,295 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+import hashlib
+import json
+import os
+
+class ShardedDatasetWriter:
+    """
+    Streams transcriptions into size-bounded local Parquet shards instead of building the whole dataset in memory.
+
+    Shards are written in the Hub layout (`data/<split>-<shard>.parquet`), so the directory can be loaded with
+    `load_dataset(local_path)` and `save_to_disk` can be used on the loaded dataset. Only the rows of the
+    current shard are held in memory. Every finished shard is recorded in an index file, so a resumed
+    job does not write rows twice.
+    """
+    def __init__(
+            self,
+            local_path: str,
+            audio_column: str = "audio",
+            text_column: str = "text",
+            sbv_column: str|None = None,
+            sbv_formatter: Callable[[dict], str]|None = None,
+            split: str|None = None,
+            max_shard_bytes: int = 500 * 1024**2,
+            resume: bool = False
+            ):
+        """
+        Parameters:
+            local_path (str): The directory the dataset is written to.
+            audio_column (str, optional): The column name of the audio. Defaults to "audio".
+            text_column (str, optional): The column name of the transcribed text. Defaults to "text".
+            sbv_column (str|None, optional): The column name of the sbv formatted text, None if no timestamps are written. Defaults to None.
+            sbv_formatter (Callable[[dict], str]|None, optional): Formats a transcription as sbv text. Defaults to None.
+            split (str|None, optional): The split of the dataset. Defaults to "train".
+            max_shard_bytes (int, optional): The approximate maximum size of a shard in bytes. Defaults to 500 MB.
+            resume (bool, optional): Whether shards of a previous run are kept and their rows skipped. Defaults to False.
+        """
+        self.local_path = local_path
+        self.data_path = os.path.join(local_path, "data")
+        self.index_path = os.path.join(local_path, "shards.jsonl")
+        self.audio_column = audio_column
+        self.text_column = text_column
+        self.sbv_column = sbv_column
+        self.sbv_formatter = sbv_formatter
+        self.split = split or "train"
+        self.max_shard_bytes = max_shard_bytes
+
+        # datasets is slow to import and only needed once a dataset is written
+        from datasets import Features, Audio, Value
+
+        features = {audio_column: Audio(), text_column: Value("string")}
+        if sbv_column:
+            features[sbv_column] = Value("string")
+        self.features = Features(features)
+
+        self.buffer = {column: [] for column in self.features}
+        self.buffer_idx = []
+        self.buffer_bytes = 0
+        self.written_idx = set()
+        self.shard_count = 0
+
+        os.makedirs(self.data_path, exist_ok=True)
+
+        if resume and os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        shard_record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.written_idx.update(shard_record["idx"])
+                    self.shard_count = max(self.shard_count, shard_record["shard"] + 1)
+        else:
+            # A new job starts with an empty dataset
+            for file_name in os.listdir(self.data_path):
+                if file_name.endswith(".parquet"):
+                    os.remove(os.path.join(self.data_path, file_name))
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+
+    def is_written(self, idx: int|None) -> bool:
+        """
+        Returns whether the row of an output index is already stored in a shard.
+        """
+        return idx is not None and idx in self.written_idx
+
+    def encode_audio_entry(self, audio_entry) -> dict:
+        """
+        Encodes an audio entry to the storage format of the Audio feature, so the audio bytes are embedded in the shard.
+
+        Parameters:
+            audio_entry (str|dict): A file path or a dict with "array" and "sampling_rate".
+
+        Returns:
+            dict: A dict with the keys "bytes" and "path".
+        """
+        if isinstance(audio_entry, str):
+            with open(audio_entry, 'rb') as f:
+                return {"bytes": f.read(), "path": os.path.basename(audio_entry)}
+        elif isinstance(audio_entry, dict):
+            from datasets import Audio
+            encoded_audio = Audio().encode_example({"array": audio_entry["array"], "sampling_rate": audio_entry["sampling_rate"]})
+            path = audio_entry.get("path")
+            return {"bytes": encoded_audio["bytes"], "path": os.path.basename(path) if isinstance(path, str) else None}
+        else:
+            raise Exception("The provided type for audio_columns isn't supported")
+
+    def add(self, transcription: dict):
+        """
+        Adds a transcription with the keys idx, audio_entry and transcription, a shard is written once it is full.
+        """
+        idx = transcription.get("idx")
+        if self.is_written(idx):
+            return
+
+        encoded_audio = self.encode_audio_entry(transcription["audio_entry"])
+        text = transcription["transcription"]["text"]
+
+        self.buffer[self.audio_column].append(encoded_audio)
+        self.buffer[self.text_column].append(text)
+        if self.sbv_column:
+            self.buffer[self.sbv_column].append(self.sbv_formatter(transcription))
+        self.buffer_idx.append(idx)
+        self.buffer_bytes += len(encoded_audio["bytes"] or b"") + len(text.encode())
+
+        if self.buffer_bytes >= self.max_shard_bytes:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered rows as a new shard.
+        """
+        if len(self.buffer_idx) <= 0:
+            return
+
+        from datasets import Dataset
+
+        shard_file_name = f"{self.split}-{self.shard_count:05d}.parquet"
+        shard_path = os.path.join(self.data_path, shard_file_name)
+
+        # Write to a temporary file first so uploads never pick up a partially written shard
+        Dataset.from_dict(self.buffer, features=self.features).to_parquet(shard_path + ".tmp")
+        os.replace(shard_path + ".tmp", shard_path)
+
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"shard": self.shard_count, "file": shard_file_name, "idx": [idx for idx in self.buffer_idx if idx is not None]}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.written_idx.update(idx for idx in self.buffer_idx if idx is not None)
+        self.shard_count += 1
+        self.buffer = {column: [] for column in self.features}
+        self.buffer_idx = []
+        self.buffer_bytes = 0
+
+    def close(self):
+        """
+        Writes the remaining buffered rows.
+        """
+        self.flush()
+
+class DatasetShardUploader:
+    """
+    Uploads the shards of a local dataset written by ShardedDatasetWriter to the Huggingface Hub.
+
+    Shards are uploaded in parallel and every finished upload is recorded with the content hash of the shard
+    in an upload manifest next to the local dataset. A resumed upload skips the shards recorded for the same
+    repository and content, a new upload overwrites all shards. Shards of the uploaded splits that don't
+    belong to the local dataset, e.g. left over from an earlier, larger run, are deleted from the repository.
+    """
+    def __init__(self, token: str|None = None, max_workers: int = 4):
+        """
+        Parameters:
+            token (str|None, optional): The Huggingface token. Defaults to None.
+            max_workers (int, optional): The maximum number of concurrent uploads. Defaults to 4.
+        """
+        self.token = token
+        self.max_workers = max_workers
+
+    @staticmethod
+    def hash_shard(shard_path: str) -> str:
+        """
+        Returns the sha256 hex digest of a shard file.
+        """
+        shard_hash = hashlib.sha256()
+        with open(shard_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                shard_hash.update(block)
+        return shard_hash.hexdigest()
+
+    def load_upload_manifest(self, manifest_path: str, repo_id: str, revision: str|None) -> dict:
+        """
+        Returns the content hashes of the shards recorded as uploaded to the given repository and revision.
+
+        Returns:
+            dict: The content hash per path in the repository.
+        """
+        uploaded_hashes = {}
+        if not os.path.exists(manifest_path):
+            return uploaded_hashes
+
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    upload_record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if upload_record["repo_id"] == repo_id and upload_record["revision"] == revision:
+                    uploaded_hashes[upload_record["path"]] = upload_record["sha256"]
+        return uploaded_hashes
+
+    def upload(self, local_path: str, repo_id: str, revision: str|None = None, private: bool = True, resume: bool = False, progress_cb=lambda *args: None) -> (list[str], list[str]):
+        """
+        Uploads all shards of a local dataset.
+
+        Parameters:
+            local_path (str): The directory of the local dataset.
+            repo_id (str): The dataset repository, e.g. my_user/my_dataset.
+            revision (str|None, optional): The branch to upload to. Defaults to None (main).
+            private (bool, optional): Whether a newly created repository is private. Defaults to True.
+            resume (bool, optional): Whether shards already uploaded with the same content by a previous run are skipped. Defaults to False.
+            progress_cb (callable, optional): Called with a message and a progress amount.
+
+        Returns:
+            tuple: A tuple containing two lists - uploaded_paths and failed_paths.
+                - uploaded_paths (list): The paths in the repository of the shards uploaded by this call.
+                - failed_paths (list): The paths in the repository of the shards that failed to upload.
+        """
+        from huggingface_hub import HfApi, CommitOperationDelete
+
+        api = HfApi(token=self.token)
+        api.create_repo(repo_id, repo_type="dataset", private=private, exist_ok=True)
+
+        if revision and revision != "main":
+            api.create_branch(repo_id, branch=revision, repo_type="dataset", exist_ok=True)
+
+        manifest_path = os.path.join(local_path, "uploads.jsonl")
+        if not resume and os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+        existing_paths = set(api.list_repo_files(repo_id, repo_type="dataset", revision=revision))
+        uploaded_hashes = self.load_upload_manifest(manifest_path, repo_id, revision)
+        data_path = os.path.join(local_path, "data")
+        shard_paths = sorted("data/" + file_name for file_name in os.listdir(data_path) if file_name.endswith(".parquet"))
+        shard_hashes = {shard_path: self.hash_shard(os.path.join(local_path, shard_path)) for shard_path in shard_paths}
+        # A shard is only skipped if this job uploaded exactly this content before and it is still in the repository
+        pending_paths = [
+            shard_path for shard_path in shard_paths
+            if not (shard_path in existing_paths and uploaded_hashes.get(shard_path) == shard_hashes[shard_path])
+            ]
+
+        # Shards of the uploaded splits that are not part of the local dataset belong to an earlier run, e.g. data/train-00007.parquet
+        splits = {shard_path[len("data/"):].rpartition("-")[0] for shard_path in shard_paths}
+        stale_paths = sorted(
+            path for path in existing_paths
+            if path.startswith("data/") and path.endswith(".parquet") and path not in shard_hashes and path[len("data/"):].rpartition("-")[0] in splits
+            )
+        if len(stale_paths) > 0:
+            progress_cb(f"Deleting {len(stale_paths)} shards of an earlier run from {repo_id}", 0.0)
+            api.create_commit(
+                repo_id,
+                operations=[CommitOperationDelete(path_in_repo=path) for path in stale_paths],
+                commit_message=f"Delete {len(stale_paths)} stale shards",
+                repo_type="dataset",
+                revision=revision
+                )
+
+        progress_cb(f"Uploading {len(pending_paths)} of {len(shard_paths)} shards to {repo_id}, {len(shard_paths) - len(pending_paths)} already uploaded", 0.0)
+
+        def upload_shard(path_in_repo):
+            api.upload_file(
+                path_or_fileobj=os.path.join(local_path, path_in_repo),
+                path_in_repo=path_in_repo,
+                repo_id=repo_id,
+                repo_type="dataset",
+                revision=revision
+                )
+            return path_in_repo
+
+        uploaded_paths = []
+        failed_paths = []
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor, open(manifest_path, 'a', encoding='utf-8') as manifest_file:
+            futures = [executor.submit(upload_shard, path_in_repo) for path_in_repo in pending_paths]
+
+            for finished_count, (path_in_repo, future) in enumerate(zip(pending_paths, futures)):
+                try:
+                    uploaded_paths.append(future.result())
+                    manifest_file.write(json.dumps({"repo_id": repo_id, "revision": revision, "path": path_in_repo, "sha256": shard_hashes[path_in_repo]}) + "\n")
+                    manifest_file.flush()
+                except Exception:
+                    failed_paths.append(path_in_repo)
+                progress_cb(f"Uploaded shard {path_in_repo}", (finished_count + 1) / len(pending_paths))
+
+        return uploaded_paths, failed_paths
@@ -0,0 +1,58 @@
+import math
+import os
+import re
+import sys
+
+# Forces XLA to split the host CPU into several devices
+_HOST_DEVICE_COUNT_FLAG = "--xla_force_host_platform_device_count"
+
+def configure_devices(device_count: int|None = None):
+    """
+    Sets the number of devices the model is replicated on, batches are sharded across all of them.
+
+    JAX reads its device configuration once on import, so this has to be called before jax is imported.
+    On CPU hosts XLA is told to expose `device_count` host devices, which lets multi socket / many core
+    machines run several model replicas in parallel. On GPU hosts only the first `device_count` GPUs
+    are made visible, unless CUDA_VISIBLE_DEVICES is already set.
+
+    Parameters:
+        device_count (int|None, optional): The number of devices, None keeps the default of JAX (all GPUs / TPUs or a single CPU device). Defaults to None.
+    """
+    if device_count is None:
+        return
+
+    if device_count < 1:
+        raise Exception(f"The number of devices must be at least 1, got {device_count}")
+
+    if "jax" in sys.modules:
+        raise Exception("The number of devices has to be configured before jax is imported")
+
+    # Replace a flag that is already set instead of appending a conflicting one
+    xla_flags = re.sub(rf"{_HOST_DEVICE_COUNT_FLAG}=\d+", "", os.environ.get("XLA_FLAGS", "")).strip()
+    os.environ["XLA_FLAGS"] = f"{xla_flags} {_HOST_DEVICE_COUNT_FLAG}={device_count}".strip()
+
+    if "CUDA_VISIBLE_DEVICES" not in os.environ:
+        os.environ["CUDA_VISIBLE_DEVICES"] = ",".join(str(device_idx) for device_idx in range(device_count))
+
+def get_device_count() -> int:
+    """
+    Returns the number of local devices the model is replicated on.
+    """
+    import jax
+
+    return jax.local_device_count()
+
+def round_batch_size(batch_size: int, device_count: int|None = None) -> int:
+    """
+    Rounds a batch size up to a multiple of the device count, so every device gets the same share of a batch.
+
+    Parameters:
+        batch_size (int): The requested batch size.
+        device_count (int|None, optional): The number of devices. Defaults to None (the number of local devices).
+
+    Returns:
+        int: The smallest multiple of the device count that is at least `batch_size`.
+    """
+    if device_count is None:
+        device_count = get_device_count()
+    return math.ceil(max(1, batch_size) / device_count) * device_count
@@ -0,0 +1,101 @@
+from typing import Callable, Iterable, Iterator
+import logging
+import os
+
+# Directories of tools and file systems that never contain recordings
+DEFAULT_IGNORED_DIRECTORIES = ("__pycache__", "node_modules", "@eaDir", "$RECYCLE.BIN", "System Volume Information", "lost+found")
+
+class MediaFileWalker:
+    """
+    Walks a directory tree with `os.scandir` and yields matching files as soon as they are found.
+
+    The file type of a directory entry is known from the directory listing on most file systems, so
+    unlike `os.listdir` with `isdir` / `isfile` no extra stat call is needed per entry, which matters on
+    network file systems. Files are filtered by extension and hidden / ignored directories are skipped
+    during the traversal, so they are never listed at all.
+    """
+    def __init__(
+            self,
+            extensions: Iterable[str]|None = None,
+            skip_hidden: bool = True,
+            ignored_directories: Iterable[str] = DEFAULT_IGNORED_DIRECTORIES,
+            follow_symlinks: bool = True,
+            on_error: Callable[[str, OSError], None]|None = None
+            ):
+        """
+        Parameters:
+            extensions (Iterable[str]|None, optional): File extensions without dot, compared case insensitively. None yields every file. Defaults to None.
+            skip_hidden (bool, optional): Whether files and directories starting with "." are skipped. Defaults to True.
+            ignored_directories (Iterable[str], optional): Names of directories that are not entered. Defaults to DEFAULT_IGNORED_DIRECTORIES.
+            follow_symlinks (bool, optional): Whether symlinked directories are entered, every directory is walked once even if links form a cycle. Defaults to True.
+            on_error (Callable[[str, OSError], None]|None, optional): Called with the path of a directory that can't be listed, which is then skipped. Defaults to None (logs a warning).
+        """
+        self.extensions = frozenset(extension.lower().lstrip(".") for extension in extensions) if extensions is not None else None
+        self.skip_hidden = skip_hidden
+        self.ignored_directories = frozenset(ignored_directories)
+        self.follow_symlinks = follow_symlinks
+        self.on_error = on_error or self.log_error
+
+    @staticmethod
+    def log_error(directory: str, error: OSError):
+        logging.warning(f"Skipping directory {directory}: {error}")
+
+    def matches(self, file_name: str) -> bool:
+        """
+        Returns whether a file name has one of the extensions of the walker.
+        """
+        if self.skip_hidden and file_name.startswith("."):
+            return False
+        if self.extensions is None:
+            return True
+        _, dot, extension = file_name.rpartition(".")
+        return dot == "." and extension.lower() in self.extensions
+
+    def walk(self, source_dir: str, on_error: Callable[[str, OSError], None]|None = None) -> Iterator[str]:
+        """
+        Yields the paths of all matching files below `source_dir`, depth first and sorted by name within every directory.
+
+        Parameters:
+            source_dir (str): The directory to walk.
+            on_error (Callable[[str, OSError], None]|None, optional): Called in addition to the on_error of the walker for every directory that can't be listed. Defaults to None.
+
+        Returns:
+            Iterator[str]: The file paths, starting with `source_dir`.
+        """
+        # Directories still to be listed, the next one is popped from the end
+        pending_dirs = [source_dir]
+        # Symlinked directories may form cycles
+        visited_dirs = set()
+
+        while len(pending_dirs) > 0:
+            directory = pending_dirs.pop()
+
+            if self.follow_symlinks:
+                real_path = os.path.realpath(directory)
+                if real_path in visited_dirs:
+                    continue
+                visited_dirs.add(real_path)
+
+            try:
+                with os.scandir(directory) as entries:
+                    sorted_entries = sorted(entries, key=lambda entry: entry.name)
+            except OSError as e:
+                self.on_error(directory, e)
+                if on_error is not None:
+                    on_error(directory, e)
+                continue
+
+            sub_dirs = []
+            for entry in sorted_entries:
+                try:
+                    if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                        if not (self.skip_hidden and entry.name.startswith(".")) and entry.name not in self.ignored_directories:
+                            sub_dirs.append(entry.path)
+                    elif self.matches(entry.name) and entry.is_file():
+                        yield entry.path
+                except OSError:
+                    # The entry was removed while walking or is a broken link
+                    continue
+
+            # Reversed, so the sub directories are walked in name order
+            pending_dirs.extend(reversed(sub_dirs))
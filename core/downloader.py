@@ -1,51 +1,97 @@
-from pytube import YouTube
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 import os
 
+if TYPE_CHECKING:
+    from pytube import YouTube
+
 class YouTubeDownloader:
-    def download(self, url: str, output_path: str = "temp/yt_downloads") -> str:
+    def select_stream(self, yt: "YouTube", audio_only: bool = True):
+        """
+        Selects the stream with the least amount of bytes that still contains the audio track.
+
+        Parameters:
+            yt (YouTube): The YouTube object of the video.
+            audio_only (bool): Whether audio-only streams are preferred over progressive video streams. Defaults to True.
+
+        Returns:
+            Stream: The selected stream.
+        """
+        stream = None
+
+        if audio_only:
+            # Audio-only streams avoid downloading video bytes which are thrown away anyway
+            stream = yt.streams.filter(only_audio=True).order_by('abr').asc().first()
+
+        if stream is None:
+            stream = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').asc().first()
+
+        if stream is None:
+            raise Exception(f"Could not find a downloadable stream for: {yt.watch_url}")
+
+        return stream
+
+    def download(self, url: str, output_path: str = "temp/yt_downloads", audio_only: bool = True) -> str:
         """
         Downloads a file from the given URL and saves it to the specified output path.
 
         Parameters:
             url (str): The URL of the file to be downloaded.
             output_path (str): The path where the downloaded file will be saved. Defaults to "temp/yt_downloads".
+            audio_only (bool): Whether an audio-only stream is downloaded if available. Defaults to True.
 
         Returns:
             str: The path of the downloaded file.
         """
         if not os.path.exists(output_path):
-            os.makedirs(output_path)
-        
-        yt = YouTube(url)
-        saved_path = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').asc().first().download(output_path=output_path)
+            os.makedirs(output_path, exist_ok=True)
+
+        yt = self.open_video(url)
+        # The file name is derived from the title, the video id keeps videos with the same title apart
+        saved_path = self.select_stream(yt, audio_only=audio_only).download(output_path=output_path, filename_prefix=f"{yt.video_id}_")
 
         return saved_path
-    
-    def download_multiple(self, urls: list, output_path: str = "temp/yt_downloads") -> (list[str], list[str]):
+
+    def open_video(self, url: str) -> "YouTube":
+        """
+        Returns the YouTube object of the video at the given URL.
+        """
+        # pytube is only imported once something is downloaded
+        from pytube import YouTube
+
+        return YouTube(url)
+
+    def download_multiple(self, urls: list, output_path: str = "temp/yt_downloads", audio_only: bool = True, max_workers: int = 1) -> (list[str], list[str]):
         """
         Downloads multiple files from a list of URLs and saves them to the specified output path.
 
         Parameters:
             urls (list): A list of URLs from which to download the files.
             output_path (str): The path to the directory where the downloaded files will be saved. Defaults to "temp/yt_downloads".
+            audio_only (bool): Whether audio-only streams are downloaded if available. Defaults to True.
+            max_workers (int): The maximum number of concurrent downloads. Defaults to 1.
 
         Returns:
             tuple: A tuple containing two lists - saved_paths and failed_paths.
-                - saved_paths (list): A list of the paths to the successfully downloaded files.
+                - saved_paths (list): A list of the paths to the successfully downloaded files, in input order.
                 - failed_paths (list): A list of the URLs that failed to download.
         """
         if not os.path.exists(output_path):
             os.makedirs(output_path)
-        
+
         saved_paths = []
         failed_paths = []
 
-        for url in urls:
-            try:
-                # Prevent Exception from causing downloads from stopping
-                saved_paths.append(self.download(url, output_path=output_path))
-            except:
-                failed_paths.append(url)
-                continue
-        
+        # Downloads are I/O bound, so threads are sufficient
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = [executor.submit(self.download, url, output_path=output_path, audio_only=audio_only) for url in urls]
+
+            for url, future in zip(urls, futures):
+                try:
+                    # Prevent Exception from causing downloads from stopping
+                    saved_paths.append(future.result())
+                except:
+                    failed_paths.append(url)
+                    continue
+
         return saved_paths, failed_paths
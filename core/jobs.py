@@ -0,0 +1,268 @@
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import OrderedDict
+from typing import Any, Callable
+import threading
+import queue
+import time
+import uuid
+
+class JobCancelledException(Exception):
+    """
+    Raised inside a job once it was cancelled, so the job stops at the next progress update or model call.
+    """
+    pass
+
+class Job:
+    """
+    A transcription job running in the background, with its progress and result.
+
+    Attributes:
+        job_id (str): The id of the job.
+        description (str): A short description of the inputs of the job.
+        status (str): One of "queued", "running", "completed", "failed" and "cancelled".
+        progress (float): The progress of the current step between 0.0 and 1.0.
+        message (str): The last progress message.
+        result (Any): The return value of the job function once completed.
+        error (str|None): The error message if the job failed.
+    """
+    def __init__(self, job_id: str, description: str = ""):
+        self.job_id = job_id
+        self.description = description
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    def update(self, message: str, progress_amount: float = 0.0):
+        """
+        Progress callback of the job, raises JobCancelledException once the job was cancelled.
+        """
+        self.message = message
+        self.progress = progress_amount
+        if self.cancel_event.is_set():
+            raise JobCancelledException(f"Job {self.job_id} was cancelled")
+
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def to_row(self) -> list:
+        """
+        Returns the job as a row of the job table: id, status, progress, message, result, description.
+        """
+        elapsed_s = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        return [self.job_id, self.status, f"{self.progress:.0%}", f"{self.message} ({elapsed_s:.0f} s)", self.error or self.result or "", self.description]
+
+class InferenceWorker:
+    """
+    A single thread that runs all model calls of all jobs.
+
+    Jobs hand their batches to the worker instead of running the model themselves, so only one model call
+    runs at a time and the accelerator is not oversubscribed. Requests of different jobs for the same model,
+    task and timestamp setting that are waiting at the same time are merged into one call of
+    `transcribe_batch`, so the chunks of several jobs share batches.
+    """
+    def __init__(self, batch_wait_s: float = 0.05, max_merged_requests: int = 64):
+        """
+        Parameters:
+            batch_wait_s (float, optional): How long the worker waits for requests of other jobs before running a call. Defaults to 0.05.
+            max_merged_requests (int, optional): The maximum number of requests collected at once. Defaults to 64.
+        """
+        self.batch_wait_s = batch_wait_s
+        self.max_merged_requests = max_merged_requests
+        self.requests = queue.Queue()
+        self.stats = {"calls": 0, "requests": 0, "merged_requests": 0}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def run(self, function: Callable[[], Any], cancel_event: threading.Event|None = None) -> Any:
+        """
+        Runs a function on the worker thread, e.g. the warmup of a model, and returns its result.
+        """
+        future = Future()
+        self.requests.put(("call", function, future))
+        return self._wait(future, cancel_event)
+
+    def transcribe_batch(self, whisper_model, inputs: list, add_timestamps=True, task="transcribe", cancel_event: threading.Event|None = None) -> list[dict]:
+        """
+        Runs `whisper_model.transcribe_batch` on the worker thread, possibly merged with the inputs of other jobs.
+
+        Parameters:
+            whisper_model (WhisperModel): The model to run.
+            inputs (list): The inputs to be transcribed.
+            add_timestamps (bool, optional): Whether to add timestamps to the transcribed text. Defaults to True.
+            task (str, optional): Either "transcribe" or "translate". Defaults to "transcribe".
+            cancel_event (threading.Event|None, optional): Stops waiting and raises JobCancelledException once set. Defaults to None.
+
+        Returns:
+            list[dict]: The transcribed text per input, in input order.
+        """
+        future = Future()
+        self.requests.put(("batch", (whisper_model, inputs, add_timestamps, task), future))
+        return self._wait(future, cancel_event)
+
+    def _wait(self, future: Future, cancel_event: threading.Event|None):
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except FutureTimeoutError:
+                if cancel_event is not None and cancel_event.is_set():
+                    # A request that is already running finishes, but nobody waits for it anymore
+                    future.cancel()
+                    raise JobCancelledException("Job was cancelled")
+
+    def _collect_requests(self) -> list:
+        requests = [self.requests.get()]
+        deadline = time.monotonic() + self.batch_wait_s
+
+        while len(requests) < self.max_merged_requests:
+            try:
+                requests.append(self.requests.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect_requests()
+            # (model id, add_timestamps, task) -> list of (request arguments, future)
+            batch_groups = OrderedDict()
+
+            for kind, payload, future in requests:
+                # Skips requests of cancelled jobs
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                if kind == "call":
+                    self._run_call(payload, future)
+                else:
+                    whisper_model, _, add_timestamps, task = payload
+                    batch_groups.setdefault((id(whisper_model), add_timestamps, task), []).append((payload, future))
+
+            for group in batch_groups.values():
+                self._run_batch_group(group)
+
+    def _run_call(self, function, future: Future):
+        try:
+            future.set_result(function())
+        except Exception as e:
+            future.set_exception(e)
+
+    def _run_batch_group(self, group: list):
+        whisper_model, _, add_timestamps, task = group[0][0]
+        merged_inputs = [single_input for (_, inputs, _, _), _ in group for single_input in inputs]
+
+        self.stats["calls"] += 1
+        self.stats["requests"] += len(group)
+        self.stats["merged_requests"] += len(group) - 1
+
+        try:
+            transcriptions = whisper_model.transcribe_batch(merged_inputs, add_timestamps=add_timestamps, task=task)
+        except Exception as e:
+            if len(group) == 1:
+                group[0][1].set_exception(e)
+                return
+            # A broken input of one job must not fail the other jobs of the merged call
+            for request in group:
+                self._run_batch_group([request])
+            return
+
+        # Hands every request the transcriptions of its own inputs
+        offset = 0
+        for (_, inputs, _, _), future in group:
+            future.set_result(transcriptions[offset:offset + len(inputs)])
+            offset += len(inputs)
+
+class JobScheduler:
+    """
+    Runs jobs in background threads and keeps their status, so a submit returns immediately with a job id.
+
+    Jobs run concurrently up to `max_concurrent_jobs`, further jobs wait in the queue. Only the most recent
+    `max_finished_jobs` finished jobs are kept.
+    """
+    def __init__(self, max_concurrent_jobs: int = 2, max_finished_jobs: int = 100):
+        """
+        Parameters:
+            max_concurrent_jobs (int, optional): The maximum number of jobs running at the same time. Defaults to 2.
+            max_finished_jobs (int, optional): The number of finished jobs kept for the job list. Defaults to 100.
+        """
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrent_jobs), thread_name_prefix="job")
+
+    def submit(self, function: Callable[[Job], Any], description: str = "") -> str:
+        """
+        Queues a job.
+
+        Parameters:
+            function (Callable[[Job], Any]): Runs the job, receives the Job to report progress with `job.update`.
+            description (str, optional): A short description of the inputs of the job. Defaults to "".
+
+        Returns:
+            str: The id of the job.
+        """
+        job = Job(uuid.uuid4().hex[:8], description=description)
+
+        with self._lock:
+            self.jobs[job.job_id] = job
+            self._forget_finished_jobs()
+
+        self._executor.submit(self._run_job, job, function)
+        return job.job_id
+
+    def get(self, job_id: str) -> Job|None:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> list[Job]:
+        """
+        Returns all known jobs, newest first.
+        """
+        with self._lock:
+            return list(reversed(self.jobs.values()))
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a queued or running job.
+
+        Returns:
+            bool: Whether the job was found and not finished yet.
+        """
+        job = self.get(job_id)
+        if job is None or job.is_finished():
+            return False
+        job.cancel_event.set()
+        return True
+
+    def _run_job(self, job: Job, function: Callable[[Job], Any]):
+        if job.cancel_event.is_set():
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            return
+
+        job.status = "running"
+        job.started_at = time.time()
+
+        try:
+            job.result = function(job)
+            job.status = "completed"
+            job.progress = 1.0
+        except JobCancelledException:
+            job.status = "cancelled"
+        except Exception as e:
+            # A cancelled job may fail with an unrelated error while it is stopped
+            job.status = "cancelled" if job.cancel_event.is_set() else "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+
+    def _forget_finished_jobs(self):
+        finished_job_ids = [job_id for job_id, job in self.jobs.items() if job.is_finished()]
+        for job_id in finished_job_ids[:max(0, len(finished_job_ids) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
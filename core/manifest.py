@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+
+class ProgressManifest:
+    """
+    Append-only JSONL manifest of finished items, so interrupted jobs can be resumed without redoing work.
+
+    Every finished item is appended as one line and flushed to disk immediately. A line that was only
+    partially written because the process died is ignored when the manifest is loaded again.
+    """
+    def __init__(self, output_path: str, resume: bool = False, file_name: str = ".neuraluma_manifest.jsonl"):
+        """
+        Parameters:
+            output_path (str): The output directory the manifest is stored in.
+            resume (bool, optional): Whether the records of an existing manifest are loaded. Otherwise a new manifest is started. Defaults to False.
+            file_name (str, optional): The file name of the manifest. Defaults to ".neuraluma_manifest.jsonl".
+        """
+        self.manifest_path = os.path.join(output_path, file_name)
+        self.records = {}
+        self._lock = threading.Lock()
+
+        if not os.path.exists(output_path):
+            os.makedirs(output_path, exist_ok=True)
+
+        if resume and os.path.exists(self.manifest_path):
+            self.records = self.load(self.manifest_path)
+            # A record that was cut off by a crash would otherwise be glued to the next appended record
+            self._terminate_last_line()
+        elif os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+    @staticmethod
+    def load(manifest_path: str) -> dict:
+        """
+        Loads the records of a manifest.
+
+        Parameters:
+            manifest_path (str): The path of the manifest.
+
+        Returns:
+            dict: The records keyed by item id, later records of the same item overwrite earlier ones.
+        """
+        records = {}
+
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record["item_id"]] = record
+
+        return records
+
+    def is_completed(self, item_id: str) -> bool:
+        """
+        Returns whether an item was already finished.
+        """
+        with self._lock:
+            return item_id in self.records
+
+    def get(self, item_id: str) -> dict|None:
+        """
+        Returns the record of a finished item or None if it wasn't finished yet.
+        """
+        with self._lock:
+            return self.records.get(item_id)
+
+    def get_next_idx(self) -> int:
+        """
+        Returns the output index following the highest index recorded so far.
+        """
+        with self._lock:
+            return max((record["idx"] for record in self.records.values() if record.get("idx") is not None), default=-1) + 1
+
+    def record(self, item_id: str, audio_entry, transcription: dict, idx: int|None = None):
+        """
+        Appends a finished item to the manifest.
+
+        Parameters:
+            item_id (str): The id of the item, e.g. a file path, URL or dataset row.
+            audio_entry (str|dict): The audio entry of the item, waveforms are not stored but the path of a dict entry is.
+            transcription (dict): The transcription of the item.
+            idx (int|None, optional): The output index of the item, used for naming its output files. Defaults to None.
+        """
+        record = {
+            "item_id": item_id,
+            "idx": idx,
+            # Only paths are stored, waveforms of dataset rows would bloat the manifest. The path of a decoded
+            # entry is kept, so a resumed item keeps its output file names and its audio can be decoded again
+            "audio_entry": audio_entry if isinstance(audio_entry, str) else {key: audio_entry[key] for key in ("path", "sampling_rate") if key in audio_entry} if isinstance(audio_entry, dict) else None,
+            "transcription": transcription,
+            "finished_at": time.time(),
+        }
+        # Timestamps may be numpy scalars
+        line = json.dumps(record, ensure_ascii=False, default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+
+        with self._lock:
+            with open(self.manifest_path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.records[item_id] = json.loads(line)
+
+    def _terminate_last_line(self):
+        with open(self.manifest_path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
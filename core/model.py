@@ -1,12 +1,183 @@
 from whisper_jax import FlaxWhisperPipline
+from core.devices import round_batch_size
+import numpy as np
+import itertools
+import os
+import time
+import jax
 import jax.numpy as jnp
 
+# Task that transcribes and translates every chunk, both decoders run on the same encoder output
+COMBINED_TASK = "transcribe+translate"
+
+# Compiled XLA programs are stored here, so later processes skip the compilation of the model
+DEFAULT_COMPILATION_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "neuraluma_whisper", "jax_compilation_cache")
+
 class WhisperModel:
     """
     The Whisper Model to interact with Whisper.
     """
-    def __init__(self, dtype=jnp.float16, batch_size=1, checkpoint="openai/whisper-large-v2"):
+    def __init__(self, dtype=jnp.float16, batch_size=1, checkpoint="openai/whisper-large-v2", compilation_cache_dir: str|None = None, draft_checkpoint: str|None = None, num_draft_tokens: int = 4, lookahead_batches: int = 4):
+        if compilation_cache_dir:
+            self.enable_compilation_cache(compilation_cache_dir)
+        self.checkpoint = checkpoint
+        self.dtype = dtype
+        # The pipeline replicates the parameters on every local device and shards each batch across them,
+        # so the batch size is rounded up to a multiple of the device count
+        self.device_count = jax.local_device_count()
+        if draft_checkpoint and self.device_count > 1:
+            # The speculative decoder runs unsharded on one device, the batches of the other devices would be left idle
+            raise Exception(f"Speculative decoding runs on a single device, but {self.device_count} devices are configured. Use a single device or disable the draft model")
+        batch_size = round_batch_size(batch_size, self.device_count)
+        self.batch_size = batch_size
+        # Number of batches whose chunks are prepared ahead and sorted by length in transcribe_batch
+        self.lookahead_batches = lookahead_batches
         self.pipeline = FlaxWhisperPipline(checkpoint, batch_size=batch_size, dtype=dtype)
+        # Padding statistics accumulated over all calls of transcribe_batch
+        self.padding_stats = {"batches": 0, "chunks": 0, "audio_samples": 0, "padded_samples": 0}
+        # (task, add_timestamps) variants that were already compiled by warmup
+        self.warmed_up_variants = set()
+        # pmapped encoder and decoder of the combined task, created on first use
+        self._p_encode = None
+        self._p_generate_from_encoder = None
+        # Greedy decoding assisted by a small draft model, the output equals the one of plain greedy decoding
+        self.draft_checkpoint = draft_checkpoint
+        self.speculative_decoder = None
+        if draft_checkpoint:
+            from core.speculative import SpeculativeDecoder
+            # The buffers of the replicated parameters on the first device are reused, so the main model isn't held twice
+            single_device_params = jax.tree_util.tree_map(lambda leaf: leaf.addressable_shards[0].data, self.pipeline.params)
+            self.speculative_decoder = SpeculativeDecoder(
+                self.pipeline.model,
+                single_device_params,
+                draft_checkpoint,
+                dtype=dtype,
+                max_length=self.pipeline.max_length,
+                num_draft_tokens=num_draft_tokens
+                )
+    
+    @staticmethod
+    def enable_compilation_cache(cache_dir: str = DEFAULT_COMPILATION_CACHE_DIR):
+        """
+        Enables the persistent compilation cache of JAX for all models of this process.
+
+        Parameters:
+            cache_dir (str, optional): The directory the compiled programs are stored in. Defaults to DEFAULT_COMPILATION_CACHE_DIR.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            jax.config.update("jax_compilation_cache_dir", cache_dir)
+        except AttributeError:
+            # Older JAX versions only offer the experimental API
+            from jax.experimental.compilation_cache import compilation_cache
+            compilation_cache.initialize_cache(cache_dir)
+    
+    @staticmethod
+    def get_compilation_cache_dir() -> str|None:
+        """
+        Returns the directory of the persistent compilation cache or None if it is disabled.
+        """
+        try:
+            return jax.config.jax_compilation_cache_dir or None
+        except AttributeError:
+            from jax.experimental.compilation_cache import compilation_cache
+            return getattr(compilation_cache, "_cache_dir", None) or None
+    
+    def warmup(self, tasks: tuple = ("transcribe", "translate"), add_timestamps_variants: tuple = (False, True)) -> dict:
+        """
+        Compiles the model for the configured batch size and the given task and timestamp variants before the first real input.
+
+        Variants that were already compiled by this model are skipped. With the persistent compilation cache
+        enabled, the compiled programs are loaded from disk instead of being compiled again in later processes.
+
+        Parameters:
+            tasks (tuple, optional): The tasks to compile, "transcribe", "translate" and / or COMBINED_TASK. Defaults to "transcribe" and "translate".
+            add_timestamps_variants (tuple, optional): The timestamp settings to compile. Defaults to both.
+
+        Returns:
+            dict: A dictionary containing the following keys:
+                - "variants" (int): The number of variants compiled by this call.
+                - "compile_s" (float): The time spent compiling in seconds.
+                - "start" (str): "warm" if the persistent compilation cache already contained programs, "cold" otherwise.
+        """
+        compilation_cache_dir = self.get_compilation_cache_dir()
+        is_warm_start = compilation_cache_dir is not None and os.path.isdir(compilation_cache_dir) and len(os.listdir(compilation_cache_dir)) > 0
+
+        feature_extractor = self.pipeline.feature_extractor
+        input_features = np.zeros((self.batch_size, feature_extractor.feature_size, feature_extractor.nb_max_frames), dtype=np.float32)
+
+        variants = [(task, add_timestamps) for task in tasks for add_timestamps in add_timestamps_variants if (task, add_timestamps) not in self.warmed_up_variants]
+        start_time = time.perf_counter()
+        # Draft tokens of the silent warmup input don't count towards the acceptance rate
+        speculative_stats = dict(self.speculative_decoder.stats) if self.speculative_decoder is not None else None
+
+        for task, add_timestamps in variants:
+            if self.speculative_decoder is not None:
+                self.forward_speculative(input_features, tasks=("transcribe", "translate") if task == COMBINED_TASK else (task,), add_timestamps=add_timestamps)
+            elif task == COMBINED_TASK:
+                self.forward_shared_encoder(input_features, tasks=("transcribe", "translate"), add_timestamps=add_timestamps)
+            else:
+                # forward consumes the input dict, so a new one is passed for every variant
+                self.pipeline.forward({"input_features": input_features}, batch_size=self.batch_size, task=task, return_timestamps=add_timestamps)
+            self.warmed_up_variants.add((task, add_timestamps))
+
+        if speculative_stats is not None:
+            self.speculative_decoder.stats = speculative_stats
+
+        return {"variants": len(variants), "compile_s": time.perf_counter() - start_time, "start": "warm" if is_warm_start else "cold"}
+    
+    @staticmethod
+    def estimate_memory_footprint(checkpoint: str, dtype=jnp.float16, draft_checkpoint: str|None = None) -> int:
+        """
+        Estimates the memory `memory_footprint` will report for a model before it is loaded, only the configs of the checkpoints are fetched.
+
+        Parameters:
+            checkpoint (str): The HF checkpoint of the model.
+            dtype: The JAX dtype of the model. Defaults to jnp.float16.
+            draft_checkpoint (str|None, optional): The HF checkpoint of the draft model for speculative decoding. Defaults to None.
+
+        Returns:
+            int: The estimated size of all parameter arrays in bytes.
+        """
+        from transformers import WhisperConfig
+
+        itemsize = jnp.dtype(dtype).itemsize
+        parameter_count = WhisperModel.count_parameters(WhisperConfig.from_pretrained(checkpoint))
+        # The pipeline holds a copy of the parameters per device
+        footprint = parameter_count * itemsize * jax.local_device_count()
+        if draft_checkpoint:
+            # The speculative decoder shares the parameters of the main model with the pipeline and only adds the draft model
+            footprint += WhisperModel.count_parameters(WhisperConfig.from_pretrained(draft_checkpoint)) * itemsize
+        return footprint
+
+    @staticmethod
+    def count_parameters(config) -> int:
+        """
+        Returns the number of parameters of a Whisper model with the given WhisperConfig.
+        """
+        d_model = config.d_model
+        attention = 4 * d_model * d_model + 3 * d_model
+        encoder_layer = attention + 2 * d_model + 2 * config.encoder_ffn_dim * d_model + config.encoder_ffn_dim + 3 * d_model
+        decoder_layer = 2 * attention + 4 * d_model + 2 * config.decoder_ffn_dim * d_model + config.decoder_ffn_dim + 3 * d_model
+
+        # Convolutions of the mel features, positional embeddings, the layers and the final layer norms,
+        # the output projection shares the token embedding
+        encoder = 3 * config.num_mel_bins * d_model + 3 * d_model * d_model + 2 * d_model + config.max_source_positions * d_model + config.encoder_layers * encoder_layer + 2 * d_model
+        decoder = (config.vocab_size + config.max_target_positions) * d_model + config.decoder_layers * decoder_layer + 2 * d_model
+        return encoder + decoder
+
+    def memory_footprint(self) -> int:
+        """
+        Estimates the memory used by the model parameters.
+
+        Returns:
+            int: The size of all parameter arrays in bytes.
+        """
+        params = [self.pipeline.params]
+        if self.speculative_decoder is not None:
+            # The parameters of the main model are the buffers of the pipeline on the first device
+            params.append(self.speculative_decoder.draft_params)
+        return sum(leaf.nbytes for leaf in jax.tree_util.tree_leaves(params))
     
     def transcribe(self, inputs, add_timestamps=True) -> dict:
         """
@@ -49,3 +220,199 @@ class WhisperModel:
         text = self.pipeline(inputs, task="translate", return_timestamps=add_timestamps)
 
         return text
+    
+    def transcribe_batch(self, inputs: list, add_timestamps=True, task="transcribe") -> list[dict]:
+        """
+        Transcribes or translates multiple inputs at once by packing their 30 s chunks into shared batches.
+
+        Chunks of short inputs are combined with chunks of other inputs, so batches are filled even if
+        every single input is shorter than `batch_size` chunks. Chunks are scheduled longest first, so the
+        shorter final chunks of all inputs share batches instead of being padded next to full chunks.
+
+        The log-mel features of the chunks are computed lazily and only a window of `lookahead_batches`
+        batches is held in memory and sorted, so long inputs and large merged batches stay bounded in memory.
+
+        Parameters:
+            inputs (list): The inputs to be transcribed, every element may be of any type accepted by `transcribe`.
+            add_timestamps (bool, optional): Whether to add timestamps to the transcribed text. Defaults to True.
+            task (str, optional): Either "transcribe", "translate" or COMBINED_TASK. Defaults to "transcribe".
+
+        Returns:
+            list[dict]: The transcribed text per input, in input order. With COMBINED_TASK every transcription
+                has an additional "translation" key with the translated text (and chunks).
+        """
+        tasks = ("transcribe", "translate") if task == COMBINED_TASK else (task,)
+
+        def iter_chunks():
+            # (input_idx, chunk_idx, input_features, stride) for every chunk of every input, computed on demand
+            for input_idx, single_input in enumerate(inputs):
+                chunk_idx = 0
+                for processed_batch in self.pipeline.preprocess_batch(single_input, batch_size=self.batch_size):
+                    for input_features, stride in zip(processed_batch["input_features"], processed_batch["stride"]):
+                        yield (input_idx, chunk_idx, input_features, stride)
+                        chunk_idx += 1
+
+        chunk_iterator = iter_chunks()
+        window_size = self.batch_size * max(1, self.lookahead_batches)
+        pending_chunks = []
+        window_samples = self.pipeline.feature_extractor.n_samples
+
+        # task -> model outputs per input
+        model_outputs_per_input = {output_task: [[] for _ in inputs] for output_task in tasks}
+
+        while True:
+            # The window is refilled after every batch, so short chunks wait for each other while full chunks go first
+            pending_chunks.extend(itertools.islice(chunk_iterator, window_size - len(pending_chunks)))
+            if len(pending_chunks) == 0:
+                break
+
+            # Longest chunks first, stride[0] is the number of audio samples in the chunk
+            pending_chunks.sort(key=lambda chunk: chunk[3][0], reverse=True)
+            batch_chunks = pending_chunks[:self.batch_size]
+            del pending_chunks[:self.batch_size]
+            model_inputs = {
+                "input_features": np.stack([input_features for _, _, input_features, _ in batch_chunks]),
+                "stride": [stride for _, _, _, stride in batch_chunks],
+            }
+            if self.speculative_decoder is not None:
+                tokens_per_task = self.forward_speculative(model_inputs["input_features"], tasks=tasks, add_timestamps=add_timestamps)
+            elif task == COMBINED_TASK:
+                tokens_per_task = self.forward_shared_encoder(model_inputs["input_features"], tasks=tasks, add_timestamps=add_timestamps)
+            else:
+                # forward pads the last, partially filled batch up to batch_size
+                tokens_per_task = {task: self.pipeline.forward(model_inputs, batch_size=self.batch_size, task=task, return_timestamps=add_timestamps)["tokens"]}
+
+            self.padding_stats["batches"] += 1
+            self.padding_stats["chunks"] += len(batch_chunks)
+            self.padding_stats["audio_samples"] += sum(stride[0] for _, _, _, stride in batch_chunks)
+            self.padding_stats["padded_samples"] += self.batch_size * window_samples
+
+            # Scatter the generated tokens back to the input their chunk came from
+            for output_task, tokens in tokens_per_task.items():
+                for row_idx, (input_idx, chunk_idx, _, stride) in enumerate(batch_chunks):
+                    model_outputs_per_input[output_task][input_idx].append((chunk_idx, {
+                        "tokens": tokens[row_idx:row_idx + 1],
+                        "stride": [stride],
+                    }))
+
+        # postprocess merges the overlapping chunks, so they have to be in their original order again
+        transcriptions_per_task = {
+            output_task: [
+                self.pipeline.postprocess([model_output for _, model_output in sorted(model_outputs, key=lambda output: output[0])], return_timestamps=add_timestamps) 
+                for model_outputs in model_outputs_per_task
+                ]
+            for output_task, model_outputs_per_task in model_outputs_per_input.items()
+            }
+
+        if task == COMBINED_TASK:
+            return [
+                {**transcription, "translation": translation}
+                for transcription, translation in zip(transcriptions_per_task["transcribe"], transcriptions_per_task["translate"])
+                ]
+        return transcriptions_per_task[task]
+
+    def forward_shared_encoder(self, input_features: np.ndarray, tasks: tuple = ("transcribe", "translate"), add_timestamps=False) -> dict:
+        """
+        Runs the encoder once on a batch of chunks and decodes its output once per task.
+
+        Parameters:
+            input_features (np.ndarray): The log-mel features of up to `batch_size` chunks, padded up to `batch_size` here.
+            tasks (tuple, optional): The tasks decoded from the shared encoder output. Defaults to ("transcribe", "translate").
+            add_timestamps (bool, optional): Whether timestamp tokens are generated. Defaults to False.
+
+        Returns:
+            dict: The generated tokens per task, shaped like the "tokens" returned by the forward of the pipeline.
+        """
+        from flax.core.frozen_dict import freeze
+        from flax.training.common_utils import shard
+
+        if getattr(self.pipeline, "is_sharded", False):
+            raise Exception("The combined task is not supported for pipelines with sharded parameters")
+
+        input_batch_size = input_features.shape[0]
+        if input_batch_size != self.batch_size:
+            padding = np.zeros([self.batch_size - input_batch_size, *input_features.shape[1:]], input_features.dtype)
+            input_features = np.concatenate([input_features, padding])
+
+        p_encode, p_generate_from_encoder = self._get_shared_encoder_functions()
+        params = freeze(self.pipeline.params)
+        sharded_input_features = shard(input_features)
+        # Stays on the devices, both decoders read it from there
+        encoder_hidden_states = p_encode(params, sharded_input_features)
+
+        tokens_per_task = {}
+        for task in tasks:
+            forced_decoder_ids = self.pipeline.get_forced_decoder_ids(task=task, return_timestamps=add_timestamps)
+            sequences = p_generate_from_encoder(params, sharded_input_features, encoder_hidden_states, forced_decoder_ids, add_timestamps)
+            sequences = jax.device_get(sequences.reshape(-1, self.pipeline.max_length))[:input_batch_size]
+            tokens_per_task[task] = sequences[:, None, :]
+
+        return tokens_per_task
+
+    def forward_speculative(self, input_features: np.ndarray, tasks: tuple, add_timestamps: bool = False) -> dict:
+        """
+        Generates the tokens of a batch of chunks with the speculative decoder, the encoders run once for all tasks.
+
+        Parameters:
+            input_features (np.ndarray): The log-mel features of up to `batch_size` chunks.
+            tasks (tuple): The tasks to generate, "transcribe" and / or "translate".
+            add_timestamps (bool, optional): Whether timestamp tokens are generated. Defaults to False.
+
+        Returns:
+            dict: The generated tokens per task, shaped like the "tokens" returned by the forward of the pipeline.
+        """
+        # Padded like the pipeline pads its batches, so every batch reuses the same compiled functions
+        input_batch_size = input_features.shape[0]
+        if input_batch_size != self.batch_size:
+            padding = np.zeros([self.batch_size - input_batch_size, *input_features.shape[1:]], input_features.dtype)
+            input_features = np.concatenate([input_features, padding])
+
+        forced_decoder_ids_per_task = {task: self.pipeline.get_forced_decoder_ids(task=task, return_timestamps=add_timestamps) for task in tasks}
+        sequences_per_task = self.speculative_decoder.generate(input_features, forced_decoder_ids_per_task, return_timestamps=add_timestamps)
+
+        return {task: sequences[:input_batch_size, None, :] for task, sequences in sequences_per_task.items()}
+
+    def get_acceptance_rate(self) -> float|None:
+        """
+        Returns the share of the draft tokens accepted by the speculative decoder, None if it isn't enabled.
+        """
+        if self.speculative_decoder is None:
+            return None
+        return self.speculative_decoder.get_acceptance_rate()
+
+    def _get_shared_encoder_functions(self):
+        if self._p_encode is None:
+            from transformers.modeling_flax_outputs import FlaxBaseModelOutput
+            model = self.pipeline.model
+            max_length = self.pipeline.max_length
+
+            def encode(params, input_features):
+                return model.encode(input_features=input_features, params=params).last_hidden_state
+
+            def generate_from_encoder(params, input_features, encoder_hidden_states, forced_decoder_ids, return_timestamps):
+                # Same call as the generate of the pipeline, its static processor accepts the traced forced decoder ids.
+                # generate skips the encoder if encoder_outputs are passed, input_features only determine the batch size
+                return model.pipeline_generate(
+                    input_features,
+                    params=params,
+                    encoder_outputs=FlaxBaseModelOutput(last_hidden_state=encoder_hidden_states),
+                    forced_decoder_ids=forced_decoder_ids,
+                    return_timestamps=return_timestamps,
+                    max_length=max_length
+                    ).sequences
+
+            self._p_encode = jax.pmap(encode, "input_features", in_axes=(0, 0))
+            self._p_generate_from_encoder = jax.pmap(generate_from_encoder, "input_features", in_axes=(0, 0, 0, None), static_broadcasted_argnums=(4,))
+
+        return self._p_encode, self._p_generate_from_encoder
+    
+    def get_padding_ratio(self) -> float:
+        """
+        Returns the share of the processed 30 s windows (including empty batch rows) that was padding.
+
+        Returns:
+            float: The padding ratio between 0.0 and 1.0.
+        """
+        if self.padding_stats["padded_samples"] == 0:
+            return 0.0
+        return 1.0 - self.padding_stats["audio_samples"] / self.padding_stats["padded_samples"]
@@ -1,12 +1,26 @@
-from core.model import WhisperModel
-from core.converter import AudioConverter
+from core.model import WhisperModel, COMBINED_TASK
+from core.registry import model_registry
+from core.converter import AudioConverter, AUDIO_FILE_EXTENSIONS, VIDEO_FILE_EXTENSIONS
+from core.downloader import YouTubeDownloader
+from core.stages import StagedPipeline
+from core.scheduling import LengthBucketScheduler
+from core.cache import TranscriptionCache
+from core.manifest import ProgressManifest
+from core.vad import VoiceActivityDetector, SpeechRegions
+from core.dataset_writer import ShardedDatasetWriter, DatasetShardUploader
+from core.workspace import JobWorkspace
+from core.jobs import InferenceWorker
+from core.progress import ProgressTracker
+from core.discovery import MediaFileWalker
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import os
-import shutil
 import jax.numpy as jnp
-from datasets import load_dataset, Dataset, Audio, concatenate_datasets
+
+# Value of translate that transcribes and translates every input in one pass, sharing the encoder
+TRANSLATE_BOTH = "both"
 
 # ToDo: Refactoring, less clutter and better type hints
-# ToDo: Make return values also be returnable directly so it can be used in workflows
 # ToDo: Accept other audio and video formats
 class NeuraLumaWhisperPipeline:
     def __init__(
@@ -16,29 +30,91 @@ class NeuraLumaWhisperPipeline:
             hf_checkpoint='openai/whisper-large-v2', 
             hf_load_dataset_options=None, 
             progress_cb=lambda: None,
-            hf_token = None
+            hf_token = None,
+            whisper_model: WhisperModel|None = None,
+            decode_in_memory=False,
+            max_workers=1,
+            download_workers=1,
+            queue_size=4,
+            length_bucketing=False,
+            transcription_cache: TranscriptionCache|None = None,
+            vad: VoiceActivityDetector|None = None,
+            workspace: JobWorkspace|None = None,
+            inference_worker: InferenceWorker|None = None,
+            cancel_event=None,
+            progress_tracker: ProgressTracker|None = None,
+            file_walker: MediaFileWalker|None = None
             ):
         self.audio_converter = AudioConverter()
-        self.whisper_model = WhisperModel(dtype=dtype, batch_size=batch_size, checkpoint=hf_checkpoint)
+        # Decode audio and video directly to a 16 kHz waveform instead of converting videos to mp3 files first
+        self.decode_in_memory = decode_in_memory
+        # Number of worker threads decoding / converting media files, None uses all CPUs
+        self.max_workers = max_workers
+        # Number of concurrent YouTube downloads
+        self.download_workers = download_workers
+        # Maximum number of prepared items waiting between the download, decode and inference stages
+        self.queue_size = queue_size
+        # Probe durations up front and schedule inputs of similar length together, longest first
+        self.length_bucketing = length_bucketing
+        self.length_bucket_scheduler = LengthBucketScheduler()
+        # Previously transcribed audio is looked up here before running the model
+        self.transcription_cache = transcription_cache
+        # Splits inputs into speech regions, so silence is never run through the model
+        self.vad = vad
+        # Private scratch directory of this job for downloads, converted audio and dataset shards
+        self.workspace = workspace or JobWorkspace()
+        # A workspace created here belongs to the pipeline, which removes it once its transcriptions are finished
+        self.owns_workspace = workspace is None
+        # Shared worker that runs the model calls of all jobs, None runs the model on the calling thread
+        self.inference_worker = inference_worker
+        # Set when the job is cancelled, stops waiting for the inference worker
+        self.cancel_event = cancel_event
+        # Receives the typed events of the download, decode, model and writer stages and aggregates their timing
+        self.progress_tracker = progress_tracker or ProgressTracker()
+        # Finds the media files of source directories, non media files and hidden directories are skipped while walking
+        self.file_walker = file_walker or MediaFileWalker(extensions=AUDIO_FILE_EXTENSIONS + VIDEO_FILE_EXTENSIONS)
+        # Reuse a warm model from the shared registry unless a model is passed in explicitly
+        if whisper_model is None:
+            whisper_model = model_registry.get(checkpoint=hf_checkpoint, dtype=dtype, batch_size=batch_size)
+        self.whisper_model = whisper_model
         self.audio_data_entries = None
+        # Identifies the loaded dataset in the progress manifest
+        self.dataset_id = None
+        # Records finished items in the output directory while transcribing, so interrupted jobs can be resumed
+        self.manifest = None
+        # Output index of the next finished item
+        self.next_item_idx = 0
+        # Whether audio_data_entries is a lazily evaluated iterable of a streamed dataset instead of a list
+        self.stream_audio_data_entries = False
         self.progress_cb = progress_cb # Callback used to track progress e.g. CLI print to stdout or gradio app with gr.Progress()
         self.hf_token = hf_token
 
         # ToDo: Check if subsets work properly
         # ToDo: Check whether local datasets work as well
         if hf_load_dataset_options:
+            # datasets is slow to import and only needed for dataset inputs
+            from datasets import load_dataset
+            streaming = hf_load_dataset_options.get("streaming", False)
             self.progress_cb("Loading dataset", 0.0)
-            loaded_dataset = load_dataset(
-                path=hf_load_dataset_options["source"], 
-                name=hf_load_dataset_options["subset"],
-                revision=hf_load_dataset_options["revision"], 
-                split=hf_load_dataset_options["split"],
-                use_auth_token=self.hf_token
-                )
+            with self.progress_tracker.time_stage("load_dataset", item_id=hf_load_dataset_options["source"]):
+                loaded_dataset = load_dataset(
+                    path=hf_load_dataset_options["source"], 
+                    name=hf_load_dataset_options["subset"],
+                    revision=hf_load_dataset_options["revision"], 
+                    split=hf_load_dataset_options["split"],
+                    use_auth_token=self.hf_token,
+                    streaming=streaming
+                    )
             self.progress_cb("Loaded dataset", 1.0)
+            self.dataset_id = ":".join(str(hf_load_dataset_options[key]) for key in ("source", "subset", "split", "revision"))
             
             # ToDo: If an error occurs here it might be due to: wrong column name, wrong split. wrong subset. add warning here
-            self.audio_data_entries = [audio_data_entry[hf_load_dataset_options["audio_column"]] for audio_data_entry in loaded_dataset]
+            if streaming:
+                # Rows are only downloaded and decoded once they are transcribed
+                self.audio_data_entries = (audio_data_entry[hf_load_dataset_options["audio_column"]] for audio_data_entry in loaded_dataset)
+                self.stream_audio_data_entries = True
+            else:
+                self.audio_data_entries = [audio_data_entry[hf_load_dataset_options["audio_column"]] for audio_data_entry in loaded_dataset]
             
     # ToDo: Move to utility class
     def is_directory_or_file(self, path):
@@ -52,74 +128,138 @@ class NeuraLumaWhisperPipeline:
     # ToDo: Move to utility class
     def is_audio_or_video(self, file_path):
         _, file = os.path.split(file_path)
-        file_type = file.split(".")[-1]
+        file_type = file.split(".")[-1].lower()
 
-        if file_type == "mp3":
+        if file_type in AUDIO_FILE_EXTENSIONS:
             return "audio"
-        elif file_type == "mp4":
+        elif file_type in VIDEO_FILE_EXTENSIONS:
             return "video"
         else:
             return None
 
-    def transcribe(self, source_path, output_path=None, hf_save_dataset_options=None, youtube_urls=[], add_timestamps=False, translate=False, cleanup=True):
-        source_path_type = self.is_directory_or_file(source_path)
+    # ToDo: Move to utility class
+    def get_audio_entry_name(self, audio_entry):
+        if isinstance(audio_entry, str):
+            return os.path.basename(audio_entry).split(".")[0]
+        elif isinstance(audio_entry, dict) and isinstance(audio_entry.get("path"), str):
+            return os.path.basename(audio_entry["path"]).split(".")[0]
+        else:
+            return None
 
-        transcriptions = []
+    def transcribe(self, source_path, output_path=None, hf_save_dataset_options=None, youtube_urls=[], add_timestamps=False, translate=False, cleanup=True, resume=False):
+        padding_stats_before = dict(self.whisper_model.padding_stats)
+
+        try:
+            # Structure: keys: idx: int, item_id: str, audio_entry: str | dict, transcription: dict
+            hf_dataset_writer = None
+            if hf_save_dataset_options:
+                hf_dataset_writer = self.create_hf_dataset_writer(hf_save_dataset_options, add_timestamps=add_timestamps, resume=resume)
+
+            # Outputs are written as soon as a transcription finishes, the workspace is kept for the dataset push
+            for transcription in self._iter_transcriptions(
+                    source_path=source_path, 
+                    youtube_urls=youtube_urls, 
+                    add_timestamps=add_timestamps, 
+                    translate=translate, 
+                    output_path=output_path, 
+                    resume=resume, 
+                    keep_audio=hf_save_dataset_options is not None
+                    ):
+                if output_path:
+                    # Set base_output_filename to idx_ + audio_entry name if it has a path else idx
+                    audio_entry_name = self.get_audio_entry_name(transcription["audio_entry"])
+                    base_output_filename = str(transcription["idx"]) + "_" + audio_entry_name if audio_entry_name else str(transcription["idx"])
+                    self.write_transcription_to_file(transcription=transcription, base_ouput_filename=base_output_filename, output_path=output_path, translate=translate, add_timestamps=add_timestamps)
+            
+                if hf_dataset_writer is not None and not hf_dataset_writer.is_written(transcription["idx"]):
+                    # Resumed items that finished after the last shard of the interrupted run still need their audio
+                    transcription = self.restore_audio_entry(transcription)
+                    if transcription is not None:
+                        with self.progress_tracker.time_stage("write_dataset", item_id=str(transcription["idx"])):
+                            hf_dataset_writer.add(transcription)
+                
+            if hf_dataset_writer is not None:
+                with self.progress_tracker.time_stage("write_dataset", items=0):
+                    hf_dataset_writer.close()
+                if hf_save_dataset_options.get("target"):
+                    self.push_hf_dataset(hf_dataset_writer.local_path, hf_save_dataset_options, resume=resume)
+        finally:
+            # Downloads and converted audio are removed even if the job fails or is cancelled
+            if cleanup:
+                self.workspace.cleanup()
+                self.progress_cb("Removed the job workspace", 0.0)
+
+        # The inference worker merges the batches of concurrent jobs, the shared counters can't be attributed to this job then
+        padded_samples = self.whisper_model.padding_stats["padded_samples"] - padding_stats_before["padded_samples"]
+        if self.inference_worker is None and padded_samples > 0:
+            audio_samples = self.whisper_model.padding_stats["audio_samples"] - padding_stats_before["audio_samples"]
+            self.progress_cb(f"Padding ratio of batched inference: {1.0 - audio_samples / padded_samples:.1%}", 1.0)
+        self.progress_cb("Finished transcribing!", 1.0)
 
-        # Structure: keys: audio_entry: str | dict, transcription: dict
+    def iter_transcriptions(self, source_path=None, youtube_urls=[], add_timestamps=False, translate=False, output_path=None, resume=False, keep_audio=True):
+        """
+        Transcribes all sources and yields every transcription as soon as it is finished.
+
+        Parameters:
+            source_path (str|None): A path to an audio / video file or a directory. Defaults to None.
+            youtube_urls (list[str]): URLs of YouTube videos. Defaults to [].
+            add_timestamps (bool): Whether timestamps are added. Defaults to False.
+            translate (bool|str): Whether the audio is translated to english instead of transcribed. TRANSLATE_BOTH returns
+                both, the translation is stored in the "translation" key of every transcription. Defaults to False.
+            output_path (str|None): The output directory the progress manifest is stored in, None disables the manifest. Defaults to None.
+            resume (bool): Whether items recorded in the manifest of a previous run are taken from there instead of transcribing them again. Defaults to False.
+            keep_audio (bool): Whether decoded waveforms are kept in the yielded audio entries. Defaults to True.
+
+        Returns:
+            Iterator[dict]: Dicts with the keys idx, item_id, audio_entry and transcription in order of completion. 
+                idx is a stable output index, which is also kept for resumed items.
+
+        A workspace created by the pipeline itself is removed once the iteration ends, also if it fails or is stopped early.
+        A workspace passed to the pipeline is left to its owner.
+        """
+        try:
+            yield from self._iter_transcriptions(
+                source_path=source_path,
+                youtube_urls=youtube_urls,
+                add_timestamps=add_timestamps,
+                translate=translate,
+                output_path=output_path,
+                resume=resume,
+                keep_audio=keep_audio
+                )
+        finally:
+            if self.owns_workspace:
+                self.workspace.cleanup()
 
-        if source_path_type is None and len(youtube_urls) <= 0:
+    def _iter_transcriptions(self, source_path=None, youtube_urls=[], add_timestamps=False, translate=False, output_path=None, resume=False, keep_audio=True):
+        source_path_type = self.is_directory_or_file(source_path)
+        youtube_urls = [youtube_url for youtube_url in youtube_urls if youtube_url.strip()]
+
+        if source_path_type is None and len(youtube_urls) <= 0 and self.audio_data_entries is None:
             raise Exception("Source path is not a directory or a file.")
-        
-        # ToDo: Count total transcriptions for progress tracking
-
-        file_transcript = None
-        directory_transcriptions = None
-        youtube_transcriptions = None
-        raw_transcriptions = None
-
-        # Transcribing all sources
-        if source_path_type == 'file':
-            source_dir, source_file = os.path.split(source_path)
-            file_transcript = self.transcribe_file(source_dir=source_dir, source_file=source_file, output_path=output_path, add_timestamps=add_timestamps, translate=translate)
-        elif source_path_type == 'directory':
-            source_dir = source_path
-            directory_transcriptions = self.transcribe_dir(source_dir=source_dir, add_timestamps=add_timestamps, translate=translate)
-        
-        if len(youtube_urls) > 0:
-            youtube_transcriptions = self.transcribe_youtube(youtube_urls=youtube_urls, output_path=output_path, add_timestamps=add_timestamps, translate=translate)
-        
-        if self.audio_data_entries and len(self.audio_data_entries) > 0:
-            raw_transcriptions = self.transcribe_raw_audio(data_entries=self.audio_data_entries, add_timestamps=add_timestamps, translate=translate)
-        
-        # Appending transcriptions
-        if file_transcript is not None:
-            transcriptions.append(file_transcript)
-        
-        if directory_transcriptions is not None:
-            transcriptions.extend(directory_transcriptions)
-        
-        if youtube_transcriptions is not None:
-            transcriptions.extend(youtube_transcriptions)
-        
-        if raw_transcriptions is not None:
-            transcriptions.extend(raw_transcriptions)
-
-        if output_path:
-            for idx, transcription in enumerate(transcriptions):
-                # Set base_output_filename to idx_ + audio_entry if is str else idx
-                base_output_filename = str(idx) + "_" + os.path.basename(transcription["audio_entry"]).split(".")[0] if isinstance(transcription["audio_entry"], str) else str(idx)
-                self.write_transcription_to_file(transcription=transcription, base_ouput_filename=base_output_filename, output_path=output_path, translate=translate, add_timestamps=add_timestamps)
-                
-        if hf_save_dataset_options:
-            self.write_transcriptions_to_hf_dataset(transcriptions=transcriptions, hf_save_dataset_options=hf_save_dataset_options, add_timestamps=add_timestamps, translate=translate)
-
-        # ToDo: Make this conditional, perhaps put this in another command
-        if cleanup:
-            self.progress_cb("Cleaning up and removing temp folder", 0.0)
-            if os.path.exists('temp'):
-                shutil.rmtree('temp')
-        self.progress_cb("Finished transcribing!", 1.0)
+
+        self.manifest = ProgressManifest(output_path, resume=resume) if output_path else None
+        self.next_item_idx = self.manifest.get_next_idx() if self.manifest is not None else 0
+
+        def iter_all_sources():
+            if source_path_type == 'file':
+                source_dir, source_file = os.path.split(source_path)
+                yield self.transcribe_file(source_dir=source_dir, source_file=source_file, output_path=output_path, add_timestamps=add_timestamps, translate=translate)
+            elif source_path_type == 'directory':
+                yield from (transcription for _, transcription in self.iter_transcribe_dir(source_dir=source_path, add_timestamps=add_timestamps, translate=translate))
+            
+            if len(youtube_urls) > 0:
+                yield from (transcription for _, transcription in self.iter_transcribe_youtube(youtube_urls=youtube_urls, add_timestamps=add_timestamps, translate=translate))
+            
+            if self.stream_audio_data_entries or (self.audio_data_entries and len(self.audio_data_entries) > 0):
+                yield from self.iter_transcribe_raw_audio(data_entries=self.audio_data_entries, add_timestamps=add_timestamps, translate=translate)
+
+        for transcription in iter_all_sources():
+            if not keep_audio:
+                # Waveforms are dropped as early as possible, so memory stays bounded for large jobs
+                transcription = {**transcription, 'audio_entry': self.strip_audio_entry(transcription['audio_entry'])}
+            yield transcription
+
     def get_timestamped_sbv_text(self, transcription):
         output = []
         for chunk in transcription['transcription']['chunks']:
@@ -144,7 +284,23 @@ class NeuraLumaWhisperPipeline:
         
         return "\n\n".join(output)
     
+    @staticmethod
+    def get_task(translate):
+        """
+        Returns the model task of a translate setting, either False, True or TRANSLATE_BOTH.
+        """
+        if translate == TRANSLATE_BOTH:
+            return COMBINED_TASK
+        return "translate" if translate else "transcribe"
+
     def write_transcription_to_file(self, transcription, base_ouput_filename, output_path, translate=False, add_timestamps=False):
+        if translate == TRANSLATE_BOTH:
+            # The transcription and its translation are written like the outputs of two separate jobs
+            self.write_transcription_to_file(transcription, base_ouput_filename, output_path, translate=False, add_timestamps=add_timestamps)
+            translation = transcription['transcription'].get('translation', {'text': '', 'chunks': []})
+            self.write_transcription_to_file({**transcription, 'transcription': translation}, base_ouput_filename, output_path, translate=True, add_timestamps=add_timestamps)
+            return
+
         if not translate:
             base_output_filename = base_ouput_filename + ".transcription"
         else:
@@ -153,194 +309,541 @@ class NeuraLumaWhisperPipeline:
         if not os.path.exists(output_path):
             os.makedirs(output_path)
         
-        self.progress_cb(f"Writing {'transcription' if not translate else 'translation'} to file", 0.0)
-        with open(os.path.join(output_path, base_output_filename + ".txt"), 'w') as f:
-            f.write(transcription['transcription']['text'])
-        self.progress_cb("Done!", 1.0)
-        
-        if add_timestamps:
-            self.progress_cb(f"Writing {'transcription' if not translate else 'translation'} timestamps to file", 0.0)
-            with open(os.path.join(output_path, base_output_filename + ".sbv"), "w", encoding="utf-8") as sbv_file:
-                sbv_text = self.get_timestamped_sbv_text(transcription)
-                # Write the timestamp and text to the file
-                sbv_file.write(sbv_text)
+        with self.progress_tracker.time_stage("write_files", item_id=base_ouput_filename) as measurement:
+            self.progress_cb(f"Writing {'transcription' if not translate else 'translation'} to file", 0.0)
+            with open(os.path.join(output_path, base_output_filename + ".txt"), 'w') as f:
+                f.write(transcription['transcription']['text'])
+            measurement["bytes"] = os.path.getsize(os.path.join(output_path, base_output_filename + ".txt"))
             self.progress_cb("Done!", 1.0)
+            
+            if add_timestamps:
+                self.progress_cb(f"Writing {'transcription' if not translate else 'translation'} timestamps to file", 0.0)
+                with open(os.path.join(output_path, base_output_filename + ".sbv"), "w", encoding="utf-8") as sbv_file:
+                    sbv_text = self.get_timestamped_sbv_text(transcription)
+                    # Write the timestamp and text to the file
+                    sbv_file.write(sbv_text)
+                measurement["bytes"] += os.path.getsize(os.path.join(output_path, base_output_filename + ".sbv"))
+                self.progress_cb("Done!", 1.0)
     
-    def write_transcriptions_to_hf_dataset(self, transcriptions, hf_save_dataset_options, add_timestamps=False, translate=False):
-        if not transcriptions or len(transcriptions) <= 0:
-            return
-        
-        # Build a dataset from audio source entries and transcriptions
-        # Check if audio_source_entries is a list of strings or is list of dicts (probably a hf dataset)
-
-        # We already have a list of paths most likely
-        audio_column_name = hf_save_dataset_options["audio_column"]
-        text_column_name = hf_save_dataset_options["text_column"]
-        sbv_column_name = hf_save_dataset_options["text_sbv_column"]
-        #subset = hf_save_dataset_options["subset"]
-    
-        if isinstance(transcriptions, list) and all(isinstance(transcription["audio_entry"], str) or isinstance(transcription["audio_entry"], dict) for transcription in transcriptions):
-            self.progress_cb("Creating dataset", 0.0)
-
-            # As audio_column_name can contain both str and dict, we need to create two datasets, cast Audio and then concatenate
-            # As casting only supports either all str or all dict
-            # Create two dicts, depending on type of audio_entry
-            path_entries = [entry for entry in transcriptions if isinstance(entry["audio_entry"], str)]
-            dict_entries = [entry for entry in transcriptions if isinstance(entry["audio_entry"], dict)]
-
-            dataset_with_audio_entry_paths_base_dict = {
-                audio_column_name: [entry["audio_entry"] for entry in path_entries],
-                text_column_name: [entry["transcription"]["text"] for entry in path_entries],
-            }
-
-            dataset_with_audio_entry_paths_sbv_dict = {
-                sbv_column_name: [self.get_timestamped_sbv_text(entry) for entry in path_entries],
-            } if add_timestamps else {}
-
-            dataset_with_audio_entry_paths = Dataset.from_dict({
-                **dataset_with_audio_entry_paths_base_dict,
-                **dataset_with_audio_entry_paths_sbv_dict
-            }).cast_column(audio_column_name, Audio())
-
-            dataset_with_audio_entry_structs_base_dict = {
-                audio_column_name: [entry["audio_entry"] for entry in dict_entries],
-                text_column_name: [entry["transcription"]["text"] for entry in dict_entries],
-            }
-
-            dataset_with_audio_entry_structs_sbv_dict = {
-                sbv_column_name: [self.get_timestamped_sbv_text(entry) for entry in dict_entries],
-            } if add_timestamps else {}
-
-            dataset_with_audio_entry_structs = Dataset.from_dict({
-                **dataset_with_audio_entry_structs_base_dict,
-                **dataset_with_audio_entry_structs_sbv_dict
-            }).cast_column(audio_column_name, Audio())
-
-            hf_dataset = concatenate_datasets([dataset_with_audio_entry_paths, dataset_with_audio_entry_structs])
-            self.progress_cb("Done!", 1.0)
-        else:
-            raise Exception("The provided type for audio_columns isn't supported")
-
-        split = hf_save_dataset_options["split"]
+    def create_hf_dataset_writer(self, hf_save_dataset_options, add_timestamps=False, resume=False):
+        # Without a local path the shards are only kept until they are pushed and the workspace is cleaned up
+        local_path = hf_save_dataset_options.get("local_path") or self.workspace.get_path('hf_dataset')
+
+        return ShardedDatasetWriter(
+            local_path=local_path,
+            audio_column=hf_save_dataset_options["audio_column"],
+            text_column=hf_save_dataset_options["text_column"],
+            sbv_column=hf_save_dataset_options["text_sbv_column"] if add_timestamps else None,
+            sbv_formatter=self.get_timestamped_sbv_text,
+            split=hf_save_dataset_options["split"],
+            max_shard_bytes=int(hf_save_dataset_options.get("max_shard_size", 500) * 1024**2),
+            resume=resume
+            )
+
+    def push_hf_dataset(self, local_path, hf_save_dataset_options, resume=False):
         target_repository = hf_save_dataset_options["target"]
         revision = hf_save_dataset_options["revision"]
         private = hf_save_dataset_options["private"]
 
-        # ToDo: Make this conditional, return value might be desired to be the dataset itself or save to file
         self.progress_cb("Pushing Dataset to HuggingFace", 0.0)
-        hf_dataset.push_to_hub(target_repository, split=split, branch=revision, private=private, token=self.hf_token)
+        uploader = DatasetShardUploader(token=self.hf_token, max_workers=hf_save_dataset_options.get("upload_workers", 4))
+        with self.progress_tracker.time_stage("upload", item_id=target_repository) as measurement:
+            uploaded_paths, failed_paths = uploader.upload(local_path, repo_id=target_repository, revision=revision, private=private, resume=resume, progress_cb=self.progress_cb)
+            measurement["items"] = len(uploaded_paths)
+
+        if len(failed_paths) > 0:
+            raise Exception(f"Failed to upload {len(failed_paths)} shards ({', '.join(failed_paths)}), resume the job to upload the remaining shards")
         self.progress_cb("Done!", 1.0)
 
-    def transcribe_raw_audio(self, data_entries, add_timestamps=False, translate=False):
-        transcriptions = []
-        for idx, data_entry in enumerate(data_entries):
-            if not translate:
-                self.progress_cb(f"Transcribing audio file {idx+1} of {len(data_entries)}", idx / len(data_entries))
-                transcription = self.whisper_model.transcribe(inputs=data_entry, add_timestamps=add_timestamps)
-                self.progress_cb("Done!", (idx+1) / len(data_entries))
-            else:
-                self.progress_cb(f"Translating audio file {idx+1} of {len(data_entries)}", idx / len(data_entries))
-                transcription = self.whisper_model.translate(inputs=data_entry, add_timestamps=add_timestamps)
-                self.progress_cb("Done!", (idx+1) / len(data_entries))
-            transcriptions.append(transcription)
+    def write_transcriptions_to_hf_dataset(self, transcriptions, hf_save_dataset_options, add_timestamps=False, translate=False):
+        if not transcriptions or len(transcriptions) <= 0:
+            return
         
+        self.progress_cb("Creating dataset", 0.0)
+        hf_dataset_writer = self.create_hf_dataset_writer(hf_save_dataset_options, add_timestamps=add_timestamps)
+        with self.progress_tracker.time_stage("write_dataset", items=len(transcriptions)):
+            for transcription in transcriptions:
+                hf_dataset_writer.add(transcription)
+            hf_dataset_writer.close()
+        self.progress_cb("Done!", 1.0)
+
+        if hf_save_dataset_options.get("target"):
+            self.push_hf_dataset(hf_dataset_writer.local_path, hf_save_dataset_options)
+
+    def transcribe_raw_audio(self, data_entries, add_timestamps=False, translate=False, keep_audio=True, bucketing_window_batches=8):
+        """
+        Transcribes audio entries of a dataset, which may be a list or a lazily evaluated iterable of a streamed dataset.
+
+        Parameters:
+            data_entries (list or Iterable): The audio entries, dicts with "array" and "sampling_rate".
+            keep_audio (bool): Whether the waveform is kept in the returned audio entries. Defaults to True.
+            bucketing_window_batches (int): The number of batches that are length bucketed together if the length of data_entries is unknown. Defaults to 8.
+
+        Returns:
+            list[dict]: The transcriptions with the keys idx, item_id, audio_entry and transcription in input order.
+        """
         return [
-            {
-                'audio_entry': data_entry, 
-                'transcription': transcription
-            } for data_entry, transcription in zip(data_entries, transcriptions)
+            transcription if keep_audio else {**transcription, 'audio_entry': self.strip_audio_entry(transcription['audio_entry'])}
+            for transcription in self.iter_transcribe_raw_audio(data_entries, add_timestamps=add_timestamps, translate=translate, bucketing_window_batches=bucketing_window_batches)
             ]
 
+    def iter_transcribe_raw_audio(self, data_entries, add_timestamps=False, translate=False, bucketing_window_batches=8):
+        """
+        Same as transcribe_raw_audio, but yields the transcriptions of every window of entries as soon as it is finished.
+        """
+        total_count = len(data_entries) if hasattr(data_entries, '__len__') else None
+        # Several entries are passed at once so chunks of short entries share a batch
+        files_per_batch = self.whisper_model.batch_size
+
+        # Entries are pulled in windows, so only one window of a streamed dataset is decoded at a time
+        if not self.length_bucketing:
+            window_size = files_per_batch
+        elif total_count is not None:
+            window_size = max(total_count, 1)
+        else:
+            window_size = files_per_batch * bucketing_window_batches
+
+        data_entries_iterator = iter(data_entries)
+        finished_count = 0
+        window_start = 0
+
+        while True:
+            window_entries = list(itertools.islice(data_entries_iterator, window_size))
+            if len(window_entries) <= 0:
+                break
+
+            window_item_ids = [f"{self.dataset_id}#{window_start + idx}" for idx in range(len(window_entries))]
+            window_start += len(window_entries)
+            window_transcriptions = [None] * len(window_entries)
+
+            # Rows finished by a previous, interrupted run are taken from the manifest
+            for idx, item_id in enumerate(window_item_ids):
+                resumed_transcription = self.get_resumed_transcription(item_id)
+                if resumed_transcription is not None:
+                    # The manifest doesn't store waveforms, so the loaded row is used as audio entry
+                    window_transcriptions[idx] = {**resumed_transcription, 'audio_entry': window_entries[idx]}
+                    finished_count += 1
+            pending_indices = [idx for idx, transcription in enumerate(window_transcriptions) if transcription is None]
+
+            if self.length_bucketing:
+                durations = [self.audio_converter.probe_duration(window_entries[idx]) for idx in pending_indices]
+                batches = [[pending_indices[idx] for idx in group] for group in self.length_bucket_scheduler.group(durations, files_per_batch)]
+            elif len(pending_indices) > 0:
+                batches = [pending_indices]
+            else:
+                batches = []
+
+            for batch_indices in batches:
+                self.progress_cb(
+                    f"{'Transcribing' if not translate else 'Translating'} {len(batch_indices)} audio files, {finished_count} of {total_count if total_count is not None else 'unknown'} done", 
+                    finished_count / total_count if total_count else 0.0
+                    )
+                batch_transcriptions = self.run_model_batch([window_entries[idx] for idx in batch_indices], add_timestamps=add_timestamps, translate=translate)
+                for idx, transcription in zip(batch_indices, batch_transcriptions):
+                    window_transcriptions[idx] = self.finish_item(window_item_ids[idx], window_entries[idx], transcription)
+                finished_count += len(batch_indices)
+                self.progress_cb("Done!", finished_count / total_count if total_count else 0.0)
+
+            yield from window_transcriptions
+
+    def get_item_id(self, source):
+        # Local files are identified by their absolute path, URLs by themselves
+        if isinstance(source, str) and os.path.exists(source):
+            return os.path.abspath(source)
+        return str(source)
+
+    def get_resumed_transcription(self, item_id):
+        if self.manifest is None:
+            return None
+
+        record = self.manifest.get(item_id)
+        if record is None:
+            return None
+
+        return {
+            'idx': record['idx'],
+            'item_id': item_id,
+            'audio_entry': record['audio_entry'],
+            'transcription': record['transcription']
+        }
+
+    def restore_audio_entry(self, transcription):
+        """
+        Returns the transcription with an audio entry that can be written to a dataset.
+
+        The manifest only stores the path of an audio entry, so the audio of a resumed item that was decoded
+        in memory or only existed in the workspace of the interrupted job, e.g. a download, is prepared again
+        from its source. Returns None if the source isn't available anymore.
+        """
+        audio_entry = transcription['audio_entry']
+        if (isinstance(audio_entry, dict) and "array" in audio_entry) or (isinstance(audio_entry, str) and os.path.isfile(audio_entry)):
+            return transcription
+
+        item_id = transcription.get('item_id')
+        try:
+            # Only the audio entry is needed, so the voice activity detection of prepare_audio_entry is skipped
+            if item_id is not None and os.path.isfile(item_id):
+                _, audio_entry = self.decode_audio_entry(item_id, self.is_audio_or_video(item_id))
+            elif item_id is not None and item_id.startswith(("http://", "https://")):
+                file_path = self.download_youtube(YouTubeDownloader(), item_id)
+                _, audio_entry = self.decode_audio_entry(file_path, self.is_audio_or_video(file_path))
+            else:
+                raise Exception("The source of the item is unknown")
+        except Exception as e:
+            self.progress_cb(f"Skipping {item_id} in the dataset, its audio is not available anymore: {e}", 0.0)
+            return None
+
+        return {**transcription, 'audio_entry': audio_entry}
+
+    def finish_item(self, item_id, audio_entry, transcription):
+        # The index is stored in the manifest, so output file names stay the same when a job is resumed
+        idx = self.next_item_idx
+        self.next_item_idx += 1
+
+        # Persist every finished item immediately, so it survives a crash later in the job
+        if self.manifest is not None:
+            self.manifest.record(item_id, audio_entry, transcription, idx=idx)
+
+        return {
+            'idx': idx,
+            'item_id': item_id,
+            'audio_entry': audio_entry,
+            'transcription': transcription
+        }
+
+    def strip_audio_entry(self, audio_entry):
+        # Drops the waveform but keeps the path, which is used for naming output files
+        if isinstance(audio_entry, dict):
+            return {key: value for key, value in audio_entry.items() if key != "array"}
+        return audio_entry
+
+    def remove_workspace_audio(self, audio_entry):
+        """
+        Removes the file of an audio entry if it was created in the workspace, e.g. the audio converted from a video.
+
+        Long running callers like the folder watcher use this once an item is finished, so the workspace doesn't grow.
+        """
+        if isinstance(audio_entry, str) and os.path.abspath(audio_entry).startswith(os.path.abspath(self.workspace.path) + os.sep):
+            try:
+                os.remove(audio_entry)
+            except FileNotFoundError:
+                pass
+
     def transcribe_youtube(self, youtube_urls, output_path, add_timestamps=False, translate=False):
-        converted_paths, _ = self.audio_converter.convert_multiple_from_youtube(urls=youtube_urls)
-        file_transcriptions = []
-
-        for idx, path in enumerate(converted_paths):
-            self.progress_cb(f"Transcribing audio file sourced from YouTube {path}", idx / len(converted_paths))
-            file_transcription = self.transcribe_file(source_dir=os.path.dirname(path), source_file=os.path.basename(path), output_path=output_path, add_timestamps=add_timestamps, translate=translate)
-            file_transcriptions.append(file_transcription)
-            self.progress_cb("Done!", (idx+1) / len(converted_paths))
+        return [transcription for _, transcription in sorted(self.iter_transcribe_youtube(youtube_urls, add_timestamps=add_timestamps, translate=translate), key=lambda result: result[0])]
+
+    def iter_transcribe_youtube(self, youtube_urls, add_timestamps=False, translate=False):
+        downloader = YouTubeDownloader()
+        stages = [
+            ("download", lambda url: self.download_youtube(downloader, url), self.download_workers),
+            ("decode", self.prepare_audio_entry, self.get_decode_workers()),
+        ]
         
-        return file_transcriptions
+        return self.iter_transcribe_staged(sources=youtube_urls, stages=stages, add_timestamps=add_timestamps, translate=translate)
+
+    def download_youtube(self, downloader, url):
+        with self.progress_tracker.time_stage("download", item_id=url) as measurement:
+            file_path = downloader.download(url, output_path=self.workspace.get_path('yt_downloads'))
+            measurement["bytes"] = os.path.getsize(file_path)
+        return file_path
 
     def transcribe_file(self, source_dir, source_file, output_path, add_timestamps=False, translate=False):
         file_path = os.path.join(source_dir, source_file)
 
         # Transcription logic for a single file
         file_type = self.is_audio_or_video(file_path)
-        if file_type == 'audio':
-            source_audio_file_path = file_path
-        elif file_type == 'video':
-            source_audio_file_path = self.audio_converter.convert_from_video(input_path=source_dir, input_file_name=source_file, output_path=output_path)
-        else:
+        if file_type is None:
             raise Exception("Unknown file type provided.")
         
-        transcription = {}
+        item_id = self.get_item_id(file_path)
+        resumed_transcription = self.get_resumed_transcription(item_id)
+        if resumed_transcription is not None:
+            self.progress_cb(f"Skipping already transcribed {file_type} file {source_file}", 1.0)
+            return resumed_transcription
+        
+        self.progress_cb(f"Preparing {file_type} file {source_file}", 0.0)
+        model_inputs, audio_entry = self.prepare_audio_entry(file_path)
+        self.progress_cb("Done!", 1.0)
 
-        if not translate:
-            self.progress_cb(f"Transcribing {file_type} file {source_file}", 0.0)
-            transcription = self.whisper_model.transcribe(inputs=source_audio_file_path, add_timestamps=add_timestamps)
-            self.progress_cb("Done!", 1.0)
-        else:
-            self.progress_cb(f"Translating {file_type} file {source_file}", 0.0)
-            transcription = self.whisper_model.translate(inputs=source_audio_file_path, add_timestamps=add_timestamps)
-            self.progress_cb("Done!", 1.0)
+        self.progress_cb(f"{'Transcribing' if not translate else 'Translating'} {file_type} file {source_file}", 0.0)
+        transcription = self.run_model(model_inputs, add_timestamps=add_timestamps, translate=translate)
+        self.progress_cb("Done!", 1.0)
 
-        return {
-            'audio_entry': source_audio_file_path,
-            'transcription': transcription
-        }
+        return self.finish_item(item_id, audio_entry, transcription)
 
     def transcribe_dir(self, source_dir, add_timestamps=False, translate=False):
+        return [transcription for _, transcription in sorted(self.iter_transcribe_dir(source_dir, add_timestamps=add_timestamps, translate=translate), key=lambda result: result[0])]
+
+    def iter_transcribe_dir(self, source_dir, add_timestamps=False, translate=False):
+        if not self.length_bucketing:
+            # Files are decoded and transcribed while the rest of the tree is still walked
+            yield from self.iter_transcribe_files(self.file_walker.walk(source_dir), add_timestamps=add_timestamps, translate=translate)
+            return
+
+        # Length bucketing needs the durations of all files up front
         self.progress_cb("Collecting files", 0.0)
-        files = self.collect_files_recursively(source_dir)
+        media_files = self.collect_files_recursively(source_dir)
         self.progress_cb("Done!", 1.0)
 
-        audio_files = []
-        video_files = []
-        transcriptions = {}
-
-        for file in files:
-            file_type = self.is_audio_or_video(file)
-            if file_type == 'audio':
-                audio_files.append(file)
-            elif file_type == 'video':
-                video_files.append(file)
-
-        for idx, audio_file in enumerate(audio_files):
-            if not translate:
-                self.progress_cb(f"Transcribing {file_type} file {audio_file}", idx / len(audio_files))
-                transcriptions[audio_file] = self.whisper_model.transcribe(audio_file, add_timestamps=add_timestamps)
-                self.progress_cb("Done!", (idx+1) / len(audio_files))
-            else:
-                self.progress_cb(f"Translating {file_type} file {audio_file}", idx / len(audio_files))
-                transcriptions[audio_file] = self.whisper_model.translate(audio_file, add_timestamps=add_timestamps)
-                self.progress_cb("Done!", (idx+1) / len(audio_files))
-        
-        if len(video_files) > 0:
+        source_order = None
+        if len(media_files) > 0:
+            self.progress_cb("Probing durations", 0.0)
+            with ThreadPoolExecutor(max_workers=self.get_decode_workers()) as executor:
+                durations = list(executor.map(self.audio_converter.probe_duration, media_files))
+            source_order = self.length_bucket_scheduler.order(durations)
+            self.progress_cb("Done!", 1.0)
+
+        yield from self.iter_transcribe_files(media_files, add_timestamps=add_timestamps, translate=translate, source_order=source_order)
+
+    def iter_transcribe_files(self, file_paths, add_timestamps=False, translate=False, source_order=None):
+        """
+        Decodes and transcribes the given media files, yields (file index, transcription) tuples as soon as every batch is finished.
+
+        Files that fail to decode are reported with progress_cb and skipped.
+        """
+        stages = [
+            ("decode", self.prepare_audio_entry, self.get_decode_workers()),
+        ]
+
+        yield from self.iter_transcribe_staged(sources=file_paths, stages=stages, add_timestamps=add_timestamps, translate=translate, source_order=source_order)
+
+    def get_decode_workers(self):
+        # Decoding and converting run ffmpeg in a subprocess, so threads decode in parallel despite the GIL
+        return self.max_workers or os.cpu_count() or 1
+
+    def prepare_audio_entry(self, file_path, output_path=None):
+        """
+        Prepares a downloaded or local audio / video file for the model.
+
+        Returns:
+            tuple: (model_inputs, audio_entry), the input passed to the model and the entry used for writing outputs.
+        """
+
+        file_type = self.is_audio_or_video(file_path)
+        if file_type is None:
+            raise Exception(f"Unknown file type provided: {file_path}")
+
+        with self.progress_tracker.time_stage("decode", item_id=file_path) as measurement:
+            model_inputs, audio_entry = self.decode_audio_entry(file_path, file_type, output_path=output_path)
+            measurement["bytes"] = os.path.getsize(file_path)
+            # Only decoded waveforms have a known duration without probing the file again
+            if isinstance(model_inputs, dict):
+                measurement["audio_s"] = self.audio_converter.probe_duration(model_inputs)
+
+        # The speech regions are detected here in the decode workers, so the model doesn't wait for decoding and detection
+        if self.vad is not None:
+            with self.progress_tracker.time_stage("vad", item_id=file_path):
+                model_inputs = self.vad.prepare(model_inputs)
+
+        return model_inputs, audio_entry
+
+    def decode_audio_entry(self, file_path, file_type, output_path=None):
+        if self.decode_in_memory:
+            model_inputs = self.audio_converter.decode_to_array(file_path)
+            # Keep the path for naming outputs, the decoded waveform is used for HF datasets as videos can't be cast to Audio
+            audio_entry = file_path if file_type == 'audio' else {'path': file_path, **model_inputs}
+        elif file_type == 'audio':
+            model_inputs = audio_entry = file_path
+        else:
             # Files with the same name in nested directory could cause an error
-            output_file_names = [os.path.basename(video_file_path).split(".")[0] + ".mp3" for video_file_path in video_files]
-            video_audio_files = self.audio_converter.convert_multiple_from_videos(input_source_paths=video_files, output_file_names=output_file_names)
-
-            for idx, video_audio_file in enumerate(video_audio_files):
-                if not translate:
-                    self.progress_cb(f"Transcribing {file_type} file {video_audio_file}", idx / len(video_audio_files))
-                    transcriptions[video_audio_file] = self.whisper_model.transcribe(video_audio_file, add_timestamps=add_timestamps)
-                    self.progress_cb("Done!", (idx+1) / len(video_audio_files))
-                else:
-                    self.progress_cb(f"Translating {file_type} file {video_audio_file}", idx / len(video_audio_files))
-                    transcriptions[video_audio_file] = self.whisper_model.translate(video_audio_file, add_timestamps=add_timestamps)
-                    self.progress_cb("Done!", (idx+1) / len(video_audio_files))
-        
-        return [{'audio_entry': file_path, 'transcription': transcription} for file_path, transcription in transcriptions.items()]
+            output_file_name = os.path.basename(file_path).split(".")[0] + ".mp3"
+            model_inputs = audio_entry = self.audio_converter.convert_from_video(
+                input_path=os.path.dirname(file_path), 
+                input_file_name=os.path.basename(file_path), 
+                output_path=output_path or self.workspace.get_path('audios'), 
+                output_file_name=output_file_name
+                )
 
-    def collect_files_recursively(self, source_dir):
-        file_paths = []
+        return model_inputs, audio_entry
+
+    def run_model(self, model_inputs, add_timestamps=False, translate=False):
+        return self.run_model_batch([model_inputs], add_timestamps=add_timestamps, translate=translate)[0]
+
+    def run_model_batch(self, model_inputs_list, add_timestamps=False, translate=False):
+        task = self.get_task(translate)
+        if self.transcription_cache is None:
+            cache_keys, transcriptions = None, [None] * len(model_inputs_list)
+        else:
+            # Cache hits are reported as their own stage, so they don't count as audio processed by the model
+            with self.progress_tracker.time_stage("cache") as measurement:
+                cache_keys, transcriptions = self.get_cached_transcriptions(model_inputs_list, add_timestamps=add_timestamps, task=task)
+                measurement["items"] = sum(1 for transcription in transcriptions if transcription is not None)
+        missing_indices = [idx for idx, transcription in enumerate(transcriptions) if transcription is None]
+
+        if len(missing_indices) > 0:
+            missing_inputs = [model_inputs_list[idx] for idx in missing_indices]
+            # Only inputs that go through inference count as model audio, they are probed before the model is timed
+            audio_s = sum(self.get_input_duration(model_inputs) or 0.0 for model_inputs in missing_inputs)
+
+            with self.progress_tracker.time_stage("model", items=len(missing_inputs)) as measurement:
+                missing_transcriptions = self.transcribe_speech_batch(missing_inputs, add_timestamps=add_timestamps, task=task)
+                measurement["audio_s"] = audio_s
+
+            for idx, transcription in zip(missing_indices, missing_transcriptions):
+                if cache_keys is not None:
+                    self.transcription_cache.put(cache_keys[idx], transcription)
+                transcriptions[idx] = transcription
+
+        return transcriptions
+
+    def get_input_duration(self, model_inputs):
+        # Inputs split by the voice activity detection know their duration from decoding
+        if isinstance(model_inputs, SpeechRegions):
+            return model_inputs.duration_s
+        return self.audio_converter.probe_duration(model_inputs)
+
+    def get_cached_transcriptions(self, model_inputs_list, add_timestamps=False, task="transcribe"):
+        """
+        Looks up the inputs in the transcription cache.
+
+        Returns:
+            tuple: (cache_keys, transcriptions), the cache key and the cached transcription or None per input.
+        """
+        cache_keys = [
+            self.transcription_cache.make_key(
+                model_inputs.audio_input if isinstance(model_inputs, SpeechRegions) else model_inputs, 
+                checkpoint=self.whisper_model.checkpoint, 
+                dtype=jnp.dtype(self.whisper_model.dtype).name, 
+                task=task, 
+                add_timestamps=add_timestamps,
+                vad_settings=self.vad.get_settings() if self.vad is not None else None
+                ) for model_inputs in model_inputs_list
+            ]
+        return cache_keys, [self.transcription_cache.get(cache_key) for cache_key in cache_keys]
+
+    def transcribe_speech_batch(self, model_inputs_list, add_timestamps=False, task="transcribe"):
+        """
+        Runs the model on a batch of inputs, only on their speech regions if voice activity detection is enabled.
+
+        The speech regions of all inputs are packed into shared batches and the timestamps of their
+        transcriptions are shifted back to the time of the original inputs.
+        """
+        if self.vad is None:
+            return self.run_whisper_model(model_inputs_list, add_timestamps=add_timestamps, task=task)
+
+        # Inputs that didn't go through the decode workers, e.g. dataset rows, are split here
+        unsplit_count = sum(1 for model_inputs in model_inputs_list if not isinstance(model_inputs, SpeechRegions))
+        with self.progress_tracker.time_stage("vad", items=unsplit_count):
+            speech_regions_list = [self.vad.prepare(model_inputs) for model_inputs in model_inputs_list]
+
+        # (input_idx, region_input, region_s) for every speech region of every input
+        regions = [
+            (input_idx, region_input, region_s)
+            for input_idx, speech_regions in enumerate(speech_regions_list)
+            for region_input, region_s in speech_regions.regions
+            ]
 
-        for path in os.listdir(source_dir):
-            if os.path.isdir(os.path.join(source_dir, path)):
-                file_paths += self.collect_files_recursively(os.path.join(source_dir, path))
-            elif os.path.isfile(os.path.join(source_dir, path)):
-                file_paths.append(os.path.join(source_dir, path))
+        total_s = sum(speech_regions.duration_s or 0.0 for speech_regions in speech_regions_list)
+        speech_s = sum(region_s[1] - region_s[0] for _, _, region_s in regions if region_s[1] is not None)
+        if total_s > 0:
+            self.progress_cb(f"Voice activity detection kept {speech_s:.0f} s of {total_s:.0f} s audio ({speech_s / total_s:.1%})", 0.0)
 
-        return file_paths
+        region_transcriptions = []
+        if len(regions) > 0:
+            region_transcriptions = self.run_whisper_model([region_input for _, region_input, _ in regions], add_timestamps=add_timestamps, task=task)
+
+        transcriptions = []
+        for input_idx in range(len(model_inputs_list)):
+            input_regions = [(transcription, region[2]) for region, transcription in zip(regions, region_transcriptions) if region[0] == input_idx]
+            transcriptions.append(self.vad.merge_transcriptions(
+                [transcription for transcription, _ in input_regions], 
+                [region_s for _, region_s in input_regions], 
+                add_timestamps=add_timestamps
+                ))
+
+        return transcriptions
+
+    def run_whisper_model(self, model_inputs_list, add_timestamps=False, task="transcribe"):
+        if self.inference_worker is not None:
+            return self.inference_worker.transcribe_batch(self.whisper_model, model_inputs_list, add_timestamps=add_timestamps, task=task, cancel_event=self.cancel_event)
+        return self.whisper_model.transcribe_batch(model_inputs_list, add_timestamps=add_timestamps, task=task)
+
+    def transcribe_staged(self, sources, stages, add_timestamps=False, translate=False, source_order=None):
+        """
+        Fetches / decodes sources in background stages while the model transcribes the already prepared ones.
+
+        Parameters:
+            sources (list): The sources fed into the first stage, e.g. YouTube URLs or file paths.
+            stages (list[tuple[str, Callable, int]]): The stages before inference, the last stage must return (model_inputs, audio_entry).
+            source_order (list[int]|None): The indices of the sources in the order they should be processed. None processes them in the given order.
+
+        Returns:
+            list[dict]: The transcriptions with the keys idx, item_id, audio_entry and transcription in source order, failed sources are skipped.
+        """
+        results = self.iter_transcribe_staged(sources, stages, add_timestamps=add_timestamps, translate=translate, source_order=source_order)
+        return [transcription for _, transcription in sorted(results, key=lambda result: result[0])]
+
+    def iter_transcribe_staged(self, sources, stages, add_timestamps=False, translate=False, source_order=None):
+        """
+        Same as transcribe_staged, but yields (source index, transcription) tuples as soon as every batch is finished.
+
+        sources may also be a lazily evaluated iterable, e.g. files that are still being discovered, if source_order is None.
+        """
+        staged_pipeline = StagedPipeline(stages=stages, queue_size=self.queue_size)
+        files_per_batch = self.whisper_model.batch_size
+        total_count = len(sources) if hasattr(sources, '__len__') else None
+        pending_results = []
+        # Source index of every item fed into the staged pipeline, appended by its feeder thread before the item is fed
+        pending_source_indices = []
+        # (source index, transcription) of sources finished by a previous, interrupted run, appended by the feeder thread
+        resumed_transcriptions = []
+        finished_count = 0
+
+        def get_progress():
+            return finished_count / total_count if total_count else 0.0
+
+        def transcribe_pending():
+            nonlocal finished_count
+            self.progress_cb(
+                f"{'Transcribing' if not translate else 'Translating'} {', '.join(str(result.source) for result in pending_results)}", 
+                get_progress()
+                )
+            batch_transcriptions = self.run_model_batch([result.value[0] for result in pending_results], add_timestamps=add_timestamps, translate=translate)
+            finished_transcriptions = []
+            for result, transcription in zip(pending_results, batch_transcriptions):
+                source_idx = pending_source_indices[result.idx]
+                finished_transcriptions.append((source_idx, self.finish_item(self.get_item_id(result.source), result.value[1], transcription)))
+            finished_count += len(pending_results)
+            pending_results.clear()
+            self.progress_cb("Done!", get_progress())
+            return finished_transcriptions
+
+        def yield_resumed():
+            nonlocal finished_count
+            while len(resumed_transcriptions) > 0:
+                finished_count += 1
+                yield resumed_transcriptions.pop(0)
+
+        def iter_pending_sources():
+            ordered_sources = enumerate(sources) if source_order is None else ((source_idx, sources[source_idx]) for source_idx in source_order)
+            for source_idx, source in ordered_sources:
+                # Sources finished by a previous, interrupted run are taken from the manifest
+                resumed_transcription = self.get_resumed_transcription(self.get_item_id(source))
+                if resumed_transcription is not None:
+                    resumed_transcriptions.append((source_idx, resumed_transcription))
+                    continue
+                pending_source_indices.append(source_idx)
+                yield source
+
+        for result in staged_pipeline.run(iter_pending_sources()):
+            yield from yield_resumed()
+
+            if result.error is not None:
+                finished_count += 1
+                self.progress_cb(f"Failed to {result.failed_stage} {result.source}, skipping: {result.error}", get_progress())
+                continue
+
+            # Prepared files are collected until they fill a batch, chunks of short files share a batch
+            pending_results.append(result)
+            if len(pending_results) >= files_per_batch:
+                yield from transcribe_pending()
+
+        # Resumed sources found after the last pending source, or all sources if every source was resumed
+        yield from yield_resumed()
+
+        if len(pending_results) > 0:
+            yield from transcribe_pending()
+
+    def collect_files_recursively(self, source_dir):
+        # Only media files are collected, see MediaFileWalker
+        return list(self.file_walker.walk(source_dir))
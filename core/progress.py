@@ -0,0 +1,174 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable
+import threading
+import json
+import time
+
+class ProgressEvent:
+    """
+    A typed progress update of one pipeline stage.
+
+    Attributes:
+        stage (str): The stage that emitted the event, e.g. "download", "decode", "cache", "model" or "write_files".
+        message (str): A human readable description.
+        progress (float): The progress between 0.0 and 1.0.
+        item_id (str|None): The item the event belongs to, e.g. a file path or URL.
+        items (int): The number of items processed in this step.
+        bytes (int|None): The number of bytes processed in this step.
+        audio_s (float|None): The seconds of audio processed in this step.
+        elapsed_s (float|None): The wall time of this step in seconds, None for events that don't finish a step.
+        timestamp (float): The time the event was emitted.
+    """
+    def __init__(
+            self,
+            stage: str,
+            message: str = "",
+            progress: float = 0.0,
+            item_id: str|None = None,
+            items: int = 1,
+            bytes: int|None = None,
+            audio_s: float|None = None,
+            elapsed_s: float|None = None
+            ):
+        self.stage = stage
+        self.message = message
+        self.progress = progress
+        self.item_id = item_id
+        self.items = items
+        self.bytes = bytes
+        self.audio_s = audio_s
+        self.elapsed_s = elapsed_s
+        self.timestamp = time.time()
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+class ProgressTracker:
+    """
+    Collects the progress events of a run and aggregates the time spent per stage.
+
+    Stages running in worker threads overlap, so besides the busy time (sum of all steps) the wall time
+    from the first start to the last end of a stage is tracked. The real-time factor of a run is its wall
+    time divided by the seconds of audio that went through the model.
+    """
+    def __init__(self, listeners: list[Callable[[ProgressEvent], None]]|None = None):
+        """
+        Parameters:
+            listeners (list[Callable[[ProgressEvent], None]]|None, optional): Called with every emitted event. Defaults to None.
+        """
+        self.listeners = list(listeners or [])
+        self.stage_stats = OrderedDict()
+        self.start_time = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[ProgressEvent], None]):
+        self.listeners.append(listener)
+
+    def emit(self, event: ProgressEvent):
+        """
+        Aggregates an event into the stage statistics and passes it to all listeners.
+        """
+        if event.elapsed_s is not None:
+            now = time.perf_counter()
+            with self._lock:
+                stats = self.stage_stats.setdefault(event.stage, {
+                    "items": 0, "steps": 0, "busy_s": 0.0, "bytes": 0, "audio_s": 0.0, "first_start": now - event.elapsed_s, "last_end": now
+                    })
+                stats["items"] += event.items
+                stats["steps"] += 1
+                stats["busy_s"] += event.elapsed_s
+                stats["bytes"] += event.bytes or 0
+                stats["audio_s"] += event.audio_s or 0.0
+                stats["first_start"] = min(stats["first_start"], now - event.elapsed_s)
+                stats["last_end"] = max(stats["last_end"], now)
+
+        for listener in self.listeners:
+            listener(event)
+
+    @contextmanager
+    def time_stage(self, stage: str, item_id: str|None = None, items: int = 1, message: str = ""):
+        """
+        Measures a step of a stage and emits its event once the step finished successfully.
+
+        The yielded dict can be filled with "bytes" and "audio_s" inside the block, e.g.
+
+            with tracker.time_stage("download", item_id=url) as measurement:
+                path = download(url)
+                measurement["bytes"] = os.path.getsize(path)
+        """
+        measurement = {"bytes": None, "audio_s": None, "items": items}
+        start_time = time.perf_counter()
+        yield measurement
+        self.emit(ProgressEvent(
+            stage=stage,
+            message=message,
+            item_id=item_id,
+            items=measurement["items"],
+            bytes=measurement["bytes"],
+            audio_s=measurement["audio_s"],
+            elapsed_s=time.perf_counter() - start_time
+            ))
+
+    def get_summary(self) -> dict:
+        """
+        Returns the aggregated statistics of the run.
+
+        Returns:
+            dict: A dictionary containing the following keys:
+                - "wall_s" (float): The time since the tracker was created.
+                - "audio_s" (float): The seconds of audio that went through the model.
+                - "real_time_factor" (float|None): wall_s / audio_s, below 1.0 is faster than real time.
+                - "stages" (dict): Per stage the items, steps, busy_s, wall_s, bytes, audio_s, items_per_s, audio_s_per_s and mb_per_s.
+        """
+        wall_s = time.perf_counter() - self.start_time
+        stages = {}
+
+        with self._lock:
+            for stage, stats in self.stage_stats.items():
+                stage_wall_s = max(stats["last_end"] - stats["first_start"], 1e-9)
+                stages[stage] = {
+                    "items": stats["items"],
+                    "steps": stats["steps"],
+                    "busy_s": stats["busy_s"],
+                    "wall_s": stage_wall_s,
+                    "bytes": stats["bytes"],
+                    "audio_s": stats["audio_s"],
+                    "items_per_s": stats["items"] / stage_wall_s,
+                    "audio_s_per_s": stats["audio_s"] / stage_wall_s,
+                    "mb_per_s": stats["bytes"] / 1024**2 / stage_wall_s,
+                }
+
+        audio_s = stages["model"]["audio_s"] if "model" in stages else 0.0
+
+        return {
+            "wall_s": wall_s,
+            "audio_s": audio_s,
+            "real_time_factor": wall_s / audio_s if audio_s > 0 else None,
+            "stages": stages,
+        }
+
+    def format_summary(self) -> str:
+        """
+        Returns the statistics of the run as a human readable table.
+        """
+        summary = self.get_summary()
+        lines = [f"{'stage':<14} {'items':>6} {'busy s':>9} {'wall s':>9} {'items/s':>8} {'audio s/s':>10} {'MB/s':>8}"]
+
+        for stage, stats in summary["stages"].items():
+            lines.append(
+                f"{stage:<14} {stats['items']:>6} {stats['busy_s']:>9.1f} {stats['wall_s']:>9.1f} "
+                f"{stats['items_per_s']:>8.2f} {stats['audio_s_per_s']:>10.1f} {stats['mb_per_s']:>8.2f}"
+                )
+
+        real_time_factor = f"{summary['real_time_factor']:.3f}" if summary["real_time_factor"] is not None else "n/a"
+        lines.append(f"Total: {summary['wall_s']:.1f} s for {summary['audio_s']:.1f} s of audio, real-time factor {real_time_factor}")
+
+        return "\n".join(lines)
+
+    def export_json(self, path: str):
+        """
+        Writes the statistics of the run to a JSON file.
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.get_summary(), f, indent=2)
@@ -0,0 +1,146 @@
+from core.model import WhisperModel
+from collections import OrderedDict
+import threading
+import jax.numpy as jnp
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded Whisper models so repeated jobs reuse a warm pipeline instead of reloading it.
+
+    Models are keyed by (checkpoint, dtype, batch_size, draft checkpoint, num_draft_tokens) and evicted least-recently-used first
+    once the estimated memory of all loaded models exceeds `max_memory_bytes`. Before a model is loaded, models are evicted
+    until its estimated footprint fits as well. Loading only blocks other threads requesting the same key.
+    """
+    def __init__(self, max_memory_bytes: int|None = None):
+        self.max_memory_bytes = max_memory_bytes
+        self._models = OrderedDict()
+        # Guards the registry state only and is never held while a model loads
+        self._lock = threading.RLock()
+        # One lock per key that is being loaded, so a checkpoint is loaded once while other keys stay available
+        self._key_locks = {}
+        # Estimated memory of the models that are being loaded
+        self._loading_bytes = 0
+
+    @staticmethod
+    def make_key(checkpoint: str, dtype, batch_size: int, draft_checkpoint: str|None = None, num_draft_tokens: int = 4) -> tuple:
+        """
+        Builds the registry key for a model configuration.
+
+        Parameters:
+            checkpoint (str): The HF checkpoint of the model.
+            dtype: The JAX dtype of the model.
+            batch_size (int): The batch size of the model.
+            draft_checkpoint (str|None, optional): The HF checkpoint of the draft model for speculative decoding. Defaults to None.
+            num_draft_tokens (int, optional): The number of tokens proposed by the draft model per round. Defaults to 4.
+
+        Returns:
+            tuple: The key (checkpoint, dtype name, batch_size, draft_checkpoint, num_draft_tokens).
+        """
+        # Without a draft model the number of draft tokens doesn't change the model
+        return (checkpoint, jnp.dtype(dtype).name, int(batch_size), draft_checkpoint or None, int(num_draft_tokens) if draft_checkpoint else None)
+
+    def get(self, checkpoint: str = "openai/whisper-large-v2", dtype=jnp.float16, batch_size: int = 1, draft_checkpoint: str|None = None, num_draft_tokens: int = 4) -> WhisperModel:
+        """
+        Returns a loaded model for the given configuration, loading it if it is not cached yet.
+
+        Parameters:
+            checkpoint (str): The HF checkpoint of the model. Defaults to "openai/whisper-large-v2".
+            dtype: The JAX dtype of the model. Defaults to jnp.float16.
+            batch_size (int): The batch size of the model. Defaults to 1.
+            draft_checkpoint (str|None, optional): The HF checkpoint of the draft model for speculative decoding. Defaults to None.
+            num_draft_tokens (int, optional): The number of tokens proposed by the draft model per round. Defaults to 4.
+
+        Returns:
+            WhisperModel: The cached or newly loaded model.
+        """
+        key = self.make_key(checkpoint, dtype, batch_size, draft_checkpoint, num_draft_tokens)
+
+        with self._lock:
+            model = self._get_cached(key)
+            if model is not None:
+                return model
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                # Another thread may have loaded the model while this one waited
+                model = self._get_cached(key)
+                if model is not None:
+                    return model
+
+            estimated_bytes = 0
+            if self.max_memory_bytes is not None:
+                estimated_bytes = WhisperModel.estimate_memory_footprint(checkpoint, dtype=dtype, draft_checkpoint=draft_checkpoint)
+
+            with self._lock:
+                # Makes room before loading, so the new model never has to fit next to the evicted ones
+                self._evict(reserved_bytes=self._loading_bytes + estimated_bytes)
+                self._loading_bytes += estimated_bytes
+
+            model = None
+            try:
+                model = WhisperModel(dtype=dtype, batch_size=batch_size, checkpoint=checkpoint, draft_checkpoint=draft_checkpoint, num_draft_tokens=num_draft_tokens)
+            finally:
+                # The model is cached before its key lock is dropped, so later threads find it instead of loading it again
+                with self._lock:
+                    self._loading_bytes -= estimated_bytes
+                    if model is not None:
+                        self._models[key] = model
+                        self._evict()
+                    self._key_locks.pop(key, None)
+
+            return model
+
+    def set_max_memory_bytes(self, max_memory_bytes: int|None):
+        """
+        Changes the memory budget and evicts models if the new budget is exceeded.
+
+        Parameters:
+            max_memory_bytes (int|None): The memory budget in bytes. None disables the budget.
+        """
+        with self._lock:
+            self.max_memory_bytes = max_memory_bytes
+            self._evict()
+
+    def memory_usage(self) -> int:
+        """
+        Returns the estimated memory in bytes used by all cached models.
+        """
+        with self._lock:
+            return sum(model.memory_footprint() for model in self._models.values())
+
+    def clear(self):
+        """
+        Removes all cached models.
+        """
+        with self._lock:
+            self._models.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._models)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._models
+
+    def _get_cached(self, key: tuple) -> WhisperModel|None:
+        if key not in self._models:
+            return None
+        self._models.move_to_end(key)
+        return self._models[key]
+
+    def _evict(self, reserved_bytes: int = 0):
+        """
+        Evicts the least recently used models until the cached models and `reserved_bytes` fit into the budget.
+        """
+        if self.max_memory_bytes is None:
+            return
+
+        # Without reserved memory the most recently used model is always kept, even if it alone exceeds the budget
+        keep_models = 0 if reserved_bytes > 0 else 1
+        while len(self._models) > keep_models and self.memory_usage() + reserved_bytes > self.max_memory_bytes:
+            self._models.popitem(last=False)
+
+# Shared registry used by the CLI and the Gradio app
+model_registry = ModelRegistry()
@@ -0,0 +1,63 @@
+import bisect
+
+class LengthBucketScheduler:
+    """
+    Orders inputs by duration so batches contain inputs of similar length.
+
+    Inputs are grouped into duration buckets, buckets are scheduled longest first and inputs inside a bucket
+    longest first as well. Long inputs therefore do not end up as stragglers at the tail of a job
+    and short inputs are batched with other short inputs.
+    """
+    def __init__(self, bucket_edges_s: tuple = (30.0, 60.0, 300.0, 900.0, 1800.0)):
+        """
+        Parameters:
+            bucket_edges_s (tuple, optional): The upper duration bounds of the buckets in seconds. Defaults to (30.0, 60.0, 300.0, 900.0, 1800.0).
+        """
+        self.bucket_edges_s = tuple(sorted(bucket_edges_s))
+
+    def get_bucket(self, duration_s: float|None) -> int:
+        """
+        Returns the bucket index of a duration, inputs with an unknown duration are put into the last bucket.
+        """
+        if duration_s is None:
+            return len(self.bucket_edges_s)
+        return bisect.bisect_left(self.bucket_edges_s, duration_s)
+
+    def order(self, durations_s: list) -> list[int]:
+        """
+        Returns the indices of the inputs in the order they should be processed.
+
+        Parameters:
+            durations_s (list[float|None]): The duration of every input in seconds, None if unknown.
+
+        Returns:
+            list[int]: The input indices, longest bucket first.
+        """
+        return sorted(
+            range(len(durations_s)),
+            key=lambda idx: (self.get_bucket(durations_s[idx]), durations_s[idx] or 0.0),
+            reverse=True
+            )
+
+    def group(self, durations_s: list, group_size: int) -> list[list[int]]:
+        """
+        Splits the scheduled input indices into groups that never mix buckets.
+
+        Parameters:
+            durations_s (list[float|None]): The duration of every input in seconds, None if unknown.
+            group_size (int): The maximum number of inputs per group.
+
+        Returns:
+            list[list[int]]: The groups of input indices, in processing order.
+        """
+        groups = []
+        current_bucket = None
+
+        for idx in self.order(durations_s):
+            bucket = self.get_bucket(durations_s[idx])
+            if len(groups) == 0 or bucket != current_bucket or len(groups[-1]) >= group_size:
+                groups.append([])
+                current_bucket = bucket
+            groups[-1].append(idx)
+
+        return groups
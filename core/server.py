@@ -0,0 +1,268 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from typing import Callable
+from core.workspace import JobWorkspace
+import threading
+import logging
+import select
+import socket
+import json
+import os
+
+# Query values that switch a flag on
+_TRUE_VALUES = ("1", "true", "yes", "on")
+
+def _to_json_line(value: dict) -> bytes:
+    # Timestamps may be numpy scalars
+    return (json.dumps(value, ensure_ascii=False, default=lambda item: item.item() if hasattr(item, 'item') else str(item)) + "\n").encode("utf-8")
+
+class TranscriptionServer(ThreadingHTTPServer):
+    """
+    A headless HTTP API for transcription jobs, every request is one job whose results are streamed back as NDJSON.
+
+    Endpoints:
+        GET /health: Returns the status of the server and the loaded checkpoint.
+        POST /transcribe: Starts a job. The body is either a JSON object with the sources and settings
+            or the raw bytes of an uploaded audio / video file, whose name is passed with `?filename=`.
+            The response streams one JSON line per finished item and a final line with `"done": true`.
+
+    All requests share the warm model of the pipelines created by `create_pipeline`.
+    """
+    daemon_threads = True
+
+    def __init__(
+            self,
+            server_address: tuple,
+            create_pipeline: Callable,
+            checkpoint: str = "",
+            allow_local_paths: bool = False,
+            max_upload_bytes: int = 2 * 1024**3,
+            scratch_dir: str|None = None
+            ):
+        """
+        Parameters:
+            server_address (tuple): The (host, port) to listen on.
+            create_pipeline (Callable): Creates a NeuraLumaWhisperPipeline for a job, called with the keyword arguments
+                hf_load_dataset_options, progress_cb, workspace and cancel_event.
+            checkpoint (str, optional): The checkpoint of the loaded model, reported by /health. Defaults to "".
+            allow_local_paths (bool, optional): Whether jobs may transcribe files and directories on the server by path. Defaults to False.
+            max_upload_bytes (int, optional): The maximum size of an uploaded file in bytes. Defaults to 2 GB.
+            scratch_dir (str|None, optional): The directory job workspaces are created in. Defaults to None (system temp directory).
+        """
+        super().__init__(server_address, TranscriptionRequestHandler)
+        self.create_pipeline = create_pipeline
+        self.checkpoint = checkpoint
+        self.allow_local_paths = allow_local_paths
+        self.max_upload_bytes = max_upload_bytes
+        self.scratch_dir = scratch_dir
+
+class TranscriptionRequestHandler(BaseHTTPRequestHandler):
+    # Chunked transfer encoding for streaming the results requires HTTP/1.1
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self.send_json(404, {"error": "Not found"})
+            return
+        self.send_json(200, {"status": "ok", "checkpoint": self.server.checkpoint})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/transcribe":
+            self.send_json(404, {"error": "Not found"})
+            return
+
+        # A rejected upload may leave unread bytes behind, so the connection is never reused
+        self.close_connection = True
+        workspace = JobWorkspace(base_dir=self.server.scratch_dir)
+        try:
+            try:
+                job_options = self.read_job_options(parse_qs(url.query), workspace)
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            self.stream_job(job_options, workspace)
+        finally:
+            workspace.cleanup()
+
+    def read_job_options(self, query: dict, workspace: JobWorkspace) -> dict:
+        """
+        Reads the sources and settings of a job from the request, an uploaded file is stored in the workspace.
+
+        Raises:
+            ValueError: If the request is invalid.
+        """
+        content_length = int(self.headers.get("Content-Length") or 0)
+        if content_length > self.server.max_upload_bytes:
+            raise ValueError(f"The request body exceeds the maximum size of {self.server.max_upload_bytes} bytes")
+
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip()
+
+        if content_type == "application/json":
+            try:
+                body = json.loads(self.rfile.read(content_length) or b"{}")
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON body: {e}")
+            if not isinstance(body, dict):
+                raise ValueError("The JSON body must be an object")
+
+            job_options = {
+                "source_path": body.get("source_path"),
+                "youtube_urls": body.get("youtube_urls") or [],
+                "hf_load_dataset_options": body.get("dataset"),
+                "add_timestamps": bool(body.get("add_timestamps", False)),
+                # "both" transcribes and translates in one pass
+                "translate": "both" if body.get("translate") == "both" else bool(body.get("translate", False)),
+            }
+
+            if not isinstance(job_options["youtube_urls"], list) or not all(isinstance(url, str) for url in job_options["youtube_urls"]):
+                raise ValueError("youtube_urls must be a list of URLs")
+
+            if job_options["source_path"] and not self.server.allow_local_paths:
+                raise ValueError("Transcribing local paths is disabled on this server, upload the file instead")
+
+            dataset_options = job_options["hf_load_dataset_options"]
+            if dataset_options is not None:
+                if not isinstance(dataset_options, dict) or not dataset_options.get("source"):
+                    raise ValueError("dataset must be an object with at least a source")
+                job_options["hf_load_dataset_options"] = {
+                    "source": dataset_options["source"],
+                    "subset": dataset_options.get("subset"),
+                    "split": dataset_options.get("split"),
+                    "revision": dataset_options.get("revision", "main"),
+                    "audio_column": dataset_options.get("audio_column", "audio"),
+                    # Rows are transcribed while the dataset is read, so the first results arrive early
+                    "streaming": dataset_options.get("streaming", True),
+                }
+        else:
+            file_name = os.path.basename((query.get("filename") or [""])[0])
+            if not file_name or content_length <= 0:
+                raise ValueError("Upload a file as the request body with ?filename=<name> or send a JSON body")
+
+            upload_path = os.path.join(workspace.get_path("uploads"), file_name)
+            with open(upload_path, "wb") as f:
+                remaining_bytes = content_length
+                while remaining_bytes > 0:
+                    block = self.rfile.read(min(1024 * 1024, remaining_bytes))
+                    if not block:
+                        raise ValueError("The upload ended before Content-Length bytes were received")
+                    f.write(block)
+                    remaining_bytes -= len(block)
+
+            job_options = {
+                "source_path": upload_path,
+                "youtube_urls": [],
+                "hf_load_dataset_options": None,
+                "add_timestamps": (query.get("add_timestamps") or ["0"])[0].lower() in _TRUE_VALUES,
+                "translate": "both" if (query.get("translate") or [""])[0].lower() == "both" else (query.get("translate") or ["0"])[0].lower() in _TRUE_VALUES,
+            }
+
+        if not job_options["source_path"] and len(job_options["youtube_urls"]) <= 0 and job_options["hf_load_dataset_options"] is None:
+            raise ValueError("Please specify a source_path, youtube_urls, a dataset or upload a file")
+
+        return job_options
+
+    def stream_job(self, job_options: dict, workspace: JobWorkspace):
+        """
+        Runs a job and writes every finished item to the response as soon as it is available.
+        """
+        cancel_event = threading.Event()
+        job_done = threading.Event()
+        item_count = 0
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        # A write only fails after the client went away, so the socket is watched while the items are transcribed
+        threading.Thread(target=self.watch_disconnect, args=(cancel_event, job_done), daemon=True).start()
+
+        try:
+            pipeline = self.server.create_pipeline(
+                hf_load_dataset_options=job_options["hf_load_dataset_options"],
+                progress_cb=lambda *args: None,
+                workspace=workspace,
+                cancel_event=cancel_event
+                )
+
+            for transcription in pipeline.iter_transcriptions(
+                    source_path=job_options["source_path"],
+                    youtube_urls=job_options["youtube_urls"],
+                    add_timestamps=job_options["add_timestamps"],
+                    translate=job_options["translate"],
+                    keep_audio=False
+                    ):
+                audio_entry = transcription["audio_entry"]
+                # Paths inside the workspace are internal to the server, the client only knows the file name
+                if isinstance(audio_entry, str) and audio_entry.startswith(workspace.path):
+                    audio_entry = os.path.basename(audio_entry)
+
+                item = {
+                    "idx": transcription["idx"],
+                    "audio_entry": audio_entry,
+                    "text": transcription["transcription"]["text"],
+                    "chunks": transcription["transcription"].get("chunks"),
+                }
+                if "translation" in transcription["transcription"]:
+                    item["translation"] = transcription["transcription"]["translation"]
+                self.write_chunk(_to_json_line(item))
+                item_count += 1
+
+            self.write_chunk(_to_json_line({"done": True, "items": item_count}))
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away, stop the job instead of transcribing for nobody
+            cancel_event.set()
+            return
+        except Exception as e:
+            if cancel_event.is_set():
+                # Cancelled by the disconnect of the client, there is nobody to report to
+                return
+            logging.error(e, exc_info=True)
+            try:
+                self.write_chunk(_to_json_line({"done": True, "items": item_count, "error": str(e)}))
+            except (BrokenPipeError, ConnectionResetError):
+                return
+        finally:
+            job_done.set()
+
+        try:
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def watch_disconnect(self, cancel_event: threading.Event, job_done: threading.Event, poll_interval_s: float = 0.2):
+        """
+        Sets `cancel_event` once the client closes the connection, until `job_done` is set.
+
+        The request body was read completely, so the socket only becomes readable when the client closes it.
+        """
+        while not job_done.is_set() and not cancel_event.is_set():
+            try:
+                readable, _, _ = select.select([self.connection], [], [], poll_interval_s)
+                if not readable:
+                    continue
+                if self.connection.recv(1, socket.MSG_PEEK):
+                    # The client sent more data, its connection state can't be told from the socket
+                    return
+            except (OSError, ValueError):
+                # A reset connection, or the socket was already closed by the finished handler
+                if job_done.is_set():
+                    return
+            cancel_event.set()
+
+    def write_chunk(self, data: bytes):
+        # An empty chunk ends the response
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, status: int, value: dict):
+        body = _to_json_line(value)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.info("%s - %s", self.address_string(), format % args)
@@ -0,0 +1,211 @@
+from transformers.modeling_flax_outputs import FlaxBaseModelOutput
+from whisper_jax import FlaxWhisperForConditionalGeneration
+import numpy as np
+import copy
+import jax
+import jax.numpy as jnp
+
+class SpeculativeDecoder:
+    """
+    Greedy decoding of a Whisper model assisted by a small draft model of the same tokenizer.
+
+    Every round the draft model proposes `num_draft_tokens` tokens one by one, and the main model scores all of
+    them in a single decoder call on its key / value cache. The proposed tokens are accepted as long as they equal
+    the greedy token of the main model, the first differing position gets the token of the main model instead.
+    The main model processes the same inputs with the same logits processors as plain greedy decoding, so the
+    output is identical, only fewer sequential calls of the large decoder are needed when the draft is accurate.
+
+    Decoding runs on a single device and isn't sharded, so WhisperModel rejects a draft model when more than one
+    device is configured. It is meant for hosts where the sequential decoder calls dominate, e.g. CPUs.
+    """
+    def __init__(self, model, params, draft_checkpoint: str, dtype=jnp.float16, max_length: int = 448, num_draft_tokens: int = 4):
+        """
+        Parameters:
+            model (FlaxWhisperForConditionalGeneration): The main model.
+            params: The parameters of the main model on a single device.
+            draft_checkpoint (str): The HF checkpoint of the draft model, e.g. "openai/whisper-tiny".
+            dtype (optional): The JAX dtype of the draft model. Defaults to jnp.float16.
+            max_length (int, optional): The maximum length of the generated sequences. Defaults to 448.
+            num_draft_tokens (int, optional): The number of tokens proposed by the draft model per round. Defaults to 4.
+        """
+        self.model = model
+        self.params = params
+        self.draft_checkpoint = draft_checkpoint
+        self.max_length = max_length
+        self.num_draft_tokens = max(1, num_draft_tokens)
+        self.draft_model, self.draft_params = FlaxWhisperForConditionalGeneration.from_pretrained(draft_checkpoint, _do_init=False, dtype=dtype)
+
+        # The parameters are stored in the dtype of the computation, like the parameters of the main pipeline
+        if dtype == jnp.bfloat16:
+            self.draft_params = self.draft_model.to_bf16(self.draft_params)
+        elif dtype == jnp.float16:
+            self.draft_params = self.draft_model.to_fp16(self.draft_params)
+
+        if self.draft_model.config.vocab_size != self.model.config.vocab_size:
+            raise Exception(f"The draft model {draft_checkpoint} doesn't share the vocabulary of the main model ({self.draft_model.config.vocab_size} != {self.model.config.vocab_size} tokens)")
+
+        self.stats = {"rounds": 0, "drafted_tokens": 0, "accepted_tokens": 0}
+        # Compiled functions and initialized caches, created on first use
+        self._functions = {}
+        self._caches = {}
+
+    def get_acceptance_rate(self) -> float:
+        """
+        Returns the share of the proposed draft tokens that were accepted by the main model.
+        """
+        if self.stats["drafted_tokens"] == 0:
+            return 0.0
+        return self.stats["accepted_tokens"] / self.stats["drafted_tokens"]
+
+    def generate(self, input_features: np.ndarray, forced_decoder_ids_per_task: dict, return_timestamps: bool = False) -> dict:
+        """
+        Generates the token sequences of a batch of chunks for every task, the encoders run once for all tasks.
+
+        Parameters:
+            input_features (np.ndarray): The log-mel features of the chunks.
+            forced_decoder_ids_per_task (dict): The forced decoder ids per task, as returned by `get_forced_decoder_ids` of the pipeline.
+            return_timestamps (bool, optional): Whether timestamp tokens are generated. Defaults to False.
+
+        Returns:
+            dict: The generated sequences (batch, max_length) per task.
+        """
+        encoder_hidden_states = self._get_function("main_encode")(self.params, input_features)
+        draft_encoder_hidden_states = self._get_function("draft_encode")(self.draft_params, input_features)
+
+        return {
+            task: self._generate_task(input_features.shape[0], encoder_hidden_states, draft_encoder_hidden_states, forced_decoder_ids, return_timestamps)
+            for task, forced_decoder_ids in forced_decoder_ids_per_task.items()
+            }
+
+    def _generate_task(self, batch_size, encoder_hidden_states, draft_encoder_hidden_states, forced_decoder_ids, return_timestamps):
+        config = self.model.generation_config
+        logits_processor = self._get_function(("logits_processor", tuple(map(tuple, forced_decoder_ids)), return_timestamps))
+        main_decode = self._get_function("main_decode")
+        draft_decode = self._get_function("draft_decode")
+        main_cache = self._get_cache("main", batch_size, encoder_hidden_states)
+        draft_cache = self._get_cache("draft", batch_size, draft_encoder_hidden_states)
+
+        sequences = np.full((batch_size, self.max_length), config.pad_token_id, dtype=np.int32)
+        sequences[:, 0] = config.decoder_start_token_id
+        is_finished = np.zeros(batch_size, dtype=bool)
+        # Number of tokens in the sequences, all but the last one are in the cache of the main model
+        cur_len = 1
+        draft_cache_len = 0
+
+        def pick_tokens(logits, proposed_sequences, position, finished):
+            # Same selection as the greedy search: processed logits, argmax and padding of finished sequences.
+            # The greedy search has no tokens behind the current position yet, so proposed tokens there are hidden
+            visible_sequences = proposed_sequences.copy()
+            visible_sequences[:, position:] = config.pad_token_id
+            scores = logits_processor(jnp.asarray(visible_sequences), logits, position)
+            tokens = np.asarray(jnp.argmax(scores, axis=-1)).astype(np.int32)
+            tokens = np.where(finished, config.pad_token_id, tokens)
+            return tokens, finished | (tokens == config.eos_token_id)
+
+        while cur_len < self.max_length and not is_finished.all():
+            # The bonus token of the main model must fit behind the proposed tokens
+            num_draft_tokens = min(self.num_draft_tokens, self.max_length - cur_len - 1)
+            proposed_sequences = sequences.copy()
+
+            # The draft model proposes tokens greedily, starting with the tokens it hasn't seen yet
+            draft_finished = is_finished.copy()
+            draft_inputs = proposed_sequences[:, draft_cache_len:cur_len]
+            for draft_idx in range(num_draft_tokens):
+                logits, draft_cache = draft_decode(self.draft_params, draft_inputs, self._positions(batch_size, draft_cache_len, draft_inputs.shape[1]), draft_cache, draft_encoder_hidden_states)
+                draft_cache_len += draft_inputs.shape[1]
+                tokens, draft_finished = pick_tokens(logits[:, -1], proposed_sequences, cur_len + draft_idx, draft_finished)
+                proposed_sequences[:, cur_len + draft_idx] = tokens
+                draft_inputs = tokens[:, None]
+
+            # The main model scores the last accepted token and all proposed tokens in one call
+            main_inputs = proposed_sequences[:, cur_len - 1:cur_len + num_draft_tokens]
+            logits, main_cache = main_decode(self.params, main_inputs, self._positions(batch_size, cur_len - 1, main_inputs.shape[1]), main_cache, encoder_hidden_states)
+
+            accepted_count = 0
+            for verify_idx in range(num_draft_tokens + 1):
+                # The processors see the accepted prefix, which equals the sequence of plain greedy decoding
+                tokens, is_finished = pick_tokens(logits[:, verify_idx], proposed_sequences, cur_len + verify_idx, is_finished)
+                sequences[:, cur_len + verify_idx] = tokens
+                if verify_idx == num_draft_tokens or is_finished.all() or not (tokens == proposed_sequences[:, cur_len + verify_idx]).all():
+                    break
+                accepted_count += 1
+
+            self.stats["rounds"] += 1
+            self.stats["drafted_tokens"] += num_draft_tokens
+            self.stats["accepted_tokens"] += accepted_count
+            cur_len += accepted_count + 1
+
+            # Rejected tokens are dropped from the caches by moving their write position back, stale entries are masked
+            main_cache = self._set_cache_index(main_cache, cur_len - 1)
+            draft_cache_len = min(draft_cache_len, cur_len - 1)
+            draft_cache = self._set_cache_index(draft_cache, draft_cache_len)
+
+        return sequences
+
+    def _positions(self, batch_size, start, length):
+        return np.broadcast_to(np.arange(start, start + length, dtype=np.int32), (batch_size, length))
+
+    def _set_cache_index(self, cache, index):
+        return {
+            key: self._set_cache_index(value, index) if isinstance(value, dict) else (jnp.asarray(index, dtype=value.dtype) if key == "cache_index" else value)
+            for key, value in cache.items()
+            }
+
+    def _get_cache(self, name, batch_size, encoder_hidden_states):
+        # Initializing a cache traces the decoder, so it is done once per batch size and reset for every sequence
+        key = (name, batch_size)
+        if key not in self._caches:
+            model = self.model if name == "main" else self.draft_model
+            self._caches[key] = model.init_cache(batch_size, self.max_length, FlaxBaseModelOutput(last_hidden_state=encoder_hidden_states))
+        return self._set_cache_index(self._caches[key], 0)
+
+    def _get_function(self, name):
+        if name in self._functions:
+            return self._functions[name]
+
+        if name in ("main_encode", "draft_encode"):
+            model = self.model if name == "main_encode" else self.draft_model
+
+            def encode(params, input_features):
+                return model.encode(input_features=input_features, params=params).last_hidden_state
+
+            function = jax.jit(encode)
+        elif name in ("main_decode", "draft_decode"):
+            model = self.model if name == "main_decode" else self.draft_model
+            max_length = self.max_length
+
+            def decode(params, decoder_input_ids, decoder_position_ids, past_key_values, encoder_hidden_states):
+                outputs = model.decode(
+                    decoder_input_ids,
+                    FlaxBaseModelOutput(last_hidden_state=encoder_hidden_states),
+                    # With a cache the mask covers all cached positions, like in the greedy search
+                    decoder_attention_mask=jnp.ones((decoder_input_ids.shape[0], max_length), dtype="i4"),
+                    decoder_position_ids=decoder_position_ids,
+                    past_key_values=past_key_values,
+                    params=params
+                    )
+                return outputs.logits, outputs.past_key_values
+
+            function = jax.jit(decode)
+        else:
+            # ("logits_processor", forced decoder ids, return_timestamps)
+            _, forced_decoder_ids, return_timestamps = name
+            function = jax.jit(self._build_logits_processor([list(ids) for ids in forced_decoder_ids], return_timestamps))
+
+        self._functions[name] = function
+        return function
+
+    def _build_logits_processor(self, forced_decoder_ids, return_timestamps):
+        # Built like in the generate of the main model, so the processed scores equal the ones of plain greedy decoding
+        from transformers.generation.flax_logits_process import FlaxLogitsProcessorList, FlaxWhisperTimeStampLogitsProcessor
+
+        generation_config = copy.deepcopy(self.model.generation_config)
+        generation_config.forced_decoder_ids = forced_decoder_ids
+        generation_config.return_timestamps = return_timestamps
+        generation_config.max_length = self.max_length
+
+        logits_processor = FlaxLogitsProcessorList()
+        if return_timestamps:
+            logits_processor.append(FlaxWhisperTimeStampLogitsProcessor(generation_config, self.model.config, 1))
+
+        return self.model._get_logits_processor(generation_config=generation_config, input_ids_seq_length=1, logits_processor=logits_processor)
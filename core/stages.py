@@ -0,0 +1,143 @@
+from typing import Any, Callable, Iterable, Iterator
+import threading
+import queue
+
+# Marks the end of the items in a queue
+_END_OF_ITEMS = object()
+
+class StageResult:
+    """
+    An item passing through a StagedPipeline.
+
+    Attributes:
+        idx (int): The position of the item in the input.
+        source (Any): The original input item.
+        value (Any): The output of the last stage that ran for this item.
+        error (Exception|None): The exception raised by a stage, later stages are skipped for failed items.
+        failed_stage (str|None): The name of the stage that raised the exception.
+    """
+    def __init__(self, idx: int, source: Any):
+        self.idx = idx
+        self.source = source
+        self.value = source
+        self.error = None
+        self.failed_stage = None
+
+class StagedPipeline:
+    """
+    Runs items through a chain of stages, each with its own worker threads, connected by bounded queues.
+
+    Later stages start working on the first items while earlier stages are still busy with the following ones.
+    A full queue blocks the stage in front of it, which caps the number of items held in memory.
+    The output of the last stage is yielded to the caller, so e.g. model inference can run on the calling thread.
+    Exceptions of a stage are stored in the result of the item, an exception of the input iterable ends the
+    run and is raised to the caller after the items fed before it.
+    """
+    def __init__(self, stages: list[tuple[str, Callable[[Any], Any], int]], queue_size: int = 4):
+        """
+        Parameters:
+            stages (list[tuple[str, Callable, int]]): (name, function, number of workers) per stage. The function receives the output of the previous stage.
+            queue_size (int, optional): The maximum number of items waiting between two stages. Defaults to 4.
+        """
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+
+    def run(self, items: Iterable) -> Iterator[StageResult]:
+        """
+        Feeds the items into the first stage and yields them once they passed the last stage.
+
+        Parameters:
+            items (Iterable): The input items, consumed lazily.
+
+        Returns:
+            Iterator[StageResult]: The processed items in order of completion.
+
+        Raises:
+            Exception: The exception raised by `items`, e.g. by a directory walker, once all items before it were yielded.
+        """
+        stop_event = threading.Event()
+        # The exception of the input iterable, set by the feeder thread
+        feed_errors = []
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0], stop_event, feed_errors), daemon=True)]
+
+        for stage_idx, (name, function, workers) in enumerate(self.stages):
+            workers = max(1, workers)
+            remaining_workers = [workers]
+            lock = threading.Lock()
+
+            for _ in range(workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(name, function, queues[stage_idx], queues[stage_idx + 1], remaining_workers, lock, stop_event),
+                    daemon=True
+                    ))
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                result = queues[-1].get()
+                if result is _END_OF_ITEMS:
+                    break
+                yield result
+
+            # A failing input would otherwise look like a shorter, successful job
+            if len(feed_errors) > 0:
+                raise feed_errors[0]
+        finally:
+            # Unblocks all workers if the caller stops consuming early
+            stop_event.set()
+
+    def _put(self, target_queue: queue.Queue, item, stop_event: threading.Event) -> bool:
+        while not stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source_queue: queue.Queue, stop_event: threading.Event):
+        while not stop_event.is_set():
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END_OF_ITEMS
+
+    def _feed(self, items: Iterable, target_queue: queue.Queue, stop_event: threading.Event, feed_errors: list):
+        try:
+            for idx, item in enumerate(items):
+                if not self._put(target_queue, StageResult(idx, item), stop_event):
+                    return
+        except Exception as e:
+            feed_errors.append(e)
+        finally:
+            self._put(target_queue, _END_OF_ITEMS, stop_event)
+
+    def _work(self, name, function, source_queue, target_queue, remaining_workers, lock, stop_event):
+        while True:
+            result = self._get(source_queue, stop_event)
+
+            if result is _END_OF_ITEMS:
+                # Let the other workers of this stage see the end as well
+                self._put(source_queue, _END_OF_ITEMS, stop_event)
+                with lock:
+                    remaining_workers[0] -= 1
+                    is_last_worker = remaining_workers[0] == 0
+                # Only the last worker to finish closes the next queue, so no item is yielded after the end marker
+                if is_last_worker:
+                    self._put(target_queue, _END_OF_ITEMS, stop_event)
+                return
+
+            if result.error is None:
+                try:
+                    result.value = function(result.value)
+                except Exception as e:
+                    result.error = e
+                    result.failed_stage = name
+
+            if not self._put(target_queue, result, stop_event):
+                return
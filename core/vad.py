@@ -0,0 +1,208 @@
+from core.converter import AudioConverter, WHISPER_SAMPLING_RATE
+import numpy as np
+
+class SpeechRegions:
+    """
+    An audio input together with its speech regions, detected ahead of the model, e.g. in a decode worker.
+
+    Attributes:
+        audio_input: The original input, used e.g. for the cache key.
+        regions (list[tuple[dict, tuple[float, float|None]]]): The regions as returned by `VoiceActivityDetector.split`.
+        duration_s (float|None): The duration of the input in seconds, None for raw bytes.
+    """
+    def __init__(self, audio_input, regions: list, duration_s: float|None = None):
+        self.audio_input = audio_input
+        self.regions = regions
+        self.duration_s = duration_s
+
+class VoiceActivityDetector:
+    """
+    Energy based voice activity detection, used to skip silence before running the model.
+
+    The waveform is split into short frames and a frame counts as speech if its loudness exceeds both an
+    absolute threshold and the noise floor of the input by a margin. Speech frames are joined into regions,
+    short pauses inside speech are bridged and every region is padded, so words at its edges are not cut off.
+    Only the regions are transcribed, their timestamps are shifted back to the time of the original input.
+
+    Audio without quiet frames, e.g. continuous speech or speech over music, has its noise floor at the level
+    of the speech, so the noise floor is ignored once it is above the absolute threshold. If no region is
+    found in audio that is louder than the absolute threshold, the whole input is kept.
+    """
+    def __init__(
+            self,
+            threshold_db: float = -45.0,
+            noise_margin_db: float = 10.0,
+            frame_s: float = 0.03,
+            min_speech_s: float = 0.25,
+            min_silence_s: float = 1.0,
+            padding_s: float = 0.2
+            ):
+        """
+        Parameters:
+            threshold_db (float, optional): The minimum loudness of a speech frame in dBFS. Defaults to -45.0.
+            noise_margin_db (float, optional): How much louder than the noise floor (10th percentile of all frames) a speech frame has to be in dB, as long as the noise floor is below `threshold_db`. Defaults to 10.0.
+            frame_s (float, optional): The length of a frame in seconds. Defaults to 0.03.
+            min_speech_s (float, optional): Speech regions shorter than this are dropped. Defaults to 0.25.
+            min_silence_s (float, optional): Pauses shorter than this don't split a speech region. Defaults to 1.0.
+            padding_s (float, optional): The padding added before and after every speech region. Defaults to 0.2.
+        """
+        self.threshold_db = threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.frame_s = frame_s
+        self.min_speech_s = min_speech_s
+        self.min_silence_s = min_silence_s
+        self.padding_s = padding_s
+
+    def get_settings(self) -> dict:
+        """
+        Returns the settings that influence the detected regions, e.g. to be part of a cache key.
+        """
+        return {
+            "threshold_db": self.threshold_db,
+            "noise_margin_db": self.noise_margin_db,
+            "frame_s": self.frame_s,
+            "min_speech_s": self.min_speech_s,
+            "min_silence_s": self.min_silence_s,
+            "padding_s": self.padding_s,
+        }
+
+    def detect(self, audio_array: np.ndarray, sampling_rate: int) -> list[tuple[int, int]]:
+        """
+        Detects the speech regions of a waveform.
+
+        Parameters:
+            audio_array (np.ndarray): The mono waveform.
+            sampling_rate (int): The sampling rate of the waveform.
+
+        Returns:
+            list[tuple[int, int]]: The (start, end) sample of every speech region, in order.
+        """
+        frame_length = max(1, int(self.frame_s * sampling_rate))
+        frame_count = len(audio_array) // frame_length
+
+        if frame_count == 0:
+            return [(0, len(audio_array))] if len(audio_array) > 0 else []
+
+        frames = np.asarray(audio_array[:frame_count * frame_length], dtype=np.float32).reshape(frame_count, frame_length)
+        frame_db = 10.0 * np.log10(np.mean(np.square(frames), axis=1) + 1e-10)
+        noise_floor_db = float(np.percentile(frame_db, 10))
+        # A noise floor above the absolute threshold means there are no quiet frames to measure the noise with
+        threshold_db = self.threshold_db if noise_floor_db > self.threshold_db else max(self.threshold_db, noise_floor_db + self.noise_margin_db)
+        is_speech = frame_db > threshold_db
+
+        # Start and end frame of every run of speech frames
+        edges = np.diff(np.concatenate(([0], is_speech.astype(np.int8), [0])))
+        run_starts = np.flatnonzero(edges == 1)
+        run_ends = np.flatnonzero(edges == -1)
+
+        regions = []
+        min_silence_frames = self.min_silence_s / self.frame_s
+        for start_frame, end_frame in zip(run_starts, run_ends):
+            if len(regions) > 0 and start_frame - regions[-1][1] < min_silence_frames:
+                regions[-1][1] = end_frame
+            else:
+                regions.append([start_frame, end_frame])
+
+        padding_samples = int(self.padding_s * sampling_rate)
+        min_speech_samples = int(self.min_speech_s * sampling_rate)
+        speech_regions = []
+
+        for start_frame, end_frame in regions:
+            start = max(0, int(start_frame) * frame_length - padding_samples)
+            end = min(len(audio_array), int(end_frame) * frame_length + padding_samples)
+            if end - start - 2 * padding_samples < min_speech_samples:
+                continue
+            # Padding may make neighbouring regions overlap
+            if len(speech_regions) > 0 and start <= speech_regions[-1][1]:
+                speech_regions[-1] = (speech_regions[-1][0], end)
+            else:
+                speech_regions.append((start, end))
+
+        # Audible input without a region, e.g. speech only slightly above a quiet noise floor, is transcribed as a whole
+        if len(speech_regions) == 0 and float(np.max(frame_db)) > self.threshold_db:
+            return [(0, len(audio_array))]
+
+        return speech_regions
+
+    def split(self, audio_input) -> list[tuple[dict, tuple[float, float|None]]]:
+        """
+        Splits an audio input into its speech regions.
+
+        Parameters:
+            audio_input (np.ndarray or str or bytes or dict): Any input accepted by WhisperModel.transcribe.
+                Raw bytes can't be analyzed without decoding and are returned unchanged as one region.
+
+        Returns:
+            list[tuple[dict, tuple]]: The audio of every speech region with its (start, end) in seconds relative to the start of the input.
+        """
+        return self.prepare(audio_input).regions
+
+    def prepare(self, audio_input) -> SpeechRegions:
+        """
+        Decodes an audio input and splits it into its speech regions, so this work can run ahead of the model.
+
+        Parameters:
+            audio_input (np.ndarray or str or bytes or dict): Any input accepted by `split`.
+
+        Returns:
+            SpeechRegions: The input with its speech regions and its duration.
+        """
+        if isinstance(audio_input, SpeechRegions):
+            return audio_input
+
+        if isinstance(audio_input, bytes):
+            return SpeechRegions(audio_input, [(audio_input, (0.0, None))])
+
+        decoded_input = AudioConverter().decode_to_array(audio_input) if isinstance(audio_input, str) else audio_input
+
+        if isinstance(decoded_input, dict):
+            audio_array = decoded_input["array"]
+            sampling_rate = decoded_input["sampling_rate"]
+        else:
+            audio_array = decoded_input
+            sampling_rate = WHISPER_SAMPLING_RATE
+
+        regions = [
+            ({"array": audio_array[start:end], "sampling_rate": sampling_rate}, (start / sampling_rate, end / sampling_rate))
+            for start, end in self.detect(audio_array, sampling_rate)
+            ]
+        return SpeechRegions(audio_input, regions, duration_s=len(audio_array) / sampling_rate)
+
+    def merge_transcriptions(self, region_transcriptions: list[dict], regions_s: list[tuple[float, float|None]], add_timestamps=False) -> dict:
+        """
+        Merges the transcriptions of the speech regions of one input into a single transcription.
+
+        Parameters:
+            region_transcriptions (list[dict]): The transcription of every speech region, in order.
+            regions_s (list[tuple[float, float|None]]): The (start, end) of every speech region in seconds, as returned by `split`.
+            add_timestamps (bool, optional): Whether the transcriptions contain timestamped chunks. Defaults to False.
+
+        Returns:
+            dict: The transcription with timestamps relative to the start of the input.
+        """
+        texts = [transcription["text"].strip() for transcription in region_transcriptions]
+        merged_transcription = {"text": " ".join(text for text in texts if text)}
+
+        if add_timestamps:
+            merged_transcription["chunks"] = []
+            for transcription, (region_start_s, region_end_s) in zip(region_transcriptions, regions_s):
+                for chunk in transcription.get("chunks", []):
+                    start, end = chunk["timestamp"]
+                    merged_transcription["chunks"].append({
+                        **chunk,
+                        # The last chunk of a region may be open ended, it ends with the region at the latest
+                        "timestamp": (
+                            start + region_start_s if start is not None else region_start_s,
+                            end + region_start_s if end is not None else region_end_s
+                            ),
+                        })
+
+        # The combined task adds the translation of every region, which is merged the same way
+        if any("translation" in transcription for transcription in region_transcriptions):
+            merged_transcription["translation"] = self.merge_transcriptions(
+                [transcription.get("translation", {"text": ""}) for transcription in region_transcriptions],
+                regions_s,
+                add_timestamps=add_timestamps
+                )
+
+        return merged_transcription
@@ -0,0 +1,346 @@
+from typing import Callable
+import threading
+import hashlib
+import logging
+import sqlite3
+import json
+import time
+import os
+
+class WatchIndex:
+    """
+    Persistent SQLite index of the files of a watched folder and the transcriptions of their content.
+
+    A file is only hashed again if its size or modification time changed, and only transcribed again if
+    its content hash changed. Transcriptions are stored with their content hash, so a moved or copied file
+    gets its outputs without running the model. Files that disappear are only marked missing, so their
+    transcriptions stay available until they are removed after a retention time.
+    """
+    def __init__(self, index_path: str):
+        """
+        Parameters:
+            index_path (str): The path of the SQLite database, created if it doesn't exist.
+        """
+        self.index_path = index_path
+        index_dir = os.path.dirname(index_path)
+        if index_dir and not os.path.exists(index_dir):
+            os.makedirs(index_dir, exist_ok=True)
+
+        self.connection = sqlite3.connect(index_path)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    settings TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    transcription TEXT,
+                    outputs TEXT,
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    missing_since REAL
+                )
+                """)
+            # Indexes created before files were marked missing
+            columns = {row["name"] for row in self.connection.execute("PRAGMA table_info(files)")}
+            if "missing_since" not in columns:
+                self.connection.execute("ALTER TABLE files ADD COLUMN missing_since REAL")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS files_content ON files (content_hash, settings)")
+
+    def get(self, path: str) -> dict|None:
+        """
+        Returns the record of a file or None if it isn't indexed.
+        """
+        row = self.connection.execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def find_transcription(self, content_hash: str, settings: str) -> dict|None:
+        """
+        Returns a stored transcription of the given content transcribed with the given settings, None if there is none.
+        """
+        row = self.connection.execute(
+            "SELECT transcription FROM files WHERE content_hash = ? AND settings = ? AND status = 'done' LIMIT 1",
+            (content_hash, settings)
+            ).fetchone()
+        return json.loads(row["transcription"]) if row is not None else None
+
+    def record(self, path: str, size: int, mtime_ns: int, content_hash: str, settings: str, transcription: dict|None = None, outputs: list[str]|None = None, error: str|None = None):
+        """
+        Records a transcribed or failed file. Failed files are only retried once they change.
+
+        Parameters:
+            path (str): The path of the file.
+            size (int): The size of the file in bytes.
+            mtime_ns (int): The modification time of the file in ns.
+            content_hash (str): The hash of the file content.
+            settings (str): The settings the file was transcribed with.
+            transcription (dict|None, optional): The transcription of the file, None if it failed. Defaults to None.
+            outputs (list[str]|None, optional): The paths of the written output files. Defaults to None.
+            error (str|None, optional): The reason the file failed. Defaults to None.
+        """
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, content_hash, settings, status, transcription, outputs, error, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    path, size, mtime_ns, content_hash, settings,
+                    "done" if transcription is not None else "failed",
+                    # Timestamps may be numpy scalars
+                    json.dumps(transcription, ensure_ascii=False, default=lambda value: value.item() if hasattr(value, 'item') else str(value)) if transcription is not None else None,
+                    json.dumps(outputs or []),
+                    error,
+                    time.time(),
+                )
+                )
+
+    def update_stat(self, path: str, size: int, mtime_ns: int):
+        """
+        Updates the size and modification time of a file whose content didn't change, e.g. after a touch.
+        """
+        with self.connection:
+            self.connection.execute("UPDATE files SET size = ?, mtime_ns = ?, updated_at = ? WHERE path = ?", (size, mtime_ns, time.time(), path))
+
+    def mark_missing(self, existing_paths: set) -> int:
+        """
+        Marks the records of files that weren't found by a scan as missing and clears the mark of files that are back.
+
+        Returns:
+            int: The number of records newly marked missing.
+        """
+        now = time.time()
+        rows = self.connection.execute("SELECT path, missing_since FROM files").fetchall()
+        missing_paths = [(now, row["path"]) for row in rows if row["path"] not in existing_paths and row["missing_since"] is None]
+        returned_paths = [(row["path"],) for row in rows if row["path"] in existing_paths and row["missing_since"] is not None]
+        with self.connection:
+            self.connection.executemany("UPDATE files SET missing_since = ? WHERE path = ?", missing_paths)
+            self.connection.executemany("UPDATE files SET missing_since = NULL WHERE path = ?", returned_paths)
+        return len(missing_paths)
+
+    def remove_missing(self, missing_for_s: float) -> int:
+        """
+        Removes the records of files that have been missing for longer than `missing_for_s` seconds.
+
+        Returns:
+            int: The number of removed records.
+        """
+        with self.connection:
+            cursor = self.connection.execute("DELETE FROM files WHERE missing_since IS NOT NULL AND missing_since <= ?", (time.time() - missing_for_s,))
+        return cursor.rowcount
+
+    def close(self):
+        self.connection.close()
+
+def hash_file(file_path: str) -> str:
+    """
+    Returns the sha256 hex digest of the content of a file.
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+class FolderWatcher:
+    """
+    Watches a folder and transcribes new and modified media files with a warm pipeline.
+
+    Every scan walks the folder, compares the files with the WatchIndex and transcribes only the changed
+    ones, so the work of a scan is proportional to what changed. The outputs mirror the folder structure
+    of the watched folder in the output directory, a modified file overwrites its previous outputs.
+
+    A scan that can't list a directory, e.g. during an outage of a network share, doesn't mark any file
+    missing, as the files it didn't see may still exist.
+    """
+    def __init__(
+            self,
+            pipeline,
+            source_dir: str,
+            output_path: str,
+            index: WatchIndex,
+            add_timestamps: bool = False,
+            translate: bool|str = False,
+            interval_s: float = 30.0,
+            settle_s: float = 5.0,
+            missing_retention_s: float = 7 * 24 * 3600.0,
+            progress_cb: Callable = lambda *args: None
+            ):
+        """
+        Parameters:
+            pipeline (NeuraLumaWhisperPipeline): The pipeline used for every scan, its model stays loaded between scans.
+            source_dir (str): The watched folder.
+            output_path (str): The directory the transcriptions are written to.
+            index (WatchIndex): The index of the already transcribed files.
+            add_timestamps (bool, optional): Whether timestamps are added. Defaults to False.
+            translate (bool|str, optional): Whether the audio is translated to english instead of transcribed, "both" writes both. Defaults to False.
+            interval_s (float, optional): The time between two scans in seconds. Defaults to 30.0.
+            settle_s (float, optional): Files modified more recently than this are skipped until the next scan, as they may still be copied. Defaults to 5.0.
+            missing_retention_s (float, optional): The time in seconds the records of missing files are kept for reusing their transcriptions. Defaults to 7 days.
+            progress_cb (Callable, optional): Receives progress messages. Defaults to a no-op.
+        """
+        self.pipeline = pipeline
+        self.source_dir = os.path.abspath(source_dir)
+        self.output_path = output_path
+        self.index = index
+        self.add_timestamps = add_timestamps
+        self.translate = translate
+        self.interval_s = interval_s
+        self.settle_s = settle_s
+        self.missing_retention_s = missing_retention_s
+        self.progress_cb = progress_cb
+
+    def get_settings(self) -> str:
+        """
+        Returns the settings that change a transcription, files transcribed with other settings are transcribed again.
+        """
+        whisper_model = self.pipeline.whisper_model
+        settings = {
+            "checkpoint": whisper_model.checkpoint,
+            "dtype": getattr(whisper_model.dtype, "__name__", str(whisper_model.dtype)),
+            "task": self.pipeline.get_task(self.translate),
+            "timestamps": bool(self.add_timestamps),
+        }
+        if self.pipeline.vad is not None:
+            settings["vad"] = self.pipeline.vad.get_settings()
+        return json.dumps(settings, sort_keys=True)
+
+    def scan(self) -> (list[dict], dict):
+        """
+        Walks the watched folder and returns the new and modified files.
+
+        Returns:
+            tuple: (changed files, scan stats). Every changed file is a dict with path, size, mtime_ns and content_hash.
+                The stats count the "scanned" and "settling" files, the files newly marked "missing", the records
+                "removed" after the retention time and the directories that couldn't be listed ("walk_errors").
+        """
+        settings = self.get_settings()
+        changed_files = []
+        existing_paths = set()
+        walk_errors = []
+        stats = {"scanned": 0, "settling": 0, "missing": 0, "removed": 0, "walk_errors": 0}
+
+        for path in self.pipeline.file_walker.walk(self.source_dir, on_error=lambda directory, error: walk_errors.append(directory)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            existing_paths.add(path)
+            stats["scanned"] += 1
+
+            # The file may still be copied into the folder
+            if time.time() - stat.st_mtime < self.settle_s:
+                stats["settling"] += 1
+                continue
+
+            record = self.index.get(path)
+            if record is not None and record["settings"] == settings and record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns:
+                continue
+
+            try:
+                content_hash = hash_file(path)
+            except OSError:
+                continue
+
+            if record is not None and record["settings"] == settings and record["content_hash"] == content_hash:
+                # Touched or rewritten with the same content
+                self.index.update_stat(path, stat.st_size, stat.st_mtime_ns)
+                continue
+
+            changed_files.append({"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "content_hash": content_hash})
+
+        stats["walk_errors"] = len(walk_errors)
+        if len(walk_errors) > 0:
+            logging.warning(f"Couldn't list {len(walk_errors)} directories of {self.source_dir}, no files are marked missing in this scan")
+        else:
+            stats["missing"] = self.index.mark_missing(existing_paths)
+        stats["removed"] = self.index.remove_missing(self.missing_retention_s)
+        return changed_files, stats
+
+    def write_outputs(self, file_path: str, transcription: dict) -> list[str]:
+        """
+        Writes the outputs of a file to the mirrored directory of the output directory.
+
+        Returns:
+            list[str]: The paths of the written files.
+        """
+        relative_path = os.path.relpath(file_path, self.source_dir)
+        output_dir = os.path.join(self.output_path, os.path.dirname(relative_path))
+        # The full file name is kept, so e.g. talk.mp3 and talk.mp4 don't overwrite each other's outputs
+        base_output_filename = os.path.basename(relative_path)
+
+        self.pipeline.write_transcription_to_file(
+            transcription={"audio_entry": file_path, "transcription": transcription},
+            base_ouput_filename=base_output_filename,
+            output_path=output_dir,
+            translate=self.translate,
+            add_timestamps=self.add_timestamps
+            )
+
+        output_kinds = [".transcription", ".translation"] if self.translate == "both" else [".translation" if self.translate else ".transcription"]
+        output_extensions = [".txt", ".sbv"] if self.add_timestamps else [".txt"]
+        return [os.path.join(output_dir, base_output_filename + output_kind + extension) for output_kind in output_kinds for extension in output_extensions]
+
+    def run_once(self) -> dict:
+        """
+        Scans the watched folder once and transcribes all new and modified files.
+
+        Returns:
+            dict: The scan stats with the additional keys "changed", "transcribed", "reused" and "failed".
+        """
+        settings = self.get_settings()
+        changed_files, stats = self.scan()
+        stats.update({"changed": len(changed_files), "transcribed": 0, "reused": 0, "failed": 0})
+
+        # Content that was already transcribed under another path, e.g. a moved file, doesn't need the model
+        pending_files = []
+        for changed_file in changed_files:
+            stored_transcription = self.index.find_transcription(changed_file["content_hash"], settings)
+            if stored_transcription is None:
+                pending_files.append(changed_file)
+                continue
+            outputs = self.write_outputs(changed_file["path"], stored_transcription)
+            self.index.record(**changed_file, settings=settings, transcription=stored_transcription, outputs=outputs)
+            stats["reused"] += 1
+
+        finished_indices = set()
+        if len(pending_files) > 0:
+            self.progress_cb(f"{'Translating' if self.translate else 'Transcribing'} {len(pending_files)} new or modified files", 0.0)
+            for file_idx, transcription in self.pipeline.iter_transcribe_files(
+                    [pending_file["path"] for pending_file in pending_files],
+                    add_timestamps=self.add_timestamps,
+                    translate=self.translate
+                    ):
+                outputs = self.write_outputs(pending_files[file_idx]["path"], transcription["transcription"])
+                self.index.record(**pending_files[file_idx], settings=settings, transcription=transcription["transcription"], outputs=outputs)
+                # Audio converted from a video is only needed until the transcription is indexed
+                self.pipeline.remove_workspace_audio(transcription["audio_entry"])
+                finished_indices.add(file_idx)
+                stats["transcribed"] += 1
+
+        # Files that failed to decode are not retried until they change
+        for file_idx, pending_file in enumerate(pending_files):
+            if file_idx not in finished_indices:
+                self.index.record(**pending_file, settings=settings, error="Failed to decode or transcribe")
+                stats["failed"] += 1
+
+        return stats
+
+    def watch(self, stop_event: threading.Event|None = None):
+        """
+        Scans the watched folder every `interval_s` seconds until `stop_event` is set or the process is interrupted.
+
+        A scan that fails, e.g. because the share is unavailable, is logged and repeated at the next interval.
+        """
+        stop_event = stop_event or threading.Event()
+
+        while not stop_event.is_set():
+            try:
+                stats = self.run_once()
+                self.progress_cb(
+                    f"Scanned {stats['scanned']} files: {stats['transcribed']} transcribed, {stats['reused']} reused, "
+                    f"{stats['failed']} failed, {stats['settling']} still changing, {stats['missing']} missing, {stats['walk_errors']} unreadable directories", 1.0
+                    )
+            except Exception as e:
+                logging.error(e, exc_info=True)
+            stop_event.wait(self.interval_s)
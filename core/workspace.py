@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+# Memory backed file system available on most Linux hosts
+TMPFS_PATH = "/dev/shm"
+
+class JobWorkspace:
+    """
+    A private scratch directory for the intermediate files of one job, e.g. downloads and converted audio.
+
+    Every job gets its own directory below the base directory, so concurrent jobs on the same host never
+    share or delete each other's files. The directory is created on first use and `cleanup` only removes
+    this directory.
+    """
+    def __init__(self, base_dir: str|None = None, use_tmpfs: bool = False, job_id: str|None = None):
+        """
+        Parameters:
+            base_dir (str|None, optional): The scratch directory the workspace is created in. Defaults to None (tmpfs or the system temp directory).
+            use_tmpfs (bool, optional): Whether the workspace is created on tmpfs (/dev/shm) if no base directory is given. Defaults to False.
+            job_id (str|None, optional): The id of the job, used in the directory name. Defaults to None (a random id).
+        """
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.base_dir = base_dir or self.get_default_base_dir(use_tmpfs=use_tmpfs)
+        self.path = os.path.join(self.base_dir, f"neuraluma_job_{self.job_id}")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_default_base_dir(use_tmpfs: bool = False) -> str:
+        """
+        Returns tmpfs if requested and available, otherwise the temp directory of the system.
+        """
+        if use_tmpfs and os.path.isdir(TMPFS_PATH) and os.access(TMPFS_PATH, os.W_OK):
+            return TMPFS_PATH
+        return tempfile.gettempdir()
+
+    def get_path(self, *sub_paths: str) -> str:
+        """
+        Returns a directory inside the workspace and creates it if needed.
+
+        Parameters:
+            *sub_paths (str): The path components of the directory relative to the workspace.
+
+        Returns:
+            str: The absolute path of the directory.
+        """
+        path = os.path.join(self.path, *sub_paths)
+        # Stages create their directories from several worker threads at once
+        with self._lock:
+            os.makedirs(path, exist_ok=True)
+        return path
+
+    def cleanup(self):
+        """
+        Removes the workspace with all files in it, a later `get_path` creates it again.
+        """
+        with self._lock:
+            if os.path.exists(self.path):
+                shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
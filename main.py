@@ -1,9 +1,10 @@
 ### File for CLI ###
 import argparse
-import jax.numpy as jnp
-from core.pipeline import NeuraLumaWhisperPipeline
-from tqdm import tqdm
+from core.devices import configure_devices
 import logging
+import os
+import sys
+import time
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="NeuraLumaWhisper transcription tool")
@@ -14,6 +15,7 @@ if __name__ == "__main__":
     parser.add_argument('-ldr', '--hf_load_dataset_revision', help='HF dataset revision to load', default='main')
     parser.add_argument('-ldst', '--hf_load_dataset_subset', help='HF dataset subset to load', required=False)
     parser.add_argument('-ldsp', '--hf_load_dataset_split', help='HF dataset split to load', required=False)
+    parser.add_argument('-ldsm', '--hf_load_dataset_streaming', help='Streams the HF dataset, rows are loaded lazily while transcribing instead of loading the whole dataset first', action='store_true')
     parser.add_argument('-o', '--output', help='Path to the directory for the transcribed files', required=False)
     parser.add_argument('-sd', '--hf_save_dataset', help='HF dataset Hub Id to save to e.g. my_user/my_dataset', required=False)
     parser.add_argument('-sdp', '--hf_save_dataset_private', help='Set whether the HF dataset is private', default=True, choices=[True, False], type=bool)
@@ -23,31 +25,84 @@ if __name__ == "__main__":
     parser.add_argument('-sdr', '--hf_save_dataset_revision', help='HF dataset revision to save to', default='main')
     #parser.add_argument('-sds', '--hf_save_dataset_subset', help='HF dataset subset to save to', required=False)
     parser.add_argument('-sdsp', '--hf_save_dataset_split', help='HF dataset split to save to', required=False)
+    parser.add_argument('-sdl', '--hf_save_dataset_local', help='Local directory the HF dataset shards are written to, pushing to the hub with -sd is optional', required=False)
+    parser.add_argument('-sdms', '--hf_save_dataset_max_shard_size', help='Maximum size of a HF dataset shard in MB', default=500, type=float)
+    parser.add_argument('-sduw', '--hf_save_dataset_upload_workers', help='Maximum number of concurrent shard uploads', default=4, type=int)
+    parser.add_argument('-pd', '--hf_push_dataset', help='Only pushes the shards of an already written local HF dataset directory to -sd --hf_save_dataset, with -r --resume shards this directory already uploaded are skipped', required=False)
+    parser.add_argument('-wa', '--watch', help='Keeps running and transcribes new or modified media files of the -s --source directory to -o --output, unchanged files are skipped', action='store_true')
+    parser.add_argument('-wi', '--watch_interval', help='Seconds between two scans of the watched directory', default=30.0, type=float)
+    parser.add_argument('-wix', '--watch_index', help='Path of the SQLite index of already transcribed files. Defaults to .neuraluma_watch.sqlite in the output directory', required=False)
     parser.add_argument('-ts', '--timestamp', help='Activates timestamps. Adds a seperate file with sbv extension', action='store_true')
     parser.add_argument('-tl', '--translate', help='Sets the mode to translation', action='store_true')
+    parser.add_argument('-tt', '--transcribe_and_translate', help='Transcribes and translates in one pass, the audio is encoded only once. Writes .transcription and .translation files', action='store_true')
+    parser.add_argument('-r', '--resume', help='Resumes an interrupted job, items already recorded in the manifest of the output directory are skipped', action='store_true')
     parser.add_argument('-d', '--dtype', help='Sets the dtype to use', default='float16', choices=['float16', 'bfloat16', 'float32', 'float64'])
     parser.add_argument('-b', '--batch_size', help='Sets the batch size for inference', default=1, type=int)
     parser.add_argument('-hfc', '--hf_checkpoint', help='Sets the hf checkpoint to use', default='openai/whisper-large-v2')
-    # ToDo: Do some temp post-cleanup
+    parser.add_argument('-dc', '--draft_checkpoint', help='Enables speculative decoding with this small hf checkpoint as draft model, e.g. openai/whisper-tiny. The output is identical to plain greedy decoding. Only available on a single device', required=False)
+    parser.add_argument('-ndt', '--num_draft_tokens', help='Sets the number of tokens the draft model of -dc --draft_checkpoint proposes per step', default=4, type=int)
+    parser.add_argument('-dim', '--decode_in_memory', help='Decodes audio and video directly to 16 kHz audio in memory instead of converting videos to mp3 files first', action='store_true')
+    parser.add_argument('-w', '--max_workers', help='Sets the number of worker threads decoding media files in parallel, each runs its own ffmpeg process. 0 uses all CPUs', default=1, type=int)
+    parser.add_argument('-dw', '--download_workers', help='Sets the maximum number of concurrent YouTube downloads', default=4, type=int)
+    parser.add_argument('-qs', '--queue_size', help='Sets the maximum number of prepared files waiting between the download, decode and inference stages', default=4, type=int)
+    parser.add_argument('-lb', '--length_bucketing', help='Probes the duration of all inputs first and batches inputs of similar length together, longest first', action='store_true')
+    parser.add_argument('-vad', '--vad', help='Detects speech regions before inference, so only speech is transcribed and silence is skipped', action='store_true')
+    parser.add_argument('-vadt', '--vad_threshold', help='Minimum loudness in dBFS of audio detected as speech by -vad --vad', default=-45.0, type=float)
+    parser.add_argument('-ih', '--include_hidden', help='Also transcribes files in hidden directories and hidden files of -s --source', action='store_true')
+    parser.add_argument('-xd', '--exclude_dirs', help="Names of directories of -s --source that are not searched for media files, seperate with semicolon (';'). Tool directories like __pycache__ are always skipped", required=False)
+    parser.add_argument('-sdir', '--scratch_dir', help='Directory the private workspace of this job is created in for downloads and converted audio. Defaults to the system temp directory', required=False)
+    parser.add_argument('-tmpfs', '--tmpfs', help='Creates the job workspace on tmpfs (/dev/shm) if no scratch directory is given', action='store_true')
+    parser.add_argument('-cd', '--cache_dir', help='Directory of the transcription cache, previously transcribed audio with the same settings is not transcribed again', required=False)
+    parser.add_argument('-cms', '--cache_max_size', help='Maximum size of the transcription cache in MB, least recently used entries are evicted first', default=1024, type=float)
+    parser.add_argument('-dev', '--devices', help='Number of devices the model is replicated on, batches are sharded across them. On CPU hosts the CPU is split into this many devices', type=int, required=False)
+    parser.add_argument('-ccd', '--compilation_cache_dir', help='Directory of the persistent JAX compilation cache, later runs load the compiled model from here. Defaults to ~/.cache/neuraluma_whisper/jax_compilation_cache', required=False)
+    parser.add_argument('-nocc', '--no_compilation_cache', help='Disables the persistent JAX compilation cache', action='store_true')
+    parser.add_argument('-sj', '--stats_json', help='Exports the per stage timing, throughput and real-time factor of the run to this JSON file', required=False)
+    parser.add_argument('-mcm', '--model_cache_memory', help='Memory budget in GB for keeping loaded models warm, least recently used models are evicted first', type=float, required=False)
     # ToDo: Add name scheming option (single file = name_scheme, multiple files = name_scheme_idx, name_scheme => base_filename)
-    # ToDo: Add option to save huggingface dataset to disk and optionally push to hub
     # ToDo: Add more verbose logging / progress
     
     args = parser.parse_args()
+
     source_path = args.source
     output_path = args.output
     youtube = args.youtube
     add_timestamps = args.timestamp
     translate = args.translate
+    transcribe_and_translate = args.transcribe_and_translate
+    resume = args.resume
+    watch = args.watch
+    watch_interval = args.watch_interval
+    watch_index = args.watch_index
     dtype = args.dtype
     batch_size = args.batch_size
     hf_checkpoint = args.hf_checkpoint
+    draft_checkpoint = args.draft_checkpoint
+    num_draft_tokens = args.num_draft_tokens
+    model_cache_memory = args.model_cache_memory
+    compilation_cache_dir = args.compilation_cache_dir
+    no_compilation_cache = args.no_compilation_cache
+    decode_in_memory = args.decode_in_memory
+    max_workers = args.max_workers if args.max_workers > 0 else None
+    download_workers = args.download_workers
+    queue_size = args.queue_size
+    length_bucketing = args.length_bucketing
+    vad = args.vad
+    vad_threshold = args.vad_threshold
+    include_hidden = args.include_hidden
+    exclude_dirs = [exclude_dir for exclude_dir in (args.exclude_dirs or "").split(";") if exclude_dir.strip()]
+    scratch_dir = args.scratch_dir
+    use_tmpfs = args.tmpfs
+    cache_dir = args.cache_dir
+    cache_max_size = args.cache_max_size
+    stats_json = args.stats_json
     # Loading Dataset Options
     hf_load_dataset = args.hf_load_dataset
     hf_load_dataset_column = args.hf_load_dataset_column
     hf_load_dataset_revision = args.hf_load_dataset_revision
     hf_load_dataset_subset = args.hf_load_dataset_subset
     hf_load_dataset_split = args.hf_load_dataset_split
+    hf_load_dataset_streaming = args.hf_load_dataset_streaming
     # Saving Dataset Options
     hf_save_dataset = args.hf_save_dataset
     hf_save_dataset_private = args.hf_save_dataset_private
@@ -57,17 +112,54 @@ if __name__ == "__main__":
     hf_save_dataset_revision = args.hf_save_dataset_revision
     #hf_save_dataset_subset = args.hf_save_dataset_subset
     hf_save_dataset_split = args.hf_save_dataset_split
+    hf_save_dataset_local = args.hf_save_dataset_local
+    hf_save_dataset_max_shard_size = args.hf_save_dataset_max_shard_size
+    hf_save_dataset_upload_workers = args.hf_save_dataset_upload_workers
+    hf_push_dataset = args.hf_push_dataset
+
+    if hf_push_dataset:
+        if not hf_save_dataset:
+            raise Exception("Please specify -sd --hf_save_dataset as target to push the dataset to")
+        from core.dataset_writer import DatasetShardUploader
+        uploader = DatasetShardUploader(max_workers=hf_save_dataset_upload_workers)
+        uploaded_paths, failed_paths = uploader.upload(hf_push_dataset, repo_id=hf_save_dataset, revision=hf_save_dataset_revision, private=hf_save_dataset_private, resume=resume)
+        print(f"Pushed {len(uploaded_paths)} shards to {hf_save_dataset}")
+        if len(failed_paths) > 0:
+            logging.error(f"Failed to upload {len(failed_paths)} shards, push again with -r --resume to upload the remaining shards: {', '.join(failed_paths)}")
+            sys.exit(1)
+        sys.exit(0)
 
     # ToDo: Implement subsets
 
     if not youtube and not source_path and not hf_load_dataset:
         raise Exception("Please specify either -y --youtube and/or -s --source and/or -ld --hf_load_dataset")
     
-    if not output_path and not hf_save_dataset:
-        raise Exception("Please specify either -o --output and/or -sd --hf_save_dataset")
+    if not output_path and not hf_save_dataset and not hf_save_dataset_local:
+        raise Exception("Please specify either -o --output and/or -sd --hf_save_dataset and/or -sdl --hf_save_dataset_local")
     
+    if resume and not output_path:
+        raise Exception("Please specify -o --output to resume a job, the progress manifest is stored in the output directory")
+    
+    if watch and (not source_path or not os.path.isdir(source_path) or not output_path):
+        raise Exception("Please specify a directory with -s --source and -o --output to watch a directory")
+
     if youtube is None:
         youtube = ""
+
+    # Heavy dependencies are only imported once the arguments are valid, so --help and argument errors return immediately.
+    # JAX reads the device configuration on import, so the devices are configured first
+    configure_devices(args.devices)
+    import jax.numpy as jnp
+    from core.pipeline import NeuraLumaWhisperPipeline, TRANSLATE_BOTH
+    from core.registry import model_registry
+    from core.model import WhisperModel, DEFAULT_COMPILATION_CACHE_DIR
+    from core.cache import TranscriptionCache
+    from core.vad import VoiceActivityDetector
+    from core.workspace import JobWorkspace
+    from core.progress import ProgressTracker
+    from core.discovery import MediaFileWalker, DEFAULT_IGNORED_DIRECTORIES
+    from core.converter import AUDIO_FILE_EXTENSIONS, VIDEO_FILE_EXTENSIONS
+    from tqdm import tqdm
     
     hf_load_dataset_options = None
     if hf_load_dataset:
@@ -76,11 +168,12 @@ if __name__ == "__main__":
             "audio_column": hf_load_dataset_column, 
             "revision": hf_load_dataset_revision,
             "subset": hf_load_dataset_subset,
-            "split": hf_load_dataset_split
+            "split": hf_load_dataset_split,
+            "streaming": hf_load_dataset_streaming
             }
     
     hf_save_dataset_options = None
-    if hf_save_dataset:
+    if hf_save_dataset or hf_save_dataset_local:
         hf_save_dataset_options = {
             "target": hf_save_dataset, 
             "private": hf_save_dataset_private,
@@ -89,25 +182,107 @@ if __name__ == "__main__":
             "text_sbv_column": hf_save_dataset_column_text_sbv,
             "revision": hf_save_dataset_revision,
             #"subset": hf_save_dataset_subset,
-            "split": hf_save_dataset_split
+            "split": hf_save_dataset_split,
+            "local_path": hf_save_dataset_local,
+            "max_shard_size": hf_save_dataset_max_shard_size,
+            "upload_workers": hf_save_dataset_upload_workers
             }
     
-    pbar = tqdm()
+    if model_cache_memory is not None:
+        model_registry.set_max_memory_bytes(int(model_cache_memory * 1024**3))
+
+    if not no_compilation_cache:
+        WhisperModel.enable_compilation_cache(compilation_cache_dir or DEFAULT_COMPILATION_CACHE_DIR)
+
+    transcription_cache = None
+    if cache_dir:
+        transcription_cache = TranscriptionCache(cache_dir=cache_dir, max_size_bytes=int(cache_max_size * 1024**2))
+
+    voice_activity_detector = None
+    if vad:
+        voice_activity_detector = VoiceActivityDetector(threshold_db=vad_threshold)
+
+    # The progress bar counts transcribed items, the messages only describe the current step
+    pbar = tqdm(unit="item")
     def progress_cb(msg, progress_amount=0):
-        # ToDo: Improve this, the progress bar doesn't really work
-        pbar.update(progress_amount)
         pbar.set_postfix_str(f"{msg}")
 
+    def on_progress_event(event):
+        # Cache hits are finished items as well
+        if event.stage in ("model", "cache") and event.elapsed_s is not None:
+            pbar.update(event.items)
+
+    def print_acceptance_rate():
+        acceptance_rate = whisper_model.get_acceptance_rate()
+        if acceptance_rate is not None:
+            print(f"Speculative decoding: {acceptance_rate:.1%} of the draft tokens accepted")
+
+    start_time = time.perf_counter()
+    whisper_model = model_registry.get(checkpoint=hf_checkpoint, dtype=getattr(jnp, dtype), batch_size=batch_size, draft_checkpoint=draft_checkpoint, num_draft_tokens=num_draft_tokens)
+    model_load_s = time.perf_counter() - start_time
+
+    if transcribe_and_translate:
+        translate = TRANSLATE_BOTH
+
+    # Compiles the variant of this job up front, so the startup time is measured separately from the transcription
+    progress_cb("Compiling model", 0.0)
+    warmup_stats = whisper_model.warmup(tasks=(NeuraLumaWhisperPipeline.get_task(translate),), add_timestamps_variants=(add_timestamps,))
+    print(f"\n{warmup_stats['start'].capitalize()} start: model loaded in {model_load_s:.1f} s, compiled in {warmup_stats['compile_s']:.1f} s")
+
+    # Started after the warmup, so the wall time and real-time factor only cover the transcription
+    progress_tracker = ProgressTracker(listeners=[on_progress_event])
+
     whisper_pipeline = NeuraLumaWhisperPipeline(
         dtype=getattr(jnp, dtype), 
         batch_size=batch_size, 
         hf_checkpoint=hf_checkpoint, 
+        whisper_model=whisper_model,
         hf_load_dataset_options=hf_load_dataset_options,
-        progress_cb=progress_cb
+        progress_cb=progress_cb,
+        decode_in_memory=decode_in_memory,
+        max_workers=max_workers,
+        download_workers=download_workers,
+        queue_size=queue_size,
+        length_bucketing=length_bucketing,
+        transcription_cache=transcription_cache,
+        vad=voice_activity_detector,
+        workspace=JobWorkspace(base_dir=scratch_dir, use_tmpfs=use_tmpfs),
+        progress_tracker=progress_tracker,
+        file_walker=MediaFileWalker(
+            extensions=AUDIO_FILE_EXTENSIONS + VIDEO_FILE_EXTENSIONS,
+            skip_hidden=not include_hidden,
+            ignored_directories=DEFAULT_IGNORED_DIRECTORIES + tuple(exclude_dirs)
+            )
         )
 
     youtube_urls = youtube.split(";")
 
+    if watch:
+        from core.watch import WatchIndex, FolderWatcher
+        folder_watcher = FolderWatcher(
+            pipeline=whisper_pipeline,
+            source_dir=source_path,
+            output_path=output_path,
+            index=WatchIndex(watch_index or os.path.join(output_path, ".neuraluma_watch.sqlite")),
+            add_timestamps=add_timestamps,
+            translate=translate,
+            interval_s=watch_interval,
+            progress_cb=progress_cb
+            )
+        progress_cb(f"Watching {source_path}", 0.0)
+        try:
+            folder_watcher.watch()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            folder_watcher.index.close()
+            # The watcher transcribes without transcribe, which would remove the workspace otherwise
+            whisper_pipeline.workspace.cleanup()
+            pbar.close()
+            print(progress_tracker.format_summary())
+            print_acceptance_rate()
+        sys.exit(0)
+
     progress_cb("Starting...", 0.0)
 
     try:
@@ -116,10 +291,17 @@ if __name__ == "__main__":
                                     hf_save_dataset_options=hf_save_dataset_options, 
                                     youtube_urls=youtube_urls, 
                                     add_timestamps=add_timestamps, 
-                                    translate=translate)
+                                    translate=translate,
+                                    resume=resume)
     except Exception as e:
         print("\n")
         logging.error(e, exc_info=True)
     finally:
         pbar.close()
+        print(progress_tracker.format_summary())
+        print_acceptance_rate()
+        if stats_json:
+            progress_tracker.export_json(stats_json)
+        if transcription_cache is not None:
+            print(transcription_cache.format_stats())
     
\ No newline at end of file
@@ -0,0 +1,83 @@
+### File for the headless HTTP API ###
+import argparse
+from core.devices import configure_devices
+import logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NeuraLumaWhisper HTTP batch API")
+    parser.add_argument('-H', '--host', help='Host to listen on', default='127.0.0.1')
+    parser.add_argument('-p', '--port', help='Port to listen on', default=8000, type=int)
+    parser.add_argument('-d', '--dtype', help='Sets the dtype to use', default='float16', choices=['float16', 'bfloat16', 'float32', 'float64'])
+    parser.add_argument('-b', '--batch_size', help='Sets the batch size for inference', default=1, type=int)
+    parser.add_argument('-hfc', '--hf_checkpoint', help='Sets the hf checkpoint to use', default='openai/whisper-large-v2')
+    parser.add_argument('-dc', '--draft_checkpoint', help='Enables speculative decoding with this small hf checkpoint as draft model, e.g. openai/whisper-tiny. The output is identical to plain greedy decoding. Only available on a single device', required=False)
+    parser.add_argument('-ndt', '--num_draft_tokens', help='Sets the number of tokens the draft model of -dc --draft_checkpoint proposes per step', default=4, type=int)
+    parser.add_argument('-w', '--max_workers', help='Sets the number of workers for decoding media files per job, 0 uses all CPUs', default=1, type=int)
+    parser.add_argument('-dw', '--download_workers', help='Sets the maximum number of concurrent YouTube downloads per job', default=4, type=int)
+    parser.add_argument('-vad', '--vad', help='Detects speech regions before inference, so only speech is transcribed and silence is skipped', action='store_true')
+    parser.add_argument('-cd', '--cache_dir', help='Directory of the transcription cache, previously transcribed audio with the same settings is not transcribed again', required=False)
+    parser.add_argument('-sdir', '--scratch_dir', help='Directory the private workspaces of the jobs are created in. Defaults to the system temp directory', required=False)
+    parser.add_argument('-alp', '--allow_local_paths', help='Allows jobs to transcribe files and directories on the server by path', action='store_true')
+    parser.add_argument('-mus', '--max_upload_size', help='Maximum size of an uploaded file in MB', default=2048, type=float)
+    parser.add_argument('-dev', '--devices', help='Number of devices the model is replicated on, batches are sharded across them. On CPU hosts the CPU is split into this many devices', type=int, required=False)
+    parser.add_argument('-ccd', '--compilation_cache_dir', help='Directory of the persistent JAX compilation cache. Defaults to ~/.cache/neuraluma_whisper/jax_compilation_cache', required=False)
+    args = parser.parse_args()
+
+    # JAX reads the device configuration on import, so the devices are configured first
+    configure_devices(args.devices)
+    import jax.numpy as jnp
+    from core.pipeline import NeuraLumaWhisperPipeline
+    from core.registry import model_registry
+    from core.model import WhisperModel, DEFAULT_COMPILATION_CACHE_DIR
+    from core.cache import TranscriptionCache
+    from core.vad import VoiceActivityDetector
+    from core.jobs import InferenceWorker
+    from core.server import TranscriptionServer
+
+    logging.basicConfig(level=logging.INFO)
+
+    WhisperModel.enable_compilation_cache(args.compilation_cache_dir or DEFAULT_COMPILATION_CACHE_DIR)
+
+    # One warm model for all requests, its calls are serialized and merged by the inference worker
+    whisper_model = model_registry.get(checkpoint=args.hf_checkpoint, dtype=getattr(jnp, args.dtype), batch_size=args.batch_size, draft_checkpoint=args.draft_checkpoint, num_draft_tokens=args.num_draft_tokens)
+    inference_worker = InferenceWorker()
+    logging.info("Compiling model")
+    inference_worker.run(whisper_model.warmup)
+
+    transcription_cache = TranscriptionCache(cache_dir=args.cache_dir) if args.cache_dir else None
+    voice_activity_detector = VoiceActivityDetector() if args.vad else None
+
+    def create_pipeline(hf_load_dataset_options, progress_cb, workspace, cancel_event):
+        return NeuraLumaWhisperPipeline(
+            dtype=getattr(jnp, args.dtype),
+            batch_size=args.batch_size,
+            hf_checkpoint=args.hf_checkpoint,
+            whisper_model=whisper_model,
+            hf_load_dataset_options=hf_load_dataset_options,
+            progress_cb=progress_cb,
+            decode_in_memory=True,
+            max_workers=args.max_workers if args.max_workers > 0 else None,
+            download_workers=args.download_workers,
+            transcription_cache=transcription_cache,
+            vad=voice_activity_detector,
+            workspace=workspace,
+            inference_worker=inference_worker,
+            cancel_event=cancel_event
+            )
+
+    server = TranscriptionServer(
+        (args.host, args.port),
+        create_pipeline=create_pipeline,
+        checkpoint=args.hf_checkpoint,
+        allow_local_paths=args.allow_local_paths,
+        max_upload_bytes=int(args.max_upload_size * 1024**2),
+        scratch_dir=args.scratch_dir
+        )
+    logging.info(f"Listening on http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
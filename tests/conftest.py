@@ -0,0 +1,44 @@
+import os
+import sys
+import pytest
+
+# The tests import the core modules like the entry points do, from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The stub model and the media fixtures are shared with the benchmarks
+import benchmarks.fixtures as benchmark_fixtures
+from benchmarks.fixtures import StubWhisperModel, write_wav
+
+# Tiny checkpoint used by the model tests, override to run them against a local copy
+TEST_CHECKPOINT = os.environ.get("NEURALUMA_TEST_CHECKPOINT", "openai/whisper-tiny")
+
+def load_whisper_model(**kwargs):
+    """
+    Loads a float32 WhisperModel of the test checkpoint, skips the test if the model stack or the checkpoint isn't available.
+    """
+    pytest.importorskip("whisper_jax")
+    import jax.numpy as jnp
+    from core.model import WhisperModel
+
+    kwargs.setdefault("checkpoint", TEST_CHECKPOINT)
+    kwargs.setdefault("dtype", jnp.float32)
+    try:
+        return WhisperModel(**kwargs)
+    except OSError as e:
+        pytest.skip(f"Checkpoint {kwargs['checkpoint']} is not available: {e}")
+
+def random_input_features(whisper_model, batch_size: int, seed: int = 0):
+    """
+    Returns random log-mel features of `batch_size` chunks for the given model.
+    """
+    import numpy as np
+
+    feature_extractor = whisper_model.pipeline.feature_extractor
+    return np.random.default_rng(seed).standard_normal((batch_size, feature_extractor.feature_size, feature_extractor.nb_max_frames)).astype(np.float32)
+
+def write_video(path: str, duration_s: float = 1.0, frequency: float = 440.0):
+    """
+    Writes a small test video with a tone as audio track, skips the test if ffmpeg is not available.
+    """
+    if not benchmark_fixtures.write_video(path, duration_s=duration_s, frequency=frequency):
+        pytest.skip("ffmpeg can't write test videos")
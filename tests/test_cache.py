@@ -0,0 +1,37 @@
+import os
+import threading
+import pytest
+
+pytest.importorskip("numpy")
+from core.cache import TranscriptionCache
+
+def get_entries_size(cache_dir):
+    return sum(entry.stat().st_size for sub_dir in os.scandir(cache_dir) for entry in os.scandir(sub_dir.path) if entry.name.endswith(".json"))
+
+def test_shared_cache_tracks_the_size_of_concurrent_jobs(tmp_path):
+    cache = TranscriptionCache(cache_dir=str(tmp_path), max_size_bytes=8 * 1024)
+
+    def run_job(job_idx):
+        for item_idx in range(50):
+            cache.put(f"{job_idx:02d}{item_idx:062d}", {"text": f"job {job_idx} item {item_idx} " * 4})
+
+    threads = [threading.Thread(target=run_job, args=(job_idx,)) for job_idx in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.get_size_bytes() == get_entries_size(str(tmp_path))
+    assert cache.get_size_bytes() <= 8 * 1024
+    assert cache.stats["evictions"] > 0
+
+def test_stats_since_a_snapshot(tmp_path):
+    cache = TranscriptionCache(cache_dir=str(tmp_path))
+    cache.put("a" * 64, {"text": "a"})
+    cache.get("a" * 64)
+
+    stats_before = dict(cache.stats)
+    cache.get("a" * 64)
+    cache.get("b" * 64)
+
+    assert cache.format_stats(since=stats_before).startswith("Transcription cache: 1 hits, 1 misses (50.0% hit rate), 0 stored")
@@ -0,0 +1,35 @@
+import pytest
+from conftest import write_wav
+
+pytest.importorskip("datasets")
+from core.dataset_writer import ShardedDatasetWriter
+
+def create_transcriptions(tmp_path, count):
+    transcriptions = []
+    for idx in range(count):
+        audio_path = str(tmp_path / f"{idx}.wav")
+        write_wav(audio_path, duration_s=0.1)
+        transcriptions.append({"idx": idx, "audio_entry": audio_path, "transcription": {"text": f"text {idx}"}})
+    return transcriptions
+
+def test_resumed_writer_skips_the_rows_of_written_shards(tmp_path):
+    from datasets import load_dataset
+
+    local_path = str(tmp_path / "dataset")
+    transcriptions = create_transcriptions(tmp_path, 5)
+
+    # Every row fills a shard, the last two rows are still buffered when the job is interrupted
+    writer = ShardedDatasetWriter(local_path, max_shard_bytes=1)
+    for transcription in transcriptions[:3]:
+        writer.add(transcription)
+    assert writer.shard_count == 3
+
+    resumed_writer = ShardedDatasetWriter(local_path, max_shard_bytes=1, resume=True)
+    assert [resumed_writer.is_written(idx) for idx in range(5)] == [True, True, True, False, False]
+    for transcription in transcriptions:
+        resumed_writer.add(transcription)
+    resumed_writer.close()
+
+    assert resumed_writer.shard_count == 5
+    dataset = load_dataset(local_path, split="train")
+    assert sorted(dataset["text"]) == [f"text {idx}" for idx in range(5)]
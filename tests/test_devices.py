@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_in_subprocess(script: str, env: dict|None = None) -> dict:
+    """
+    Runs a script in a fresh interpreter, the device configuration only applies before jax is imported.
+    """
+    process_env = {**os.environ, "JAX_PLATFORMS": "cpu", **(env or {})}
+    process_env.pop("CUDA_VISIBLE_DEVICES", None)
+    result = subprocess.run([sys.executable, "-c", script], cwd=REPOSITORY_ROOT, env=process_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_host_devices_and_batch_size_rounding():
+    pytest.importorskip("jax")
+
+    result = run_in_subprocess(
+        "import json\n"
+        "from core.devices import configure_devices, round_batch_size\n"
+        "configure_devices(4)\n"
+        "import jax\n"
+        "print(json.dumps({'devices': jax.local_device_count(), 'batch_sizes': [round_batch_size(batch_size) for batch_size in (1, 4, 5, 9)]}))\n",
+        env={"XLA_FLAGS": "--xla_force_host_platform_device_count=2"}
+        )
+
+    assert result == {"devices": 4, "batch_sizes": [4, 4, 8, 12]}
+
+def test_flags_are_replaced_and_late_configuration_is_rejected():
+    result = run_in_subprocess(
+        "import json, os, sys\n"
+        "from core.devices import configure_devices\n"
+        "configure_devices(3)\n"
+        "flags = os.environ['XLA_FLAGS']\n"
+        "sys.modules['jax'] = object()\n"
+        "try:\n"
+        "    configure_devices(2)\n"
+        "    rejected = False\n"
+        "except Exception:\n"
+        "    rejected = True\n"
+        "print(json.dumps({'flags': flags, 'cuda': os.environ['CUDA_VISIBLE_DEVICES'], 'rejected': rejected}))\n",
+        env={"XLA_FLAGS": "--xla_cpu_enable_fast_math=false --xla_force_host_platform_device_count=8"}
+        )
+
+    assert result == {"flags": "--xla_cpu_enable_fast_math=false --xla_force_host_platform_device_count=3", "cuda": "0,1,2", "rejected": True}
@@ -0,0 +1,50 @@
+import logging
+from core.discovery import MediaFileWalker
+
+def create_tree(root):
+    for relative_path in ("b.mp3", "a.WAV", "notes.txt", ".hidden.mp3", "talks/c.mp4", "talks/.cache/d.mp3", "__pycache__/e.mp3", ".git/f.mp3"):
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"")
+
+def test_walk_yields_matching_files_sorted_and_skips_hidden_and_ignored(tmp_path):
+    create_tree(tmp_path)
+
+    paths = list(MediaFileWalker(extensions=["mp3", "wav", "mp4"]).walk(str(tmp_path)))
+
+    assert [path[len(str(tmp_path)) + 1:] for path in paths] == ["a.WAV", "b.mp3", "talks/c.mp4"]
+
+def test_walk_includes_hidden_files_if_asked(tmp_path):
+    create_tree(tmp_path)
+
+    paths = list(MediaFileWalker(extensions=["mp3"], skip_hidden=False).walk(str(tmp_path)))
+
+    assert sorted(path[len(str(tmp_path)) + 1:] for path in paths) == [".git/f.mp3", ".hidden.mp3", "b.mp3", "talks/.cache/d.mp3"]
+
+def test_unreadable_directories_are_logged_by_default(tmp_path, caplog):
+    with caplog.at_level(logging.WARNING):
+        paths = list(MediaFileWalker().walk(str(tmp_path / "missing")))
+
+    assert paths == []
+    assert "Skipping directory" in caplog.text
+
+def test_walk_reports_errors_to_both_callbacks(tmp_path):
+    walker_errors = []
+    walk_errors = []
+
+    list(MediaFileWalker(on_error=lambda directory, error: walker_errors.append(directory)).walk(str(tmp_path / "missing"), on_error=lambda directory, error: walk_errors.append(directory)))
+
+    assert walker_errors == walk_errors == [str(tmp_path / "missing")]
+
+def test_symlinked_directories_are_followed_once(tmp_path):
+    (tmp_path / "archive").mkdir()
+    (tmp_path / "archive" / "a.mp3").write_bytes(b"")
+    (tmp_path / "source").mkdir()
+    (tmp_path / "source" / "linked").symlink_to(tmp_path / "archive", target_is_directory=True)
+    # A link back to the source directory forms a cycle
+    (tmp_path / "archive" / "loop").symlink_to(tmp_path / "source", target_is_directory=True)
+
+    paths = list(MediaFileWalker(extensions=["mp3"]).walk(str(tmp_path / "source")))
+    assert paths == [str(tmp_path / "source" / "linked" / "a.mp3")]
+
+    assert list(MediaFileWalker(extensions=["mp3"], follow_symlinks=False).walk(str(tmp_path / "source"))) == []
@@ -0,0 +1,161 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import re
+import threading
+import time
+import urllib.request
+import pytest
+from core.downloader import YouTubeDownloader
+
+class StandInStream:
+    """
+    A stream of a stand-in video, downloaded over HTTP and named after the title of the video like a pytube Stream.
+    """
+    def __init__(self, url: str, title: str, only_audio: bool, progressive: bool, subtype: str, abr: int = 0, resolution: int = 0):
+        self.url = url
+        self.title = title
+        self.only_audio = only_audio
+        self.progressive = progressive
+        self.subtype = subtype
+        self.abr = abr
+        self.resolution = resolution
+
+    def download(self, output_path: str, filename_prefix: str|None = None) -> str:
+        file_path = os.path.join(output_path, (filename_prefix or "") + re.sub(r"[^\w ]", "", self.title) + "." + self.subtype)
+        with urllib.request.urlopen(self.url, timeout=10) as response, open(file_path, "wb") as f:
+            f.write(response.read())
+        return file_path
+
+class StandInStreamQuery:
+    """
+    The filtering and ordering of pytube's StreamQuery used by the downloader.
+    """
+    def __init__(self, streams: list):
+        self.streams = streams
+
+    def filter(self, only_audio=None, progressive=None, file_extension=None):
+        return StandInStreamQuery([
+            stream for stream in self.streams
+            if (only_audio is None or stream.only_audio == only_audio)
+            and (progressive is None or stream.progressive == progressive)
+            and (file_extension is None or stream.subtype == file_extension)
+            ])
+
+    def order_by(self, attribute: str):
+        return StandInStreamQuery(sorted(self.streams, key=lambda stream: getattr(stream, attribute)))
+
+    def asc(self):
+        return self
+
+    def first(self):
+        return self.streams[0] if self.streams else None
+
+class StandInVideo:
+    def __init__(self, video_id: str, title: str, streams: list):
+        self.video_id = video_id
+        self.title = title
+        self.watch_url = f"https://youtube.com/watch?v={video_id}"
+        self.streams = StandInStreamQuery(streams)
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requested_paths.append(self.path)
+            server.active_requests += 1
+            server.max_active_requests = max(server.max_active_requests, server.active_requests)
+
+        # Slow enough that concurrent downloads overlap
+        time.sleep(0.2)
+        body = self.path.encode()
+        if self.path.startswith("/missing"):
+            self.send_response(404)
+            body = b""
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        with server.lock:
+            server.active_requests -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def media_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MediaRequestHandler)
+    server.lock = threading.Lock()
+    server.requested_paths = []
+    server.active_requests = 0
+    server.max_active_requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+class StandInDownloader(YouTubeDownloader):
+    """
+    A YouTubeDownloader that opens stand-in videos served by the local media server instead of YouTube.
+
+    The URL "https://youtube.com/watch?v=<id>" is a video with the title "Talk", "https://youtube.com/watch?v=video-<id>"
+    only has a progressive video stream and ids starting with "missing" fail to download.
+    """
+    def __init__(self, media_server):
+        self.base_url = f"http://{media_server.server_address[0]}:{media_server.server_address[1]}"
+
+    def open_video(self, url: str) -> StandInVideo:
+        video_id = url.split("v=")[1]
+        streams = [
+            StandInStream(f"{self.base_url}/{video_id}/360p.mp4", "Talk", only_audio=False, progressive=True, subtype="mp4", resolution=360),
+            StandInStream(f"{self.base_url}/{video_id}/720p.mp4", "Talk", only_audio=False, progressive=True, subtype="mp4", resolution=720),
+        ]
+        if not video_id.startswith("video-"):
+            streams += [
+                StandInStream(f"{self.base_url}/{video_id}/160kbps.webm", "Talk", only_audio=True, progressive=False, subtype="webm", abr=160),
+                StandInStream(f"{self.base_url}/{video_id}/48kbps.webm", "Talk", only_audio=True, progressive=False, subtype="webm", abr=48),
+            ]
+        return StandInVideo(video_id, "Talk", streams)
+
+def test_smallest_audio_stream_is_preferred(media_server, tmp_path):
+    downloader = StandInDownloader(media_server)
+
+    saved_path = downloader.download("https://youtube.com/watch?v=a1", output_path=str(tmp_path))
+    assert open(saved_path, "rb").read() == b"/a1/48kbps.webm"
+
+    saved_path = downloader.download("https://youtube.com/watch?v=a1", output_path=str(tmp_path), audio_only=False)
+    assert open(saved_path, "rb").read() == b"/a1/360p.mp4"
+
+    saved_path = downloader.download("https://youtube.com/watch?v=video-b2", output_path=str(tmp_path))
+    assert open(saved_path, "rb").read() == b"/video-b2/360p.mp4"
+
+def test_concurrent_downloads_keep_input_order_and_failures(media_server, tmp_path):
+    downloader = StandInDownloader(media_server)
+    urls = [f"https://youtube.com/watch?v={video_id}" for video_id in ("a1", "missing-b2", "c3", "d4")]
+
+    saved_paths, failed_paths = downloader.download_multiple(urls, output_path=str(tmp_path), max_workers=4)
+
+    assert [open(saved_path, "rb").read() for saved_path in saved_paths] == [b"/a1/48kbps.webm", b"/c3/48kbps.webm", b"/d4/48kbps.webm"]
+    assert failed_paths == ["https://youtube.com/watch?v=missing-b2"]
+    assert media_server.max_active_requests > 1
+
+def test_videos_with_the_same_title_dont_overwrite_each_other(media_server, tmp_path):
+    downloader = StandInDownloader(media_server)
+    urls = [f"https://youtube.com/watch?v={video_id}" for video_id in ("a1", "b2", "c3")]
+
+    saved_paths, failed_paths = downloader.download_multiple(urls, output_path=str(tmp_path), max_workers=3)
+
+    assert failed_paths == []
+    assert len(set(saved_paths)) == 3
+    assert all(os.path.basename(saved_path).startswith(video_id) for saved_path, video_id in zip(saved_paths, ("a1", "b2", "c3")))
+    assert [open(saved_path, "rb").read() for saved_path in saved_paths] == [b"/a1/48kbps.webm", b"/b2/48kbps.webm", b"/c3/48kbps.webm"]
+
+def test_sequential_downloads_dont_overlap(media_server, tmp_path):
+    downloader = StandInDownloader(media_server)
+    urls = [f"https://youtube.com/watch?v={video_id}" for video_id in ("a1", "b2")]
+
+    saved_paths, _ = downloader.download_multiple(urls, output_path=str(tmp_path), max_workers=1)
+
+    assert len(saved_paths) == 2
+    assert media_server.max_active_requests == 1
@@ -0,0 +1,11 @@
+import pytest
+from benchmarks.import_time import ENTRY_POINTS, get_missing_modules, measure, find_regressions
+
+@pytest.mark.parametrize("name, code, required_modules", ENTRY_POINTS, ids=[name for name, _, _ in ENTRY_POINTS])
+def test_entry_point_stays_free_of_heavy_imports(name, code, required_modules):
+    missing_modules = get_missing_modules(required_modules)
+    if len(missing_modules) > 0:
+        pytest.skip(f"{', '.join(missing_modules)} not installed")
+
+    # The import time depends on the host, only errors and heavy imports fail the test
+    assert find_regressions(measure(code)) == []
@@ -0,0 +1,29 @@
+from core.manifest import ProgressManifest
+
+def test_record_keeps_path_of_decoded_entries(tmp_path):
+    manifest = ProgressManifest(str(tmp_path))
+    manifest.record("/videos/talk.mp4", {"path": "/videos/talk.mp4", "array": [0.0] * 16000, "sampling_rate": 16000}, {"text": "hello"}, idx=0)
+    manifest.record("https://youtube.com/watch?v=abc", "/workspace/yt_downloads/abc.mp4", {"text": "world"}, idx=1)
+
+    records = ProgressManifest(str(tmp_path), resume=True).records
+
+    assert records["/videos/talk.mp4"]["audio_entry"] == {"path": "/videos/talk.mp4", "sampling_rate": 16000}
+    assert records["https://youtube.com/watch?v=abc"]["audio_entry"] == "/workspace/yt_downloads/abc.mp4"
+
+def test_resume_ignores_cut_off_record(tmp_path):
+    manifest = ProgressManifest(str(tmp_path))
+    manifest.record("a.wav", "a.wav", {"text": "a"}, idx=0)
+    with open(manifest.manifest_path, "a", encoding="utf-8") as f:
+        f.write('{"item_id": "b.wav", "idx"')
+
+    resumed_manifest = ProgressManifest(str(tmp_path), resume=True)
+    resumed_manifest.record("c.wav", "c.wav", {"text": "c"}, idx=1)
+
+    assert set(ProgressManifest(str(tmp_path), resume=True).records) == {"a.wav", "c.wav"}
+    assert resumed_manifest.get_next_idx() == 2
+
+def test_new_job_discards_previous_manifest(tmp_path):
+    ProgressManifest(str(tmp_path)).record("a.wav", "a.wav", {"text": "a"}, idx=0)
+
+    assert ProgressManifest(str(tmp_path)).records == {}
+    assert ProgressManifest(str(tmp_path), resume=True).records == {}
@@ -0,0 +1,68 @@
+import pytest
+from conftest import TEST_CHECKPOINT, load_whisper_model, random_input_features
+
+@pytest.fixture(scope="module")
+def whisper_model():
+    return load_whisper_model(batch_size=2)
+
+@pytest.mark.parametrize("add_timestamps", [False, True])
+def test_shared_encoder_matches_separate_forward_passes(whisper_model, add_timestamps):
+    # One row less than the batch size, so the padding of the last batch is covered as well
+    input_features = random_input_features(whisper_model, batch_size=1)
+
+    tokens_per_task = whisper_model.forward_shared_encoder(input_features, tasks=("transcribe", "translate"), add_timestamps=add_timestamps)
+
+    for task in ("transcribe", "translate"):
+        expected_tokens = whisper_model.pipeline.forward({"input_features": input_features}, batch_size=whisper_model.batch_size, task=task, return_timestamps=add_timestamps)["tokens"]
+        assert tokens_per_task[task].shape == expected_tokens.shape
+        assert (tokens_per_task[task] == expected_tokens).all(), f"{task} tokens differ"
+
+def test_lookahead_window_doesnt_change_transcriptions(whisper_model):
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    sampling_rate = whisper_model.pipeline.feature_extractor.sampling_rate
+    # Inputs of several chunks with short final chunks, so the window order differs from sorting all chunks at once
+    inputs = [{"array": 0.1 * rng.standard_normal(int(duration_s * sampling_rate)).astype(np.float32), "sampling_rate": sampling_rate} for duration_s in (70.0, 12.0, 45.0)]
+
+    transcriptions_per_window = []
+    for lookahead_batches in (1, 100):
+        whisper_model.lookahead_batches = lookahead_batches
+        transcriptions_per_window.append(whisper_model.transcribe_batch([dict(single_input) for single_input in inputs], add_timestamps=True))
+
+    assert transcriptions_per_window[0] == transcriptions_per_window[1]
+
+@pytest.mark.parametrize("add_timestamps", [False, True])
+def test_speculative_decoding_matches_greedy_decoding(whisper_model, add_timestamps):
+    import jax
+
+    if jax.local_device_count() > 1:
+        pytest.skip("Speculative decoding runs on a single device")
+
+    # The tiny checkpoint drafts for itself, the output must equal plain greedy decoding of the same checkpoint
+    speculative_model = load_whisper_model(batch_size=whisper_model.batch_size, draft_checkpoint=TEST_CHECKPOINT, num_draft_tokens=3)
+    input_features = random_input_features(whisper_model, batch_size=whisper_model.batch_size, seed=1)
+
+    tokens_per_task = speculative_model.forward_speculative(input_features, tasks=("transcribe", "translate"), add_timestamps=add_timestamps)
+
+    for task in ("transcribe", "translate"):
+        expected_tokens = whisper_model.pipeline.forward({"input_features": input_features}, batch_size=whisper_model.batch_size, task=task, return_timestamps=add_timestamps)["tokens"]
+        assert tokens_per_task[task].shape == expected_tokens.shape
+        assert (tokens_per_task[task] == expected_tokens).all(), f"{task} tokens differ"
+
+def test_speculative_decoder_shares_the_main_parameters(whisper_model):
+    import jax
+
+    if jax.local_device_count() > 1:
+        pytest.skip("Speculative decoding runs on a single device")
+
+    speculative_model = load_whisper_model(batch_size=whisper_model.batch_size, draft_checkpoint=TEST_CHECKPOINT)
+    replicated_leaves = jax.tree_util.tree_leaves(speculative_model.pipeline.params)
+    single_device_leaves = jax.tree_util.tree_leaves(speculative_model.speculative_decoder.params)
+
+    assert all(
+        single_device_leaf.unsafe_buffer_pointer() == replicated_leaf.addressable_shards[0].data.unsafe_buffer_pointer()
+        for single_device_leaf, replicated_leaf in zip(single_device_leaves, replicated_leaves)
+        )
+    draft_bytes = sum(leaf.nbytes for leaf in jax.tree_util.tree_leaves(speculative_model.speculative_decoder.draft_params))
+    assert speculative_model.memory_footprint() == whisper_model.memory_footprint() + draft_bytes
@@ -0,0 +1,67 @@
+import itertools
+import os
+import pytest
+from conftest import StubWhisperModel, write_wav, write_video
+
+pytest.importorskip("jax")
+pytest.importorskip("datasets")
+
+from core.pipeline import NeuraLumaWhisperPipeline
+from core.workspace import JobWorkspace
+
+def create_pipeline(tmp_path, whisper_model, decode_in_memory):
+    return NeuraLumaWhisperPipeline(
+        whisper_model=whisper_model,
+        decode_in_memory=decode_in_memory,
+        workspace=JobWorkspace(base_dir=str(tmp_path / "scratch"))
+        )
+
+def create_dataset_options(local_path):
+    return {
+        "target": None,
+        "private": True,
+        "audio_column": "audio",
+        "text_column": "text",
+        "text_sbv_column": "text_sbv",
+        "revision": None,
+        "split": "train",
+        "local_path": local_path,
+        "max_shard_size": 500,
+        "upload_workers": 1
+    }
+
+@pytest.mark.parametrize("file_type, decode_in_memory", [("wav", False), ("wav", True), ("mp4", False), ("mp4", True)])
+def test_resume_writes_every_item_to_the_dataset_once(tmp_path, file_type, decode_in_memory):
+    from datasets import Dataset, Audio
+
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for name in ("a", "b", "c", "d"):
+        if file_type == "wav":
+            write_wav(str(source_dir / f"{name}.wav"))
+        else:
+            write_video(str(source_dir / f"{name}.mp4"))
+    output_path = str(tmp_path / "output")
+    dataset_path = str(tmp_path / "dataset")
+
+    # The interrupted run finished two items, but never flushed a shard
+    interrupted_pipeline = create_pipeline(tmp_path, StubWhisperModel(), decode_in_memory)
+    finished = list(itertools.islice(interrupted_pipeline.iter_transcriptions(source_path=str(source_dir), output_path=output_path), 2))
+    interrupted_pipeline.workspace.cleanup()
+    assert len(finished) == 2
+
+    resumed_model = StubWhisperModel()
+    create_pipeline(tmp_path, resumed_model, decode_in_memory).transcribe(
+        source_path=str(source_dir),
+        output_path=output_path,
+        hf_save_dataset_options=create_dataset_options(dataset_path),
+        resume=True
+        )
+
+    assert sum(len(call) for call in resumed_model.calls) == 2
+    shard_paths = sorted(os.path.join(dataset_path, "data", file_name) for file_name in os.listdir(os.path.join(dataset_path, "data")))
+    dataset = Dataset.from_parquet(shard_paths)
+    assert len(dataset) == 4
+    assert all(row["audio"]["bytes"] for row in dataset.cast_column("audio", Audio(decode=False)))
+    # Resumed items keep their output names
+    assert len([file_name for file_name in os.listdir(output_path) if file_name.endswith(".transcription.txt")]) == 4
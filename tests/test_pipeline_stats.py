@@ -0,0 +1,57 @@
+import pytest
+from conftest import StubWhisperModel, write_wav
+
+pytest.importorskip("jax")
+import numpy as np
+from core.cache import TranscriptionCache
+from core.jobs import InferenceWorker
+from core.pipeline import NeuraLumaWhisperPipeline
+from core.workspace import JobWorkspace
+
+def waveform(duration_s, frequency):
+    return {"array": (0.1 * np.sin(2 * np.pi * frequency * np.arange(int(duration_s * 16000)) / 16000)).astype(np.float32), "sampling_rate": 16000}
+
+def test_cache_hits_dont_count_as_model_audio(tmp_path):
+    whisper_model = StubWhisperModel()
+    pipeline = NeuraLumaWhisperPipeline(
+        whisper_model=whisper_model,
+        transcription_cache=TranscriptionCache(cache_dir=str(tmp_path / "cache")),
+        workspace=JobWorkspace(base_dir=str(tmp_path / "scratch"))
+        )
+
+    first, second, third = waveform(1.0, 220.0), waveform(2.0, 440.0), waveform(4.0, 880.0)
+    pipeline.run_model_batch([first, second])
+    pipeline.run_model_batch([first, third])
+    stages = pipeline.progress_tracker.get_summary()["stages"]
+
+    assert stages["model"]["items"] == 3
+    assert stages["model"]["audio_s"] == pytest.approx(7.0)
+    assert stages["cache"]["items"] == 1
+    assert sum(len(call) for call in whisper_model.calls) == 3
+
+class PaddingWhisperModel(StubWhisperModel):
+    """
+    A StubWhisperModel that pads every input to a 30 s window like the batched inference, every input counts as 3 s of audio.
+    """
+    def transcribe_batch(self, inputs: list, add_timestamps=True, task="transcribe") -> list[dict]:
+        self.padding_stats["audio_samples"] += 3 * 16000 * len(inputs)
+        self.padding_stats["padded_samples"] += 30 * 16000 * len(inputs)
+        return super().transcribe_batch(inputs, add_timestamps=add_timestamps, task=task)
+
+@pytest.mark.parametrize("inference_worker", [None, InferenceWorker(batch_wait_s=0.0)])
+def test_padding_ratio_is_only_reported_for_an_exclusive_model(tmp_path, inference_worker):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    write_wav(str(source_dir / "a.wav"))
+    messages = []
+    pipeline = NeuraLumaWhisperPipeline(
+        whisper_model=PaddingWhisperModel(),
+        inference_worker=inference_worker,
+        progress_cb=lambda message, amount: messages.append(message),
+        workspace=JobWorkspace(base_dir=str(tmp_path / "scratch"))
+        )
+
+    pipeline.transcribe(str(source_dir))
+
+    padding_messages = [message for message in messages if message.startswith("Padding ratio")]
+    assert padding_messages == (["Padding ratio of batched inference: 90.0%"] if inference_worker is None else [])
@@ -0,0 +1,58 @@
+import os
+import pytest
+from conftest import StubWhisperModel, write_wav
+
+pytest.importorskip("jax")
+from core.pipeline import NeuraLumaWhisperPipeline
+from core.workspace import JobWorkspace
+
+def create_source_dir(tmp_path):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for name in ("a", "b", "c"):
+        write_wav(str(source_dir / f"{name}.wav"))
+    return str(source_dir)
+
+def test_default_workspace_is_removed_after_an_early_stop(tmp_path):
+    pipeline = NeuraLumaWhisperPipeline(whisper_model=StubWhisperModel())
+    workspace_path = pipeline.workspace.get_path()
+
+    transcriptions = pipeline.iter_transcriptions(source_path=create_source_dir(tmp_path))
+    next(transcriptions)
+    assert os.path.isdir(workspace_path)
+    transcriptions.close()
+
+    assert not os.path.exists(workspace_path)
+
+def test_default_workspace_is_removed_after_a_failure(tmp_path):
+    pipeline = NeuraLumaWhisperPipeline(whisper_model=StubWhisperModel(failing_names=("a.wav",)))
+    workspace_path = pipeline.workspace.get_path()
+
+    with pytest.raises(Exception):
+        list(pipeline.iter_transcriptions(source_path=create_source_dir(tmp_path)))
+
+    assert not os.path.exists(workspace_path)
+
+def test_passed_workspace_is_left_to_its_owner(tmp_path):
+    workspace = JobWorkspace(base_dir=str(tmp_path / "scratch"))
+    pipeline = NeuraLumaWhisperPipeline(whisper_model=StubWhisperModel(), workspace=workspace)
+    workspace_path = workspace.get_path()
+
+    assert len(list(pipeline.iter_transcriptions(source_path=create_source_dir(tmp_path)))) == 3
+    assert os.path.isdir(workspace_path)
+    workspace.cleanup()
+
+def test_only_audio_in_the_workspace_is_removed(tmp_path):
+    workspace = JobWorkspace(base_dir=str(tmp_path / "scratch"))
+    pipeline = NeuraLumaWhisperPipeline(whisper_model=StubWhisperModel(), workspace=workspace)
+    converted_path = os.path.join(workspace.get_path("audios"), "talk.mp3")
+    source_path = str(tmp_path / "talk.mp3")
+    for path in (converted_path, source_path):
+        open(path, "wb").close()
+
+    pipeline.remove_workspace_audio(converted_path)
+    pipeline.remove_workspace_audio(source_path)
+    pipeline.remove_workspace_audio({"path": source_path})
+
+    assert not os.path.exists(converted_path)
+    assert os.path.exists(source_path)
@@ -0,0 +1,74 @@
+import threading
+import time
+import pytest
+
+pytest.importorskip("whisper_jax")
+import core.registry
+from core.registry import ModelRegistry
+
+class StubLoadedModel:
+    """
+    Stands in for a loaded WhisperModel of a fixed size, loading takes `load_s` seconds.
+    """
+    load_s = 0.0
+    loads = []
+    registry = None
+    # Number of cached models at the start of every load
+    cached_at_load = []
+
+    def __init__(self, dtype, batch_size, checkpoint, draft_checkpoint=None, num_draft_tokens=4):
+        self.checkpoint = checkpoint
+        StubLoadedModel.loads.append(checkpoint)
+        StubLoadedModel.cached_at_load.append(len(StubLoadedModel.registry))
+        time.sleep(StubLoadedModel.load_s)
+
+    @staticmethod
+    def estimate_memory_footprint(checkpoint, dtype=None, draft_checkpoint=None):
+        return 100
+
+    def memory_footprint(self):
+        return 100
+
+@pytest.fixture
+def registry(monkeypatch):
+    StubLoadedModel.load_s = 0.0
+    StubLoadedModel.loads = []
+    StubLoadedModel.cached_at_load = []
+    monkeypatch.setattr(core.registry, "WhisperModel", StubLoadedModel)
+    StubLoadedModel.registry = ModelRegistry()
+    return StubLoadedModel.registry
+
+def test_concurrent_requests_load_a_checkpoint_once(registry):
+    StubLoadedModel.load_s = 0.2
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(registry.get(checkpoint="a"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert StubLoadedModel.loads == ["a"]
+    assert all(model is models[0] for model in models)
+
+def test_cached_models_are_returned_while_another_one_loads(registry):
+    cached_model = registry.get(checkpoint="a")
+    StubLoadedModel.load_s = 1.0
+    threading.Thread(target=registry.get, kwargs={"checkpoint": "b"}, daemon=True).start()
+    time.sleep(0.1)
+
+    start_time = time.perf_counter()
+    assert registry.get(checkpoint="a") is cached_model
+    assert time.perf_counter() - start_time < 0.5
+
+def test_models_are_evicted_before_loading(registry):
+    registry.set_max_memory_bytes(250)
+    registry.get(checkpoint="a")
+    registry.get(checkpoint="b")
+    registry.get(checkpoint="a")
+
+    # a and b don't leave room for c, the least recently used b makes room before c is loaded
+    registry.get(checkpoint="c")
+    assert StubLoadedModel.cached_at_load[-1] == 1
+    assert len(registry) == 2
+    assert registry.make_key("b", "float16", 1) not in registry
+    assert registry.make_key("a", "float16", 1) in registry
@@ -0,0 +1,130 @@
+import http.client
+import json
+import threading
+import pytest
+from conftest import StubWhisperModel
+from core.jobs import InferenceWorker
+from core.server import TranscriptionServer
+
+class BlockingWhisperModel(StubWhisperModel):
+    """
+    A StubWhisperModel that holds inputs named "slow" until `release` is set, like a long inference call.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.release = threading.Event()
+
+    def transcribe_batch(self, inputs: list, add_timestamps=True, task="transcribe") -> list[dict]:
+        if any(str(single_input).endswith("/slow") for single_input in inputs):
+            self.release.wait(10)
+        return super().transcribe_batch(inputs, add_timestamps=add_timestamps, task=task)
+
+class StubPipeline:
+    """
+    The parts of NeuraLumaWhisperPipeline used by the server, every source is transcribed in its own model call.
+    """
+    def __init__(self, whisper_model, inference_worker, workspace, cancel_event):
+        self.whisper_model = whisper_model
+        self.inference_worker = inference_worker
+        self.workspace = workspace
+        self.cancel_event = cancel_event
+
+    def iter_transcriptions(self, source_path=None, youtube_urls=[], add_timestamps=False, translate=False, keep_audio=True):
+        task = "translate" if translate else "transcribe"
+        for idx, single_input in enumerate([source_path] if source_path else youtube_urls):
+            transcription = self.inference_worker.transcribe_batch(self.whisper_model, [single_input], add_timestamps=add_timestamps, task=task, cancel_event=self.cancel_event)[0]
+            yield {"idx": idx, "audio_entry": single_input, "transcription": transcription}
+
+@pytest.fixture
+def server(tmp_path):
+    whisper_model = BlockingWhisperModel(failing_names=("broken",))
+    inference_worker = InferenceWorker(batch_wait_s=0.0)
+    cancel_events = []
+
+    def create_pipeline(hf_load_dataset_options, progress_cb, workspace, cancel_event):
+        cancel_events.append(cancel_event)
+        return StubPipeline(whisper_model, inference_worker, workspace, cancel_event)
+
+    transcription_server = TranscriptionServer(("127.0.0.1", 0), create_pipeline=create_pipeline, checkpoint="stub", scratch_dir=str(tmp_path))
+    transcription_server.whisper_model = whisper_model
+    transcription_server.cancel_events = cancel_events
+    server_thread = threading.Thread(target=transcription_server.serve_forever, daemon=True)
+    server_thread.start()
+    yield transcription_server
+
+    whisper_model.release.set()
+    transcription_server.shutdown()
+    transcription_server.server_close()
+
+def request(server, method, path, body=None, headers={}):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.request(method, path, body=body, headers=headers)
+    return connection, connection.getresponse()
+
+def post_json(server, body):
+    return request(server, "POST", "/transcribe", body=json.dumps(body), headers={"Content-Type": "application/json"})
+
+def read_lines(response):
+    return [json.loads(line) for line in response.read().decode("utf-8").splitlines()]
+
+def test_items_are_streamed_as_ndjson(server):
+    connection, response = post_json(server, {"youtube_urls": ["https://example.com/first", "https://example.com/second"], "add_timestamps": True})
+
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "application/x-ndjson"
+    lines = read_lines(response)
+    connection.close()
+
+    assert [line["text"] for line in lines[:2]] == ["transcribe: first", "transcribe: second"]
+    assert lines[0]["idx"] == 0 and lines[0]["audio_entry"] == "https://example.com/first"
+    assert lines[0]["chunks"] == [{"timestamp": [0.0, 1.0], "text": "transcribe: first"}]
+    assert lines[-1] == {"done": True, "items": 2}
+
+def test_uploads_are_reported_by_file_name(server):
+    connection, response = request(server, "POST", "/transcribe?filename=talk.wav&translate=1", body=b"RIFF")
+    lines = read_lines(response)
+    connection.close()
+
+    assert lines[0]["audio_entry"] == "talk.wav"
+    assert lines[0]["text"] == "translate: talk.wav"
+    assert lines[-1] == {"done": True, "items": 1}
+
+def test_invalid_requests_are_rejected(server):
+    connection, response = post_json(server, {"youtube_urls": "https://example.com/first"})
+    assert response.status == 400
+    assert "youtube_urls" in json.loads(response.read())["error"]
+    connection.close()
+
+    connection, response = post_json(server, {"source_path": "/etc"})
+    assert response.status == 400
+    connection.close()
+
+    connection, response = request(server, "GET", "/unknown")
+    assert response.status == 404
+    connection.close()
+
+    connection, response = request(server, "GET", "/health")
+    assert json.loads(response.read()) == {"status": "ok", "checkpoint": "stub"}
+    connection.close()
+
+def test_errors_end_the_stream_with_the_message(server):
+    connection, response = post_json(server, {"youtube_urls": ["https://example.com/first", "https://example.com/broken", "https://example.com/never"]})
+    lines = read_lines(response)
+    connection.close()
+
+    assert lines[0]["text"] == "transcribe: first"
+    assert lines[-1] == {"done": True, "items": 1, "error": "Stub model failed on broken"}
+
+def test_disconnect_cancels_the_running_item(server):
+    connection, response = post_json(server, {"youtube_urls": ["https://example.com/first", "https://example.com/slow", "https://example.com/never"]})
+    assert json.loads(response.readline())["text"] == "transcribe: first"
+
+    # The client leaves while the next item is still in the model
+    response.close()
+    connection.close()
+
+    assert server.cancel_events[0].wait(5)
+    assert not server.whisper_model.release.is_set()
+
+    server.whisper_model.release.set()
+    assert all(not str(call[0]).endswith("/never") for call in server.whisper_model.calls)
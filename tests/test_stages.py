@@ -0,0 +1,47 @@
+import pytest
+from core.stages import StagedPipeline
+
+def test_items_pass_all_stages():
+    staged_pipeline = StagedPipeline([("double", lambda value: value * 2, 2), ("increment", lambda value: value + 1, 1)], queue_size=2)
+
+    results = sorted(staged_pipeline.run(range(20)), key=lambda result: result.idx)
+
+    assert [result.value for result in results] == [value * 2 + 1 for value in range(20)]
+    assert all(result.error is None for result in results)
+
+def test_stage_errors_are_stored_per_item():
+    def fail_on_three(value):
+        if value == 3:
+            raise ValueError("three")
+        return value
+
+    staged_pipeline = StagedPipeline([("check", fail_on_three, 2), ("increment", lambda value: value + 1, 1)])
+
+    results = {result.idx: result for result in staged_pipeline.run(range(5))}
+
+    assert isinstance(results[3].error, ValueError)
+    assert results[3].failed_stage == "check"
+    assert [results[idx].value for idx in (0, 1, 2, 4)] == [1, 2, 3, 5]
+
+def test_input_errors_are_raised_after_the_items_before_them():
+    def iter_items():
+        yield from range(3)
+        raise OSError("share unavailable")
+
+    staged_pipeline = StagedPipeline([("identity", lambda value: value, 2)])
+    yielded_values = []
+
+    with pytest.raises(OSError, match="share unavailable"):
+        for result in staged_pipeline.run(iter_items()):
+            yielded_values.append(result.value)
+
+    assert sorted(yielded_values) == [0, 1, 2]
+
+def test_consumer_can_stop_early():
+    staged_pipeline = StagedPipeline([("identity", lambda value: value, 1)], queue_size=1)
+
+    results = staged_pipeline.run(iter(range(1000)))
+    first_result = next(results)
+    results.close()
+
+    assert first_result.value == 0
@@ -0,0 +1,61 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from core.vad import VoiceActivityDetector
+
+SAMPLING_RATE = 16000
+
+def tone(duration_s: float, level_db: float, frequency: float = 220.0):
+    """
+    Returns a sine tone whose RMS loudness is `level_db` dBFS.
+    """
+    amplitude = np.sqrt(2.0) * 10 ** (level_db / 20.0)
+    time_s = np.arange(int(duration_s * SAMPLING_RATE)) / SAMPLING_RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * time_s)).astype(np.float32)
+
+def test_constant_loudness_is_detected_as_speech():
+    # Continuous speech has no quiet frames, its noise floor is the speech level
+    audio_array = tone(10.0, -20.0)
+
+    regions = VoiceActivityDetector().detect(audio_array, SAMPLING_RATE)
+
+    assert regions == [(0, len(audio_array))]
+
+def test_speech_slightly_above_a_quiet_floor_falls_back_to_the_whole_input():
+    # The floor is just below the absolute threshold, so floor + margin is above the speech level
+    audio_array = np.concatenate([tone(2.0, -48.0), tone(8.0, -40.0)])
+
+    regions = VoiceActivityDetector(threshold_db=-45.0, noise_margin_db=10.0).detect(audio_array, SAMPLING_RATE)
+
+    assert regions == [(0, len(audio_array))]
+
+def test_silence_is_skipped():
+    audio_array = np.zeros(10 * SAMPLING_RATE, dtype=np.float32)
+
+    assert VoiceActivityDetector().detect(audio_array, SAMPLING_RATE) == []
+
+def test_speech_between_silence_is_split_into_regions():
+    silence = np.zeros(3 * SAMPLING_RATE, dtype=np.float32)
+    audio_array = np.concatenate([silence, tone(2.0, -20.0), silence, tone(2.0, -20.0), silence])
+    vad = VoiceActivityDetector(padding_s=0.2)
+
+    regions = vad.detect(audio_array, SAMPLING_RATE)
+
+    assert len(regions) == 2
+    for (start, end), expected_start_s in zip(regions, (3.0, 8.0)):
+        assert abs(start / SAMPLING_RATE - (expected_start_s - vad.padding_s)) < 0.05
+        assert abs(end / SAMPLING_RATE - (expected_start_s + 2.0 + vad.padding_s)) < 0.05
+
+def test_prepare_keeps_the_input_with_its_regions_and_duration():
+    silence = np.zeros(3 * SAMPLING_RATE, dtype=np.float32)
+    audio_input = {"array": np.concatenate([silence, tone(2.0, -20.0), silence]), "sampling_rate": SAMPLING_RATE}
+    vad = VoiceActivityDetector()
+
+    speech_regions = vad.prepare(audio_input)
+
+    assert speech_regions.audio_input is audio_input
+    assert speech_regions.duration_s == 8.0
+    assert [region_s for _, region_s in speech_regions.regions] == [region_s for _, region_s in vad.split(audio_input)]
+    # Already prepared inputs are passed through, e.g. when the model stage gets them from a decode worker
+    assert vad.prepare(speech_regions) is speech_regions
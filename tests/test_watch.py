@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+import pytest
+from conftest import StubWhisperModel
+from core.discovery import MediaFileWalker
+from core.watch import WatchIndex, FolderWatcher
+
+class StubPipeline:
+    """
+    The parts of NeuraLumaWhisperPipeline used by the FolderWatcher, with a StubWhisperModel.
+    """
+    def __init__(self):
+        self.whisper_model = StubWhisperModel()
+        self.vad = None
+        self.file_walker = MediaFileWalker(extensions=["wav"])
+        self.removed_audio_entries = []
+
+    @staticmethod
+    def get_task(translate):
+        return "translate" if translate else "transcribe"
+
+    def iter_transcribe_files(self, file_paths, add_timestamps=False, translate=False):
+        transcriptions = self.whisper_model.transcribe_batch(file_paths, add_timestamps=add_timestamps, task=self.get_task(translate))
+        for file_idx, (file_path, transcription) in enumerate(zip(file_paths, transcriptions)):
+            yield file_idx, {"idx": file_idx, "audio_entry": file_path, "transcription": transcription}
+
+    def remove_workspace_audio(self, audio_entry):
+        self.removed_audio_entries.append(audio_entry)
+
+    def write_transcription_to_file(self, transcription, base_ouput_filename, output_path, translate=False, add_timestamps=False):
+        os.makedirs(output_path, exist_ok=True)
+        with open(os.path.join(output_path, base_ouput_filename + (".translation" if translate else ".transcription") + ".txt"), "w") as f:
+            f.write(transcription["transcription"]["text"])
+
+@pytest.fixture
+def watcher(tmp_path):
+    source_dir = tmp_path / "source"
+    (source_dir / "talks").mkdir(parents=True)
+    for name in ("a.wav", "talks/b.wav"):
+        (source_dir / name).write_bytes(name.encode())
+
+    folder_watcher = FolderWatcher(StubPipeline(), str(source_dir), str(tmp_path / "output"), WatchIndex(str(tmp_path / "index.sqlite")), settle_s=0.0)
+    yield folder_watcher
+    folder_watcher.index.close()
+
+def count_model_inputs(folder_watcher):
+    return sum(len(call) for call in folder_watcher.pipeline.whisper_model.calls)
+
+def test_unchanged_files_are_not_transcribed_again(watcher):
+    assert watcher.run_once()["transcribed"] == 2
+    stats = watcher.run_once()
+
+    assert stats["scanned"] == 2
+    assert stats["changed"] == 0
+    assert count_model_inputs(watcher) == 2
+    assert os.path.exists(os.path.join(watcher.output_path, "talks", "b.wav.transcription.txt"))
+
+def test_unreadable_source_keeps_the_index(watcher):
+    watcher.run_once()
+
+    # A share that is unavailable can't be listed at all
+    unavailable_dir = watcher.source_dir + "_unavailable"
+    os.rename(watcher.source_dir, unavailable_dir)
+    stats = watcher.run_once()
+    assert stats["walk_errors"] == 1
+    assert stats["missing"] == 0
+    assert watcher.index.get(os.path.join(watcher.source_dir, "a.wav"))["missing_since"] is None
+
+    os.rename(unavailable_dir, watcher.source_dir)
+    stats = watcher.run_once()
+    assert stats["changed"] == 0
+    assert count_model_inputs(watcher) == 2
+
+def test_deleted_file_is_marked_missing_and_its_transcription_reused(watcher):
+    watcher.run_once()
+
+    moved_path = os.path.join(watcher.source_dir, "moved.wav")
+    shutil.move(os.path.join(watcher.source_dir, "a.wav"), moved_path)
+    stats = watcher.run_once()
+
+    assert stats["missing"] == 1
+    assert stats["reused"] == 1
+    assert count_model_inputs(watcher) == 2
+    assert watcher.index.get(os.path.join(watcher.source_dir, "a.wav"))["missing_since"] is not None
+    assert json.loads(watcher.index.get(moved_path)["transcription"])["text"] == "transcribe: a.wav"
+
+def test_missing_records_are_removed_after_the_retention_time(watcher):
+    watcher.run_once()
+    os.remove(os.path.join(watcher.source_dir, "a.wav"))
+    watcher.run_once()
+
+    watcher.missing_retention_s = 0.0
+    assert watcher.run_once()["removed"] == 1
+    assert watcher.index.get(os.path.join(watcher.source_dir, "a.wav")) is None
+
+def test_converted_audio_is_released_once_indexed(watcher):
+    watcher.run_once()
+
+    assert sorted(os.path.relpath(audio_entry, watcher.source_dir) for audio_entry in watcher.pipeline.removed_audio_entries) == ["a.wav", os.path.join("talks", "b.wav")]